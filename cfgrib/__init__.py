@@ -17,14 +17,39 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 __version__ = '0.9.6.1.dev0'
 
+import importlib
+import sys
+
 # cfgrib core API depends on the ECMWF ecCodes C-library only
 from .cfmessage import CfMessage
 from .dataset import Dataset, DatasetBuildError, open_file
 from .messages import Message, FileStream
 
+
 # NOTE: xarray is not a hard dependency, but let's provide helpers if it is available.
-try:
-    from .xarray_store import open_dataset
-    from .xarray_to_grib import to_grib
-except ImportError:
-    pass
+#   On Python 3.7+ xarray is slow to import and the helpers are imported on first access, so
+#   ``hasattr(cfgrib, 'open_dataset')`` is still False when xarray is not available.
+if sys.version_info >= (3, 7):
+    XARRAY_HELPERS = {
+        'open_dataset': 'xarray_store',
+        'to_grib': 'xarray_to_grib',
+        'xarray_store': 'xarray_store',
+        'xarray_to_grib': 'xarray_to_grib',
+    }
+
+    def __getattr__(name):
+        if name not in XARRAY_HELPERS:
+            raise AttributeError("module %r has no attribute %r" % (__name__, name))
+        try:
+            module = importlib.import_module('.' + XARRAY_HELPERS[name], __name__)
+        except ImportError:
+            raise AttributeError("module %r has no attribute %r, xarray is not available" % (
+                __name__, name,
+            ))
+        return module if name == XARRAY_HELPERS[name] else getattr(module, name)
+else:
+    try:
+        from .xarray_store import open_dataset
+        from .xarray_to_grib import to_grib
+    except ImportError:
+        pass
@@ -34,9 +34,55 @@ def selfcheck():
     from . import bindings
 
     print("Found: ecCodes v%s." % bindings.codes_get_api_version())
+    if bindings.BINDINGS_MODE == 'api':
+        print("Using the compiled ecCodes bindings.")
     print("Your system is ready.")
 
 
+@cfgrib_cli.command('clean_index_cache')
+@click.option('--cache-dir', '-d', default=None)
+@click.option('--max-size', '-s', default=0, type=int)
+def clean_index_cache(cache_dir, max_size):
+    from . import messages
+
+    if cache_dir:
+        cache = messages.IndexCache(cache_dir)
+    else:
+        cache = messages.IndexCache.from_env()
+    if cache is None:
+        raise click.UsageError("set --cache-dir or %s" % messages.INDEX_CACHE_DIR_ENV)
+    size = cache.evict(max_size=max_size)
+    print("Index cache %r size is now %d bytes." % (cache.root, size))
+
+
+@cfgrib_cli.command('to_references')
+@click.argument('inpath')
+@click.option('--outpath', '-o', default=None)
+def to_references(inpath, outpath):
+    from . import dataset
+    from . import references
+
+    if not outpath:
+        outpath = os.path.splitext(inpath)[0] + '.json'
+
+    references.write_references(dataset.open_file(inpath), outpath)
+
+
+@cfgrib_cli.command('copy')
+@click.argument('inpath')
+@click.argument('outpath')
+@click.option('--where', '-w', default='')
+def copy(inpath, outpath, where):
+    from . import grib_copy
+
+    filter_by_keys = grib_copy.parse_filter_by_keys(where)
+    counts = grib_copy.copy_file(inpath, outpath, filter_by_keys=filter_by_keys)
+    for path, count in counts.items():
+        print("Copied %d messages to %r." % (count, path))
+    if not counts:
+        print("No message matching %r." % where)
+
+
 @cfgrib_cli.command('to_netcdf')
 @click.argument('inpaths', nargs=-1)
 @click.option('--outpath', '-o', default=None)
@@ -0,0 +1,180 @@
+#
+# Copyright 2017-2019 European Centre for Medium-Range Weather Forecasts (ECMWF).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Authors:
+#   Alessandro Amici - B-Open - https://bopen.eu
+#
+"""
+Awaitable counterparts of the blocking API for ``asyncio`` applications, Python 3 only.
+
+File scans and ecCodes decoding run on an ``Executor`` with a limited number of worker threads,
+so the event loop is never blocked. Calls waiting for a free worker are queued and can be
+cancelled, calls already running are completed in the background and their result dropped.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import typing as T  # noqa
+import weakref
+
+import attr
+
+from . import bindings
+from . import dataset
+from . import messages
+
+# NOTE: ecCodes is not guaranteed to be thread-safe, more workers are only used with
+#   an ecCodes library built with thread support, see ``bindings.codes_is_thread_safe``
+DEFAULT_MAX_WORKERS = 1
+THREAD_SAFE_MAX_WORKERS = 8
+
+
+def default_max_workers():
+    # type: () -> int
+    if bindings.codes_is_thread_safe():
+        return THREAD_SAFE_MAX_WORKERS
+    return DEFAULT_MAX_WORKERS
+
+
+@attr.attrs()
+class Executor(object):
+    """
+    Run blocking functions on at most ``max_workers`` threads, queueing further calls.
+    By default one thread is used, or ``THREAD_SAFE_MAX_WORKERS`` if ecCodes is thread-safe.
+    """
+    max_workers = attr.attrib(default=None, type=T.Optional[int])
+    _executor = attr.attrib(default=None, init=False, repr=False)
+    # NOTE: one semaphore per event loop, as asyncio primitives can't be shared between loops
+    _semaphores = attr.attrib(
+        default=attr.Factory(weakref.WeakKeyDictionary), init=False, repr=False,
+    )
+
+    @property
+    def workers(self):
+        # type: () -> int
+        return self.max_workers or default_max_workers()
+
+    @property
+    def executor(self):
+        # type: () -> concurrent.futures.ThreadPoolExecutor
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+        return self._executor
+
+    def semaphore(self, loop):
+        # type: (asyncio.AbstractEventLoop) -> asyncio.Semaphore
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.workers)
+        return self._semaphores[loop]
+
+    def run_bounded(self, loop, func):
+        # type: (asyncio.AbstractEventLoop, T.Callable[[], T.Any]) -> asyncio.Future
+        # NOTE: calls are handed to the thread pool only when a worker is free, so that the
+        #   waiting calls are queued on the event loop, where they apply backpressure and can
+        #   be cancelled, instead of in the unbounded queue of the thread pool.
+        #   Callbacks are used instead of a coroutine, as ``async def`` and ``yield from`` are
+        #   not valid syntax on Python 2 where the module is still byte-compiled on install
+        semaphore = self.semaphore(loop)
+        future = loop.create_future()
+        acquiring = asyncio.ensure_future(semaphore.acquire(), loop=loop)
+
+        def done(running):
+            semaphore.release()
+            if future.cancelled():
+                return
+            elif running.cancelled():
+                future.cancel()
+            elif running.exception() is not None:
+                future.set_exception(running.exception())
+            else:
+                future.set_result(running.result())
+
+        def start(acquiring):
+            if acquiring.cancelled():
+                return
+            elif future.cancelled():
+                semaphore.release()
+                return
+            loop.run_in_executor(self.executor, func).add_done_callback(done)
+
+        def cancel(future):
+            if future.cancelled():
+                acquiring.cancel()
+
+        acquiring.add_done_callback(start)
+        future.add_done_callback(cancel)
+        return future
+
+    def run(self, func, *args, **kwargs):
+        # type: (T.Callable[..., T.Any], T.Any, T.Any) -> asyncio.Future
+        """Return a future with the result of ``func(*args, **kwargs)`` run on a worker."""
+        loop = asyncio.get_event_loop()
+        return self.run_bounded(loop, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        # type: (bool) -> None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+DEFAULT_EXECUTOR = Executor()
+
+
+def open_file_async(path, executor=DEFAULT_EXECUTOR, **kwargs):
+    # type: (str, Executor, T.Any) -> asyncio.Future
+    """Awaitable version of ``cfgrib.open_file``."""
+    return executor.run(dataset.open_file, path, **kwargs)
+
+
+def getitem_async(data, item, executor=DEFAULT_EXECUTOR):
+    # type: (T.Any, T.Any, Executor) -> asyncio.Future
+    """Awaitable ``data[item]``, e.g. to read and decode the fields of a ``OnDiskArray``."""
+    return executor.run(data.__getitem__, item)
+
+
+@attr.attrs()
+class AsyncMessageIterator(object):
+    """
+    Asynchronous iterator over the Messages of a ``FileStream``, one message is read and
+    decoded on a worker each time the next one is requested.
+    """
+    iterator = attr.attrib(type=T.Iterator[messages.Message])
+    executor = attr.attrib(default=DEFAULT_EXECUTOR, type=Executor)
+    _lock = attr.attrib(default=attr.Factory(threading.Lock), init=False, repr=False)
+
+    def next_message(self):
+        # type: () -> messages.Message
+        # NOTE: generators can't run in two threads at once
+        with self._lock:
+            try:
+                return next(self.iterator)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        # type: () -> asyncio.Future
+        return self.executor.run(self.next_message)
+
+
+def iter_messages_async(filestream, executor=DEFAULT_EXECUTOR):
+    # type: (T.Iterable[messages.Message], Executor) -> AsyncMessageIterator
+    """Return an asynchronous iterator over the Messages in ``filestream``."""
+    return AsyncMessageIterator(iter(filestream), executor=executor)
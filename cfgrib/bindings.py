@@ -22,8 +22,12 @@ from builtins import bytes, float, int, isinstance
 from future.utils import raise_from
 
 import functools
+import io
 import logging
+import os
 import pkgutil
+import re
+import threading
 import typing as T  # noqa
 
 import cffi
@@ -31,11 +35,12 @@ import cffi
 LOG = logging.getLogger(__name__)
 
 
-ffi = cffi.FFI()
-ffi.cdef(
-    pkgutil.get_data(__name__, 'grib_api.h').decode('utf-8') +
-    pkgutil.get_data(__name__, 'eccodes.h').decode('utf-8')
-)
+# set to 0 to use the ABI mode even if the compiled extension is available
+USE_EXTENSION_ENV = 'CFGRIB_USE_EXTENSION'
+# set to 1 or 0 to tell whether ecCodes is built with thread support, i.e. with
+#   ENABLE_ECCODES_THREADS or ENABLE_ECCODES_OMP_THREADS
+THREAD_SAFE_ENV = 'CFGRIB_ECCODES_THREAD_SAFE'
+ECCODES_DIR_ENV = 'ECCODES_DIR'
 
 
 class RaiseOnAttributeAccess(object):
@@ -47,15 +52,122 @@ class RaiseOnAttributeAccess(object):
         raise_from(RuntimeError(self.message), self.exc)
 
 
-for libname in ['eccodes', 'libeccodes.so', 'libeccodes']:
+def load_extension(environ=os.environ):
+    # type: (T.Mapping[str, str]) -> T.Tuple[cffi.FFI, T.Any]
+    """Return the ``ffi`` and ``lib`` of the compiled API-mode extension, see bindings_build."""
+    if environ.get(USE_EXTENSION_ENV, '1') == '0':
+        raise ImportError("%s is set to 0" % USE_EXTENSION_ENV)
+    from . import _bindings  # type: ignore
+    return _bindings.ffi, _bindings.lib
+
+
+def load_abi():
+    # type: () -> T.Tuple[cffi.FFI, T.Any]
+    """
+    Return the ``ffi`` and ``lib`` of the ABI mode. The C declarations are read from the
+    ``_bindings_abi`` module generated by bindings_build, if available, or parsed at runtime.
+    """
+    try:
+        from ._bindings_abi import ffi  # type: ignore
+    except ImportError:
+        ffi = cffi.FFI()
+        ffi.cdef(
+            pkgutil.get_data(__name__, 'grib_api.h').decode('utf-8') +
+            pkgutil.get_data(__name__, 'eccodes.h').decode('utf-8')
+        )
+    for libname in ['eccodes', 'libeccodes.so', 'libeccodes']:
+        try:
+            lib = ffi.dlopen(libname)
+            LOG.info("ecCodes library found using name '%s'.", libname)
+            break
+        except OSError as exc:
+            # lazy exception
+            lib = RaiseOnAttributeAccess(exc, 'ecCodes library not found on the system.')
+            LOG.info("ecCodes library not found using name '%s'.", libname)
+    return ffi, lib
+
+
+class LoadOnAttributeAccess(object):
+    """Placeholder of the module ``ffi`` or ``lib``, the bindings are loaded on first use."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        load_bindings()
+        return getattr(globals()[self.name], attr)
+
+
+ffi = LoadOnAttributeAccess('ffi')  # type: T.Any
+lib = LoadOnAttributeAccess('lib')  # type: T.Any
+BINDINGS_MODE = None  # type: T.Optional[str]
+_load_lock = threading.Lock()
+
+
+def load_bindings():
+    # type: () -> str
+    """
+    Load the ecCodes library, if not loaded yet, and return the bindings mode:
+    'api' with the compiled extension, 'abi' otherwise.
+    """
+    global ffi, lib, BINDINGS_MODE
+    with _load_lock:
+        if BINDINGS_MODE is None:
+            try:
+                ffi, lib = load_extension()
+                BINDINGS_MODE = 'api'
+                LOG.info("ecCodes bindings using the compiled extension.")
+            except ImportError:
+                ffi, lib = load_abi()
+                BINDINGS_MODE = 'abi'
+    return BINDINGS_MODE
+
+
+def read_eccodes_threads(path):
+    # type: (str) -> int
+    """Return 1 if ``eccodes_config.h`` at ``path`` enables threads, 0 if not, -1 if unknown."""
     try:
-        lib = ffi.dlopen(libname)
-        LOG.info("ecCodes library found using name '%s'.", libname)
-        break
-    except OSError as exc:
-        # lazy exception
-        lib = RaiseOnAttributeAccess(exc, 'ecCodes library not found on the system.')
-        LOG.info("ecCodes library not found using name '%s'.", libname)
+        with io.open(path, encoding='utf-8') as file:
+            config = file.read()
+    except (IOError, OSError):
+        return -1
+    pattern = r'^#define\s+(GRIB_PTHREADS|GRIB_OMP_THREADS)\s+(\d+)'
+    defines = dict(re.findall(pattern, config, re.M))
+    if not defines:
+        return -1
+    return int(any(int(value) for value in defines.values()))
+
+
+def codes_is_thread_safe(environ=os.environ):
+    # type: (T.Mapping[str, str]) -> bool
+    """
+    Return True if ecCodes is built with thread support, so that the functions of this module
+    can be called concurrently from many threads, on different handles.
+
+    The ``CFGRIB_ECCODES_THREAD_SAFE`` environment variable, if set, has the last word,
+    else the build configuration is used when known: by the compiled bindings or via the
+    ``eccodes_config.h`` in ``ECCODES_DIR``. When unknown ecCodes is assumed not thread-safe.
+    """
+    value = environ.get(THREAD_SAFE_ENV)
+    if value is not None:
+        return value == '1'
+    load_bindings()
+    threads = getattr(lib, 'CFGRIB_ECCODES_THREADS', -1)
+    if threads < 0 and environ.get(ECCODES_DIR_ENV):
+        config_path = os.path.join(environ[ECCODES_DIR_ENV], 'include', 'eccodes_config.h')
+        threads = read_eccodes_threads(config_path)
+    return threads > 0
+
+
+def lib_function(name):
+    # type: (str) -> T.Callable[..., T.Any]
+    """Return a function calling ``lib.<name>``, so that the library is not loaded at import."""
+
+    def function(*args):
+        return getattr(lib, name)(*args)
+
+    function.__name__ = str(name)
+    return function
 
 
 # default encoding for ecCodes strings
@@ -87,14 +199,15 @@ CODES_MISSING_LONG = GRIB_MISSING_LONG
 #
 # Helper values to discriminate key types
 #
-CODES_TYPE_UNDEFINED = lib.GRIB_TYPE_UNDEFINED
-CODES_TYPE_LONG = lib.GRIB_TYPE_LONG
-CODES_TYPE_DOUBLE = lib.GRIB_TYPE_DOUBLE
-CODES_TYPE_STRING = lib.GRIB_TYPE_STRING
-CODES_TYPE_BYTES = lib.GRIB_TYPE_BYTES
-CODES_TYPE_SECTION = lib.GRIB_TYPE_SECTION
-CODES_TYPE_LABEL = lib.GRIB_TYPE_LABEL
-CODES_TYPE_MISSING = lib.GRIB_TYPE_MISSING
+# NOTE: same values as GRIB_TYPE_* in grib_api.h, not read from ``lib`` to keep it unloaded
+CODES_TYPE_UNDEFINED = 0
+CODES_TYPE_LONG = 1
+CODES_TYPE_DOUBLE = 2
+CODES_TYPE_STRING = 3
+CODES_TYPE_BYTES = 4
+CODES_TYPE_SECTION = 5
+CODES_TYPE_LABEL = 6
+CODES_TYPE_MISSING = 7
 
 CODES_KEYS_ITERATOR_ALL_KEYS = 0
 CODES_KEYS_ITERATOR_SKIP_READ_ONLY = (1 << 0)
@@ -174,6 +287,32 @@ def codes_handle_new_from_file(fileobj, product_kind=CODES_PRODUCT_GRIB, context
         raise
 
 
+def codes_handle_new_from_message_copy(data, context=None):
+    # type: (bytes, cffi.FFI.CData) -> cffi.FFI.CData
+    """Return a handle on a copy of the GRIB message in the ``data`` buffer."""
+    if context is None:
+        context = ffi.NULL
+    handle = lib.codes_handle_new_from_message_copy(context, ffi.from_buffer(data), len(data))
+    if handle == ffi.NULL:
+        raise EcCodesError(lib.GRIB_INVALID_MESSAGE)
+    return handle
+
+
+def codes_handle_new_from_message(data, context=None):
+    # type: (T.Any, cffi.FFI.CData) -> cffi.FFI.CData
+    """
+    Return a handle on the GRIB message in the ``data`` buffer without copying it,
+    e.g. a ``memoryview`` on a ``mmap``. The caller must keep ``data`` alive and unchanged
+    until the handle is deleted.
+    """
+    if context is None:
+        context = ffi.NULL
+    handle = lib.codes_handle_new_from_message(context, ffi.from_buffer(data), len(data))
+    if handle == ffi.NULL:
+        raise EcCodesError(lib.GRIB_INVALID_MESSAGE)
+    return handle
+
+
 def codes_handle_clone(handle):
     # type: (cffi.FFI.CData) -> cffi.FFI.CData
     cloned_handle = lib.codes_handle_clone(handle)
@@ -182,8 +321,8 @@ def codes_handle_clone(handle):
     return cloned_handle
 
 
-codes_index_delete = lib.codes_index_delete
-codes_handle_delete = lib.codes_handle_delete
+codes_index_delete = lib_function('codes_index_delete')
+codes_handle_delete = lib_function('codes_handle_delete')
 
 
 def codes_new_from_index(indexid):
@@ -335,7 +474,7 @@ def codes_index_select(indexid, key, value):
         raise RuntimeError("Key value not recognised: %r %r (type %r)" % (key, value, type(value)))
 
 
-_codes_get_size = check_return(lib.codes_get_size)
+_codes_get_size = check_return(lib_function('codes_get_size'))
 
 
 def codes_get_size(handle, key):
@@ -353,7 +492,7 @@ def codes_get_size(handle, key):
     return size[0]
 
 
-_codes_get_length = check_return(lib.codes_get_length)
+_codes_get_length = check_return(lib_function('codes_get_length'))
 
 
 def codes_get_length(handle, key):
@@ -371,7 +510,7 @@ def codes_get_length(handle, key):
     return size[0]
 
 
-_codes_get_bytes = check_return(lib.codes_get_bytes)
+_codes_get_bytes = check_return(lib_function('codes_get_bytes'))
 
 
 def codes_get_bytes_array(handle, key, size):
@@ -389,7 +528,7 @@ def codes_get_bytes_array(handle, key, size):
     return list(values)
 
 
-_codes_get_long_array = check_return(lib.codes_get_long_array)
+_codes_get_long_array = check_return(lib_function('codes_get_long_array'))
 
 
 def codes_get_long_array(handle, key, size):
@@ -407,7 +546,7 @@ def codes_get_long_array(handle, key, size):
     return list(values)
 
 
-_codes_get_double_array = check_return(lib.codes_get_double_array)
+_codes_get_double_array = check_return(lib_function('codes_get_double_array'))
 
 
 def codes_get_double_array(handle, key, size):
@@ -425,7 +564,7 @@ def codes_get_double_array(handle, key, size):
     return list(values)
 
 
-_codes_get_string_array = check_return(lib.codes_get_string_array)
+_codes_get_string_array = check_return(lib_function('codes_get_string_array'))
 
 
 def codes_get_string_array(handle, key, size, length=None):
@@ -446,22 +585,29 @@ def codes_get_string_array(handle, key, size, length=None):
     return [ffi.string(values[i]) for i in range(size_p[0])]
 
 
+_codes_get_long = check_return(lib_function('codes_get_long'))
+
+
 def codes_get_long(handle, key):
     # type: (cffi.FFI.CData, bytes) -> int
     value = ffi.new('long *')
-    _codes_get_long = check_return(lib.codes_get_long)
     _codes_get_long(handle, key, value)
     return value[0]
 
 
+_codes_get_double = check_return(lib_function('codes_get_double'))
+
+
 def codes_get_double(handle, key):
     # type: (cffi.FFI.CData, bytes) -> int
     value = ffi.new('double *')
-    _codes_get_long = check_return(lib.codes_get_double)
-    _codes_get_long(handle, key, value)
+    _codes_get_double(handle, key, value)
     return value[0]
 
 
+_codes_get_string = check_return(lib_function('codes_get_string'))
+
+
 def codes_get_string(handle, key, length=None):
     # type: (cffi.FFI.CData, bytes, int) -> bytes
     """
@@ -479,12 +625,11 @@ def codes_get_string(handle, key, length=None):
         length = codes_get_length(handle, key)
     values = ffi.new('char[]', length)
     length_p = ffi.new('size_t *', length)
-    _codes_get_string = check_return(lib.codes_get_string)
     _codes_get_string(handle, key, values, length_p)
     return ffi.string(values, length_p[0])
 
 
-_codes_get_native_type = check_return(lib.codes_get_native_type)
+_codes_get_native_type = check_return(lib_function('codes_get_native_type'))
 
 
 def codes_get_native_type(handle, key):
@@ -513,6 +658,101 @@ def codes_get_array(handle, key, key_type=None,  size=None, length=None, log=LOG
         log.warning("Unknown GRIB key type: %r", key_type)
 
 
+# initial size of the buffer for string values, enlarged for the longer strings in a schema
+STRING_BUFFER_SIZE = 1024
+
+
+class _ValueBuffers(object):
+    """Output buffers of ``codes_get_many``, allocated once per call and reused for all keys."""
+
+    def __init__(self):
+        self.type_p = ffi.new('int *')
+        self.size_p = ffi.new('size_t *')
+        self.long_p = ffi.new('long *')
+        self.double_p = ffi.new('double *')
+        self.string_length = STRING_BUFFER_SIZE
+        self.string_p = ffi.new('char[]', self.string_length)
+
+    def get_long(self, handle, key):
+        # type: (cffi.FFI.CData, bytes) -> T.Tuple[int, T.Any]
+        code = lib.codes_get_long(handle, key, self.long_p)
+        return code, self.long_p[0]
+
+    def get_double(self, handle, key):
+        # type: (cffi.FFI.CData, bytes) -> T.Tuple[int, T.Any]
+        code = lib.codes_get_double(handle, key, self.double_p)
+        return code, self.double_p[0]
+
+    def get_string(self, handle, key, length=None):
+        # type: (cffi.FFI.CData, bytes, int) -> T.Tuple[int, T.Any]
+        if length is not None and length > self.string_length:
+            self.string_length = length
+            self.string_p = ffi.new('char[]', self.string_length)
+        self.size_p[0] = self.string_length
+        code = lib.codes_get_string(handle, key, self.string_p, self.size_p)
+        if code != lib.GRIB_SUCCESS:
+            return code, None
+        return code, ffi.string(self.string_p, self.size_p[0])
+
+
+def _codes_get_many_scalar(handle, key, key_type, key_schema, buffers):
+    # type: (cffi.FFI.CData, bytes, int, T.Sequence[T.Any], _ValueBuffers) -> T.Tuple[int, T.Any]
+    size = key_schema[1] if key_schema else 1
+    if size != 1:
+        return lib.GRIB_ARRAY_TOO_SMALL, None
+    if key_type == CODES_TYPE_LONG:
+        return buffers.get_long(handle, key)
+    elif key_type == CODES_TYPE_DOUBLE:
+        return buffers.get_double(handle, key)
+    elif key_type == CODES_TYPE_STRING:
+        length = key_schema[2] if len(key_schema) > 2 else None
+        return buffers.get_string(handle, key, length)
+    return lib.GRIB_ARRAY_TOO_SMALL, None
+
+
+def _codes_get_many_array(handle, key, key_type, default):
+    # type: (cffi.FFI.CData, bytes, int, T.Any) -> T.Any
+    # NOTE: the key holds an array, a long string or it has an unsupported type
+    try:
+        value = codes_get_array(handle, key, key_type)
+    except EcCodesError:
+        value = None
+    if value is None:
+        return default
+    elif len(value) == 1:
+        return value[0]
+    return value
+
+
+def codes_get_many(handle, keys, schema=None, default=None):
+    # type: (cffi.FFI.CData, T.Sequence[bytes], T.Sequence[T.Any], T.Any) -> T.List[T.Any]
+    """
+    Get the values of many keys in one pass, with buffers allocated once per call and no
+    exception raised for missing keys, whose value is ``default``.
+
+    Single values are returned as ``int``, ``float`` or ``bytes`` and multiple values as lists.
+    The ``schema`` has one ``(key_type, size[, length])`` tuple per key, as returned by
+    ``cfgrib.messages.make_message_schema``, it may be the one of a similar message: the native
+    type is always checked and the size and length are read again if they are wrong.
+    """
+    if schema is None:
+        schema = [()] * len(keys)
+    buffers = _ValueBuffers()
+    values = []
+    for key, key_schema in zip(keys, schema):
+        if lib.codes_get_native_type(handle, key, buffers.type_p) != lib.GRIB_SUCCESS:
+            values.append(default)
+            continue
+        key_type = buffers.type_p[0]
+        if not key_schema or key_schema[0] != key_type:
+            key_schema = ()
+        code, value = _codes_get_many_scalar(handle, key, key_type, key_schema, buffers)
+        if code != lib.GRIB_SUCCESS:
+            value = _codes_get_many_array(handle, key, key_type, default)
+        values.append(value)
+    return values
+
+
 def codes_get(handle, key, key_type=None, length=None, log=LOG):
     # type: (cffi.FFI.CData, bytes, int, int, logging.Logger) -> T.Any
     if key_type is None:
@@ -677,6 +917,15 @@ def codes_grib_multi_support_off(context=None):
     lib.codes_grib_multi_support_off(context)
 
 
+def codes_get_message(handle):
+    # type: (cffi.FFI.CData) -> bytes
+    """Return a copy of the coded message of the handle."""
+    mess = ffi.new('const void **')
+    mess_len = ffi.new('size_t*')
+    check_return(lib.codes_get_message)(handle, mess, mess_len)
+    return ffi.buffer(mess[0], size=mess_len[0])[:]
+
+
 def codes_write(handle, outfile):
     # type: (cffi.FFI.CData, T.BinaryIO) -> None
     """
@@ -0,0 +1,109 @@
+#
+# Copyright 2017-2019 European Centre for Medium-Range Weather Forecasts (ECMWF).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Authors:
+#   Alessandro Amici - B-Open - https://bopen.eu
+#
+"""
+Builders of the ``cfgrib._bindings_abi`` module and of the optional ``cfgrib._bindings``
+extension, used by ``cfgrib.bindings`` when available.
+
+``_bindings_abi`` is pure Python: the ecCodes declarations parsed in advance, so that importing
+the ABI-mode bindings doesn't parse the headers. It is always generated by ``setup.py``.
+``_bindings`` is the cffi API-mode (compiled) version of the same declarations, built by
+``setup.py`` when ``CFGRIB_BUILD_EXTENSION`` is set. ecCodes headers and library are looked up
+in ``ECCODES_DIR``, if set, and in the compiler default paths.
+
+Both are built in place with ``python cfgrib/bindings_build.py``, or only ``_bindings_abi``
+with ``python cfgrib/bindings_build.py abi``.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+import os
+import sys
+import typing as T  # noqa
+
+import cffi
+
+ECCODES_DIR_ENV = 'ECCODES_DIR'
+HEADERS = ['grib_api.h', 'eccodes.h']
+
+# NOTE: the thread support of ecCodes is only known at build time, from eccodes_config.h,
+#   -1 means unknown
+API_DECLARATIONS = '''
+static const int CFGRIB_ECCODES_THREADS;
+'''
+API_SOURCE = '''
+#include <eccodes.h>
+#if defined(__has_include)
+#  if __has_include(<eccodes_config.h>)
+#    include <eccodes_config.h>
+#  endif
+#endif
+#if defined(GRIB_PTHREADS) && defined(GRIB_OMP_THREADS)
+static const int CFGRIB_ECCODES_THREADS = GRIB_PTHREADS || GRIB_OMP_THREADS;
+#else
+static const int CFGRIB_ECCODES_THREADS = -1;
+#endif
+'''
+
+
+def read_declarations():
+    # type: () -> str
+    declarations = []
+    for name in HEADERS:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+        with io.open(path, encoding='utf-8') as file:
+            declarations.append(file.read())
+    return ''.join(declarations)
+
+
+def make_abi_ffibuilder():
+    # type: () -> cffi.FFI
+    ffibuilder = cffi.FFI()
+    ffibuilder.cdef(read_declarations())
+    ffibuilder.set_source(str('cfgrib._bindings_abi'), None)
+    return ffibuilder
+
+
+def make_ffibuilder(environ=os.environ):
+    # type: (T.Mapping[str, str]) -> cffi.FFI
+    include_dirs = []
+    library_dirs = []
+    eccodes_dir = environ.get(ECCODES_DIR_ENV)
+    if eccodes_dir:
+        include_dirs.append(os.path.join(eccodes_dir, 'include'))
+        library_dirs.extend(os.path.join(eccodes_dir, d) for d in ['lib', 'lib64'])
+    ffibuilder = cffi.FFI()
+    ffibuilder.cdef(read_declarations() + API_DECLARATIONS)
+    ffibuilder.set_source(
+        str('cfgrib._bindings'), API_SOURCE, libraries=[str('eccodes')],
+        include_dirs=include_dirs, library_dirs=library_dirs, runtime_library_dirs=library_dirs,
+    )
+    return ffibuilder
+
+
+abi_ffibuilder = make_abi_ffibuilder()
+ffibuilder = make_ffibuilder()
+
+
+if __name__ == '__main__':
+    # NOTE: build in place, next to ``bindings.py``
+    tmpdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    abi_ffibuilder.compile(tmpdir=tmpdir)
+    if sys.argv[1:] != ['abi']:
+        ffibuilder.compile(tmpdir=tmpdir)
@@ -19,11 +19,16 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 from builtins import list, object, set, str
+from future.utils import string_types
 
 import collections
 import datetime
+import glob
+import io
+import itertools
 import json
 import logging
+import threading
 import typing as T
 import warnings
 
@@ -34,6 +39,7 @@ from . import __version__
 from . import bindings
 from . import cfmessage
 from . import messages
+from . import sources
 
 LOG = logging.getLogger(__name__)
 
@@ -107,6 +113,15 @@ ALL_HEADER_DIMS = ENSEMBLE_KEYS + VERTICAL_KEYS + DATA_TIME_KEYS + REF_TIME_KEYS
 
 ALL_KEYS = GLOBAL_ATTRIBUTES_KEYS + DATA_ATTRIBUTES_KEYS + GRID_TYPE_KEYS + ALL_HEADER_DIMS
 
+# fields read ahead by a Prefetcher and the bytes they can take, prefetching is opt-in via
+# ``prefetch_depth`` and starts after PREFETCH_TRIGGER steps in the same direction
+PREFETCH_DEPTH = 4
+PREFETCH_MAX_SIZE = 2 ** 26
+PREFETCH_TRIGGER = 2
+
+# bytes of the blocks an OnDiskArray reads at once, see OnDiskArray.block_items
+MEMORY_BUDGET = 2 ** 28
+
 COORD_ATTRS = {
     # geography
     'latitude': {
@@ -218,6 +233,137 @@ def expand_item(item, shape):
     return tuple(expanded_item)
 
 
+def sequential_step(previous_item, item):
+    # type: (T.Any, T.Tuple[T.List[int], ...]) -> T.Optional[T.Tuple[int, int]]
+    """
+    Return the ``(dimension, step)`` if the expanded ``item`` is ``previous_item`` moved by
+    a constant ``step`` along one header dimension, else None.
+    """
+    if previous_item is None or len(previous_item) != len(item):
+        return None
+    moved = [d for d, (p, i) in enumerate(zip(previous_item, item)) if p != i]
+    if len(moved) != 1 or len(previous_item[moved[0]]) != len(item[moved[0]]):
+        return None
+    steps = set(i - p for p, i in zip(previous_item[moved[0]], item[moved[0]]))
+    if len(steps) != 1:
+        return None
+    return moved[0], steps.pop()
+
+
+@attr.attrs(cmp=False)
+class Prefetcher(object):
+    """
+    Read ahead the fields of an OnDiskArray accessed sequentially along a header dimension,
+    e.g. one time step at a time, on a background thread. The fields are decoded ahead only
+    if ecCodes is thread-safe, else only their bytes are read. Prefetched fields are kept
+    until used, at most ``depth`` requests ahead and ``max_size`` bytes, and are dropped as
+    soon as the access pattern changes. Prefetching stops for good when the array is read
+    from more than one thread, e.g. by dask workers, as the access pattern is then lost.
+    """
+    data = attr.attrib(repr=False)
+    depth = attr.attrib(default=PREFETCH_DEPTH, type=int)
+    max_size = attr.attrib(default=PREFETCH_MAX_SIZE, type=int)
+    decode = attr.attrib(default=attr.Factory(bindings.codes_is_thread_safe), type=bool)
+    last_item = attr.attrib(default=None, init=False, repr=False)
+    step = attr.attrib(default=None, init=False, repr=False)
+    hits = attr.attrib(default=0, init=False, repr=False)
+    # NOTE: offsets waiting to be read, the one being read and the fields read ahead
+    queue = attr.attrib(default=attr.Factory(collections.deque), init=False, repr=False)
+    in_flight = attr.attrib(default=None, init=False, repr=False)
+    fields = attr.attrib(default=attr.Factory(dict), init=False, repr=False)
+    size = attr.attrib(default=0, init=False, repr=False)
+    worker = attr.attrib(default=None, init=False, repr=False)
+    thread = attr.attrib(default=None, init=False, repr=False)
+    _cond = attr.attrib(default=attr.Factory(threading.Condition), init=False, repr=False)
+
+    def observe(self, item):
+        # type: (T.Tuple[T.List[int], ...]) -> None
+        """Record the expanded header ``item`` of a read and schedule the next fields."""
+        with self._cond:
+            if self.thread is None:
+                self.thread = threading.current_thread()
+            elif self.thread is not threading.current_thread() and self.depth > 0:
+                LOG.debug("prefetching disabled for an array read from more than one thread")
+                self.depth = 0
+                self.queue.clear()
+                self.fields.clear()
+                self.size = 0
+            if self.depth <= 0:
+                return
+            step = sequential_step(self.last_item, item)
+            self.last_item = item
+            if step is None or step != self.step:
+                self.step = step
+                self.hits = 0 if step is None else 1
+                self.queue.clear()
+                self.fields.clear()
+                self.size = 0
+                return
+            self.hits += 1
+            if self.hits < PREFETCH_TRIGGER:
+                return
+            dim, delta = step
+            for ahead in range(1, self.depth + 1):
+                ahead_item = list(item)
+                ahead_item[dim] = [i + delta * ahead for i in item[dim]]
+                for offset in self.data.item_offsets(ahead_item):
+                    if offset not in self.fields and offset not in self.queue and \
+                            offset != self.in_flight:
+                        self.queue.append(offset)
+            if self.queue and self.worker is None:
+                self.worker = threading.Thread(target=self.run)
+                self.worker.daemon = True
+                self.worker.start()
+
+    def take(self, offset):
+        # type: (T.Any) -> T.Any
+        """Return the values or the bytes of the field at ``offset`` if read ahead, else None."""
+        with self._cond:
+            if offset in self.queue:
+                self.queue.remove(offset)
+            while offset == self.in_flight:
+                self._cond.wait()
+            field = self.fields.pop(offset, None)
+            if field is not None:
+                self.size -= field.nbytes if self.decode else len(field)
+            return field
+
+    def reader(self):
+        # type: () -> T.ContextManager[T.Callable[[T.Any], T.Any]]
+        if self.decode:
+            return self.data.stream.message_reader()
+        return self.data.stream.data_reader()
+
+    def read(self, read_offset, offset):
+        # type: (T.Callable[[T.Any], T.Any], T.Any) -> T.Any
+        if not self.decode:
+            return read_offset(offset)
+        values = read_offset(offset).message_get('values', bindings.CODES_TYPE_DOUBLE)
+        return np.asarray(values, dtype=self.data.dtype)
+
+    def run(self):
+        # type: () -> None
+        with self.reader() as read_offset:
+            while True:
+                with self._cond:
+                    if not self.queue or self.size >= self.max_size:
+                        self.worker = None
+                        return
+                    offset = self.in_flight = self.queue.popleft()
+                field = None
+                try:
+                    field = self.read(read_offset, offset)
+                except Exception:
+                    LOG.debug("can't read ahead the field at offset %r", offset, exc_info=True)
+                with self._cond:
+                    # NOTE: a field no longer wanted when the pattern changed is dropped
+                    if field is not None and self.step is not None:
+                        self.fields[offset] = field
+                        self.size += field.nbytes if self.decode else len(field)
+                    self.in_flight = None
+                    self._cond.notify_all()
+
+
 @attr.attrs()
 class OnDiskArray(object):
     stream = attr.attrib()
@@ -225,42 +371,166 @@ class OnDiskArray(object):
     offsets = attr.attrib(repr=False, type=T.Dict[T.Tuple[T.Any, ...], T.List[int]])
     missing_value = attr.attrib()
     geo_ndim = attr.attrib(default=1, repr=False)
+    lengths = attr.attrib(default=None, repr=False, type=T.Optional[T.Dict[T.Any, int]])
+    statistics = attr.attrib(
+        default=None, repr=False, type=T.Optional[T.Dict[T.Any, T.Tuple[T.Any, ...]]],
+    )
+    # NOTE: fields read ahead on sequential access on a background thread, 0 disables it
+    prefetch_depth = attr.attrib(default=0, repr=False, cmp=False, type=int)
+    _prefetcher = attr.attrib(default=None, init=False, repr=False, cmp=False)
+    memory_budget = attr.attrib(default=MEMORY_BUDGET, repr=False, cmp=False, type=int)
     dtype = np.dtype('float32')
 
+    def __getstate__(self):
+        # NOTE: the prefetcher holds a thread and a lock
+        state = self.__dict__.copy()
+        state['_prefetcher'] = None
+        return state
+
+    @property
+    def prefetcher(self):
+        # type: () -> T.Optional[Prefetcher]
+        if self._prefetcher is None and self.prefetch_depth > 0:
+            self._prefetcher = Prefetcher(self, depth=self.prefetch_depth)
+        return self._prefetcher
+
+    def item_offsets(self, header_item):
+        # type: (T.Sequence[T.List[int]]) -> T.List[T.Any]
+        """Return the offsets of the fields in the expanded ``header_item``."""
+        offsets = []
+        for header_indexes in itertools.product(*header_item):
+            if header_indexes in self.offsets:
+                offsets.append(self.offsets[header_indexes][0])
+        return offsets
+
+    def field_values(self, message_from_offset, offset):
+        # type: (T.Callable[[T.Any], messages.Message], T.Any) -> T.Any
+        prefetcher = self.prefetcher
+        field = prefetcher.take(offset) if prefetcher is not None else None
+        if field is None:
+            message = message_from_offset(offset)
+        elif prefetcher.decode:
+            return field
+        else:
+            message = self.stream.message_class.from_bytes(field, offset=offset)
+        return message.message_get('values', bindings.CODES_TYPE_DOUBLE)
+
     def build_array(self):
         """Helper method used to test __getitem__"""
         # type: () -> np.ndarray
         array = np.full(self.shape, fill_value=np.nan, dtype='float32')
-        with open(self.stream.path) as file:
+        with self.stream.message_reader() as message_from_offset:
             for header_indexes, offset in self.offsets.items():
                 # NOTE: fill a single field as found in the message
-                message = self.stream.message_from_file(file, offset=offset[0])
+                message = message_from_offset(offset[0])
                 values = message.message_get('values', bindings.CODES_TYPE_DOUBLE)
                 array.__getitem__(header_indexes).flat[:] = values
         array[array == self.missing_value] = np.nan
         return array
 
-    def __getitem__(self, item):
+    def geo_selection_shape(self, geo_item):
+        # type: (T.Tuple[T.Any, ...]) -> T.Tuple[int, ...]
+        """Return the shape of the ``geo_item`` selection of one field, without reading it."""
+        field = np.broadcast_to(np.zeros((), dtype=self.dtype), self.shape[-self.geo_ndim:])
+        return field[geo_item].shape
+
+    def check_item(self, item):
+        # type: (T.Any) -> None
         assert isinstance(item, tuple), "Item type must be tuple not %r" % type(item)
         assert len(item) == len(self.shape), "Item len must be %r not %r" % (self.shape, len(item))
 
+    def block_items(self, item, memory_budget=None):
+        # type: (T.Tuple[T.Any, ...], T.Optional[int]) -> T.Iterator[T.Tuple[T.Any, T.Any]]
+        """
+        Yield ``(array_index, block_item)`` pairs that split the ``self[item]`` selection
+        along the header dimensions in blocks of at most ``memory_budget`` bytes, in row-major
+        order, with ``array_index`` the position of ``self[block_item]`` in ``self[item]``.
+        The selection of a single field is never split.
+        """
+        memory_budget = memory_budget or self.memory_budget
+        header_ndim = len(self.shape) - self.geo_ndim
+        header_item = expand_item(item[:header_ndim], self.shape)
+        geo_selection_shape = self.geo_selection_shape(item[header_ndim:])
+        field_size = self.dtype.itemsize * int(np.prod(geo_selection_shape))
+        # NOTE: sizes[d] is the size of the selection of one index of the dimensions before d
+        sizes = [field_size]
+        for it in reversed(header_item):
+            sizes.insert(0, sizes[0] * len(it))
+        splits = [d for d in range(header_ndim) if sizes[d] > memory_budget]
+        if sizes[0] <= memory_budget or not splits:
+            yield (), item
+            return
+        split = max(splits)
+        step = max(1, memory_budget // sizes[split + 1])
+        # NOTE: integer indexes are kept so that the dimension is dropped as in self[item]
+        kept = [not isinstance(it, int) for it in item[:split + 1]]
+        for outer in itertools.product(*[list(enumerate(it)) for it in header_item[:split]]):
+            for start in range(0, len(header_item[split]), step):
+                block = [[i] for _, i in outer] + [header_item[split][start:start + step]]
+                block += header_item[split + 1:]
+                block_item = tuple(
+                    it if isinstance(it, int) else b for it, b in zip(item, block)
+                ) + item[header_ndim:]
+                positions = [slice(p, p + 1) for p, _ in outer] + [slice(start, start + step)]
+                array_index = tuple(p for p, k in zip(positions, kept) if k)
+                yield array_index, block_item
+
+    def iter_blocks(self, item, memory_budget=None):
+        # type: (T.Tuple[T.Any, ...], T.Optional[int]) -> T.Iterator[T.Tuple[T.Any, np.ndarray]]
+        """
+        Yield ``(block_item, array)`` pairs, with ``array`` equal to ``self[block_item]``, that
+        split the ``self[item]`` selection along the header dimensions in blocks of at most
+        ``memory_budget`` bytes, ``self.memory_budget`` by default, in row-major order.
+        The selection of a single field is never split.
+        """
+        self.check_item(item)
+        for _, block_item in self.block_items(item, memory_budget):
+            yield block_item, self.read_item(block_item)
+
+    def __getitem__(self, item):
+        self.check_item(item)
+        blocks = list(self.block_items(item))
+        if len(blocks) == 1:
+            return self.read_item(item)
+        # NOTE: the result is filled one block at a time, so only a block of at most
+        #   memory_budget bytes is allocated on top of it
+        header_item = expand_item(item[:-self.geo_ndim], self.shape)
+        array_shape = tuple(
+            len(l) for l, it in zip(header_item, item) if not isinstance(it, int)
+        ) + self.geo_selection_shape(item[-self.geo_ndim:])
+        array = np.empty(array_shape, dtype=self.dtype)
+        for array_index, block_item in blocks:
+            array[array_index] = self.read_item(block_item)
+        return array
+
+    def read_item(self, item):
+        # type: (T.Tuple[T.Any, ...]) -> np.ndarray
+        """Return ``self[item]`` read at once."""
         header_item = expand_item(item[:-self.geo_ndim], self.shape)
-        array_field_shape = tuple(len(l) for l in header_item) + self.shape[-self.geo_ndim:]
-        array_field = np.full(array_field_shape, fill_value=np.nan, dtype='float32')
-        with open(self.stream.path) as file:
+        geo_item = item[-self.geo_ndim:]
+        geo_shape = self.shape[-self.geo_ndim:]
+        # NOTE: only the selection is allocated, the geographic part is applied to every field
+        array_shape = tuple(len(l) for l in header_item) + self.geo_selection_shape(geo_item)
+        array = np.full(array_shape, fill_value=np.nan, dtype=self.dtype)
+        header_positions = []  # type: T.List[T.Dict[int, int]]
+        for it in header_item:
+            positions = {}  # type: T.Dict[int, int]
+            for position, ix in enumerate(it):
+                positions.setdefault(ix, position)
+            header_positions.append(positions)
+        if self.prefetcher is not None:
+            self.prefetcher.observe(header_item)
+        with self.stream.message_reader() as message_from_offset:
             for header_indexes, offset in self.offsets.items():
                 try:
-                    array_field_indexes = []
-                    for it, ix in zip(header_item, header_indexes):
-                        array_field_indexes.append(it.index(ix))
-                except ValueError:
+                    array_indexes = tuple(p[ix] for p, ix in zip(header_positions, header_indexes))
+                except KeyError:
                     continue
                 # NOTE: fill a single field as found in the message
-                message = self.stream.message_from_file(file, offset=offset[0])
-                values = message.message_get('values', bindings.CODES_TYPE_DOUBLE)
-                array_field.__getitem__(tuple(array_field_indexes)).flat[:] = values
+                values = self.field_values(message_from_offset, offset[0])
+                field = np.asarray(values, dtype=self.dtype).reshape(geo_shape)
+                array[array_indexes] = field[geo_item]
 
-        array = array_field[(Ellipsis,) + item[-self.geo_ndim:]]
         array[array == self.missing_value] = np.nan
         for i, it in reversed(list(enumerate(item[:-self.geo_ndim]))):
             if isinstance(it, int):
@@ -268,6 +538,47 @@ class OnDiskArray(object):
         return array
 
 
+@attr.attrs()
+class StatisticsArray(object):
+    """
+    Lazy array of the ``key`` statistic of every field of ``data`` on its header dimensions,
+    e.g. the ``'max'`` of every field, read from the index without decoding the fields.
+    Missing fields are NaN.
+    """
+    data = attr.attrib(type=OnDiskArray, repr=False)
+    key = attr.attrib(type=str)
+    dtype = np.dtype('float64')
+
+    @property
+    def shape(self):
+        # type: () -> T.Tuple[int, ...]
+        return self.data.shape[:-self.data.geo_ndim]
+
+    def build_array(self):
+        # type: () -> np.ndarray
+        if self.data.statistics is None:
+            raise ValueError("statistics are not indexed, open the file with statistics=True")
+        column = messages.STATISTICS_KEYS.index(self.key)
+        array = np.full(self.shape, fill_value=np.nan, dtype=self.dtype)
+        for header_indexes, offset in self.data.offsets.items():
+            values = self.data.statistics.get(offset[0])
+            if values is not None and values[column] not in ('undef', 'unknown'):
+                array[header_indexes] = values[column]
+        return array
+
+    def __getitem__(self, item):
+        assert isinstance(item, tuple), "Item type must be tuple not %r" % type(item)
+        assert len(item) == len(self.shape), "Item len must be %r not %r" % (self.shape, len(item))
+        array = self.build_array()
+        if not self.shape:
+            return array
+        array = array[np.ix_(*expand_item(item, self.shape))]
+        for i, it in reversed(list(enumerate(item))):
+            if isinstance(it, int):
+                array = array[(slice(None, None, None),) * i + (0,)]
+        return array
+
+
 GRID_TYPES_DIMENSION_COORDS = ['regular_ll', 'regular_gg']
 GRID_TYPES_2D_NON_DIMENSION_COORDS = [
     'rotated_ll', 'rotated_gg', 'lambert', 'albers', 'polar_stereographic',
@@ -353,7 +664,20 @@ def encode_cf_first(data_var_attrs, encode_cf=('parameter', 'time')):
     return coords_map
 
 
-def build_variable_components(index, encode_cf=(), filter_by_keys={}, log=LOG, errors='warn'):
+def geography_cache_key(index, encode_cf):
+    # type: (messages.FileIndex, T.Sequence[str]) -> T.Optional[T.Tuple[T.Any, ...]]
+    """Return a key identifying the grid of ``index`` or None if the grid is not fully indexed."""
+    grid_type = index.getone('gridType')
+    if grid_type not in GRID_TYPE_MAP:
+        return None
+    grid_values = tuple(tuple(index[key]) for key in GRID_TYPE_KEYS)
+    return ('geography' in encode_cf, grid_type, index.getone('numberOfPoints')) + grid_values
+
+
+def build_variable_components(
+        index, encode_cf=(), filter_by_keys={}, log=LOG, errors='warn', geography_cache=None,
+        prefetch_depth=0, memory_budget=MEMORY_BUDGET,
+):
     data_var_attrs_keys = DATA_ATTRIBUTES_KEYS[:]
     data_var_attrs_keys.extend(GRID_TYPE_MAP.get(index.getone('gridType'), []))
     data_var_attrs = enforce_unique_attributes(index, data_var_attrs_keys, filter_by_keys)
@@ -386,7 +710,14 @@ def build_variable_components(index, encode_cf=(), filter_by_keys={}, log=LOG, e
     header_dimensions = tuple(d for d, c in coord_vars.items() if c.data.size > 1)
     header_shape = tuple(coord_vars[d].data.size for d in header_dimensions)
 
-    geo_dims, geo_shape, geo_coord_vars = build_geography_coordinates(index, encode_cf, errors)
+    # NOTE: variables on the same grid share the geography to avoid reading one message each
+    cache_key = geography_cache_key(index, encode_cf) if geography_cache is not None else None
+    if cache_key is not None and cache_key in geography_cache:
+        geo_dims, geo_shape, geo_coord_vars = geography_cache[cache_key]
+    else:
+        geo_dims, geo_shape, geo_coord_vars = build_geography_coordinates(index, encode_cf, errors)
+        if cache_key is not None:
+            geography_cache[cache_key] = geo_dims, geo_shape, geo_coord_vars
     dimensions = header_dimensions + geo_dims
     shape = header_shape + geo_shape
     coord_vars.update(geo_coord_vars)
@@ -401,7 +732,9 @@ def build_variable_components(index, encode_cf=(), filter_by_keys={}, log=LOG, e
     missing_value = data_var_attrs.get('missingValue', 9999)
     data = OnDiskArray(
         stream=index.filestream, shape=shape, offsets=offsets, missing_value=missing_value,
-        geo_ndim=len(geo_dims),
+        geo_ndim=len(geo_dims), lengths=getattr(index, 'lengths', None),
+        statistics=getattr(index, 'statistics', None), prefetch_depth=prefetch_depth,
+        memory_budget=memory_budget,
     )
 
     if 'time' in coord_vars and 'time' in encode_cf:
@@ -433,19 +766,37 @@ def dict_merge(master, update):
 def build_dataset_components(
         stream, indexpath='{path}.{short_hash}.idx', filter_by_keys={}, errors='warn',
         encode_cf=('parameter', 'time', 'geography', 'vertical'), timestamp=None, log=LOG,
+        statistics=False, duplicates='keep', prefetch_depth=0, memory_budget=MEMORY_BUDGET,
 ):
     filter_by_keys = dict(filter_by_keys)
-    index = stream.index(ALL_KEYS, indexpath=indexpath).subindex(filter_by_keys)
+    index = stream.index(
+        ALL_KEYS, indexpath=indexpath, statistics=statistics, duplicates=duplicates,
+    )
+    index = index.subindex(filter_by_keys).deduplicate(duplicates, log=log)
+    return build_index_dataset_components(
+        index, filter_by_keys=filter_by_keys, errors=errors, encode_cf=encode_cf,
+        timestamp=timestamp, log=log, prefetch_depth=prefetch_depth, memory_budget=memory_budget,
+    )
+
+
+def build_index_dataset_components(
+        index, filter_by_keys={}, errors='warn',
+        encode_cf=('parameter', 'time', 'geography', 'vertical'), timestamp=None, log=LOG,
+        geography_cache=None, prefetch_depth=0, memory_budget=MEMORY_BUDGET,
+):
     dimensions = collections.OrderedDict()
     variables = collections.OrderedDict()
-    for param_id in index['paramId']:
-        var_index = index.subindex(paramId=param_id)
-        first = var_index.first()
-        short_name = first['shortName']
-        var_name = first['cfVarName']
+    if geography_cache is None:
+        geography_cache = {}
+    for param_id, var_index in index.partition('paramId').items():
+        # NOTE: names come from the index, no need to read the first message of the variable
+        short_name = var_index['shortName'][0]
+        var_name = var_index['cfVarName'][0]
         try:
             dims, data_var, coord_vars = build_variable_components(
                 var_index, encode_cf, filter_by_keys, errors=errors,
+                geography_cache=geography_cache, prefetch_depth=prefetch_depth,
+                memory_budget=memory_budget,
             )
         except DatasetBuildError as ex:
             # NOTE: When a variable has more than one value for an attribute we need to raise all
@@ -475,7 +826,7 @@ def build_dataset_components(
                 log.exception("skipping variable: paramId==%r shortName=%r", param_id, short_name)
     attributes = enforce_unique_attributes(index, GLOBAL_ATTRIBUTES_KEYS, filter_by_keys)
     encoding = {
-        'source': stream.path,
+        'source': index.filestream.path,
         'filter_by_keys': filter_by_keys,
         'encode_cf': encode_cf,
     }
@@ -493,6 +844,38 @@ def build_dataset_components(
     return dimensions, variables, attributes, encoding
 
 
+def build_hypercubes_components(
+        stream, indexpath='{path}.{short_hash}.idx', filter_by_keys={}, statistics=False,
+        duplicates='keep', **kwargs
+):
+    """
+    Return the components of all the datasets needed to represent the GRIB ``stream``.
+
+    The index is read once and incompatible hypercubes are split in memory following the
+    ``filter_by_keys`` suggested by the DatasetBuildError, the geography is shared by all datasets.
+    """
+    filter_by_keys = dict(filter_by_keys)
+    index = stream.index(
+        ALL_KEYS, indexpath=indexpath, statistics=statistics, duplicates=duplicates,
+    )
+    index = index.subindex(filter_by_keys).deduplicate(duplicates, log=kwargs.get('log', LOG))
+    return build_index_hypercubes_components(index, filter_by_keys, geography_cache={}, **kwargs)
+
+
+def build_index_hypercubes_components(index, filter_by_keys={}, **kwargs):
+    try:
+        return [build_index_dataset_components(index, filter_by_keys, **kwargs)]
+    except DatasetBuildError as ex:
+        if len(ex.args) < 3:
+            raise
+        key, fbks = ex.args[1:3]
+    components = []
+    subindexes = index.partition(key)
+    for fbk in fbks:
+        components.extend(build_index_hypercubes_components(subindexes[fbk[key]], fbk, **kwargs))
+    return components
+
+
 @attr.attrs()
 class Dataset(object):
     """
@@ -503,11 +886,166 @@ class Dataset(object):
     attributes = attr.attrib(type=T.Dict[str, T.Any])
     encoding = attr.attrib(type=T.Dict[str, T.Any])
 
+    def field_statistics(self, key):
+        # type: (str) -> Dataset
+        """
+        Return a Dataset with the ``key`` statistic of every field of the data variables,
+        one of ``messages.STATISTICS_KEYS``, on the header dimensions only. The statistics are
+        read from the index of a file opened with ``statistics=True``, fields are not decoded.
+        """
+        if key not in messages.STATISTICS_KEYS:
+            raise ValueError("key must be one of %r, not %r" % (messages.STATISTICS_KEYS, key))
+        variables = collections.OrderedDict()  # type: T.Dict[str, Variable]
+        for name, var in self.variables.items():
+            if isinstance(var.data, OnDiskArray):
+                data = StatisticsArray(var.data, key)
+                data.build_array()  # NOTE: fail early if the statistics are not indexed
+                attributes = var.attributes.copy()
+                attributes['long_name'] = '%s of %s' % (key, attributes.get('long_name', name))
+                if key in ('bitmapPresent', 'numberOfMissing'):
+                    attributes['units'] = '1'
+                dimensions = var.dimensions[:-var.data.geo_ndim]
+                variables[name] = Variable(dimensions, data, attributes)
+        data_vars = list(variables.values())
+        header_dims = set(d for v in data_vars for d in v.dimensions)
+        for name, var in self.variables.items():
+            if name not in variables and set(var.dimensions) <= header_dims:
+                variables[name] = var
+        for var in data_vars:
+            if 'coordinates' in var.attributes:
+                coordinates = var.attributes['coordinates'].split()
+                var.attributes['coordinates'] = ' '.join(c for c in coordinates if c in variables)
+        dimensions = collections.OrderedDict(
+            (d, s) for d, s in self.dimensions.items() if d in header_dims
+        )
+        return Dataset(dimensions, variables, self.attributes.copy(), self.encoding.copy())
+
+
+@attr.attrs()
+class DatasetBuilder(object):
+    """
+    Build a ``cfgrib.Dataset`` from GRIB messages added as they arrive, e.g. from a
+    ``messages.StreamReader``. The messages are indexed when added and kept in memory,
+    so ``build`` can be called at any time without temporary files.
+    """
+    path = attr.attrib(default='<stream>', type=str)
+    grib_errors = attr.attrib(default='warn')
+    # NOTE: the messages are only appended, so the index of a build is a snapshot without copies
+    chunks = attr.attrib(default=attr.Factory(list), init=False, repr=False)
+    starts = attr.attrib(default=attr.Factory(list), init=False, repr=False)
+    offsets = attr.attrib(default=attr.Factory(collections.OrderedDict), init=False, repr=False)
+    lengths = attr.attrib(default=attr.Factory(dict), init=False, repr=False)
+    header_reader = attr.attrib(
+        default=attr.Factory(lambda: messages.HeaderReader(ALL_KEYS)), init=False, repr=False,
+    )
+
+    @property
+    def size(self):
+        # type: () -> int
+        return self.starts[-1] + len(self.chunks[-1]) if self.chunks else 0
+
+    def add(self, data):
+        # type: (bytes) -> None
+        """Add the GRIB message in ``data``."""
+        data = bytes(data)
+        message = cfmessage.CfMessage.from_bytes(data, errors=self.grib_errors)
+        self.add_indexed(data, self.header_reader(message))
+
+    def add_message(self, message):
+        # type: (messages.Message) -> None
+        """Add a message, the ``CfMessage`` decoded from a buffer, e.g. by a ``StreamReader``."""
+        if isinstance(message, cfmessage.CfMessage) and isinstance(message.buffer, bytes):
+            self.add_indexed(message.buffer, self.header_reader(message))
+        else:
+            file = io.BytesIO()
+            message.write(file)
+            self.add(file.getvalue())
 
-def open_file(path, grib_errors='warn', **kwargs):
-    """Open a GRIB file as a ``cfgrib.Dataset``."""
+    def add_indexed(self, data, header_values):
+        # type: (bytes, T.Tuple[T.Any, ...]) -> None
+        offset = self.size
+        self.chunks.append(data)
+        self.starts.append(offset)
+        self.offsets.setdefault(header_values, []).append(offset)
+        self.lengths[offset] = len(data)
+
+    def index(self):
+        # type: () -> messages.FileIndex
+        """Return an index on a snapshot of the messages added so far."""
+        source = sources.ChunksSource(self.chunks, self.starts, len(self.chunks))
+        stream = messages.FileStream(
+            self.path, message_class=cfmessage.CfMessage, errors=self.grib_errors, source=source,
+        )
+        offsets = [(hv, list(offsets_values)) for hv, offsets_values in self.offsets.items()]
+        return messages.FileIndex(
+            filestream=stream, index_keys=ALL_KEYS, offsets=offsets, scanned_size=self.size,
+            lengths=dict(self.lengths),
+        )
+
+    def build(self, filter_by_keys={}, duplicates='keep', **kwargs):
+        # type: (T.Dict[str, T.Any], str, T.Any) -> Dataset
+        if not self.lengths:
+            raise EOFError("No valid GRIB message found in stream: %r" % self.path)
+        filter_by_keys = dict(filter_by_keys)
+        index = self.index().subindex(filter_by_keys)
+        index = index.deduplicate(duplicates, log=kwargs.get('log', LOG))
+        components = build_index_dataset_components(index, filter_by_keys=filter_by_keys, **kwargs)
+        return Dataset(*components)
+
+
+def open_file(path, grib_errors='warn', source=None, **kwargs):
+    """
+    Open a GRIB file as a ``cfgrib.Dataset``.
+
+    The GRIB file can be read from a ``cfgrib.sources.ByteSource``, ``path`` is then only a label.
+    """
     if 'mode' in kwargs:
         warnings.warn("the `mode` keyword argument is ignored and deprecated", FutureWarning)
         kwargs.pop('mode')
-    stream = messages.FileStream(path, message_class=cfmessage.CfMessage, errors=grib_errors)
+    stream = messages.FileStream(
+        path, message_class=cfmessage.CfMessage, errors=grib_errors, source=source,
+    )
     return Dataset(*build_dataset_components(stream, **kwargs))
+
+
+def open_files(paths, grib_errors='warn', indexpath='{path}.{short_hash}.idx', catalogpath='',
+               filter_by_keys={}, statistics=False, duplicates='keep', **kwargs):
+    """
+    Open many GRIB files, given as a list of paths or a glob pattern, as one ``cfgrib.Dataset``.
+
+    The per-file indexes are merged in a catalog index, persisted to ``catalogpath`` if given.
+    """
+    if isinstance(paths, string_types):
+        paths = sorted(glob.glob(paths))
+    if not paths:
+        raise ValueError("no GRIB file to open")
+    stream = messages.MultiFileStream(paths, message_class=cfmessage.CfMessage, errors=grib_errors)
+    filter_by_keys = dict(filter_by_keys)
+    index = stream.index(
+        ALL_KEYS, indexpath=indexpath, catalogpath=catalogpath, statistics=statistics,
+        duplicates=duplicates,
+    )
+    index = index.subindex(filter_by_keys).deduplicate(duplicates, log=kwargs.get('log', LOG))
+    components = build_index_dataset_components(index, filter_by_keys=filter_by_keys, **kwargs)
+    return Dataset(*components)
+
+
+def open_stream(fileobj, grib_errors='warn', path='<stream>', **kwargs):
+    """
+    Open the GRIB messages read from a non-seekable binary stream, e.g. ``sys.stdin.buffer``
+    or a socket file, as a ``cfgrib.Dataset``.
+    """
+    builder = DatasetBuilder(path=path, grib_errors=grib_errors)
+    reader = messages.StreamReader(
+        fileobj, message_class=cfmessage.CfMessage, errors=grib_errors,
+    )
+    # NOTE: the messages are decoded once, to frame them and to index them
+    for message in reader:
+        builder.add_message(message)
+    return builder.build(**kwargs)
+
+
+def open_file_hypercubes(path, grib_errors='warn', **kwargs):
+    """Open a GRIB file as a list of ``cfgrib.Dataset``, one for every compatible hypercube."""
+    stream = messages.FileStream(path, message_class=cfmessage.CfMessage, errors=grib_errors)
+    return [Dataset(*c) for c in build_hypercubes_components(stream, **kwargs)]
@@ -172,6 +172,27 @@ void codes_index_delete(codes_index* index);
 */
 grib_handle* codes_handle_new_from_file(grib_context* c, FILE* f, ProductKind product, int* error);
 
+/**
+*  Create a handle from a user message. The message is copied and will be freed with the handle
+*
+* @param c           : the context from which the handle will be created (NULL for default context)
+* @param data        : the actual message
+* @param data_len    : the length of the message in number of bytes
+* @return            the new handle, NULL if the message is invalid or a problem is encountered
+*/
+codes_handle* codes_handle_new_from_message_copy(codes_context* c, const void* data, size_t data_len);
+
+/**
+*  Create a handle from a user message in memory. The message will not be freed at the end.
+*  The message will be copied as soon as a modification is needed.
+*
+* @param c           : the context from which the handle will be created (NULL for default context)
+* @param data        : the actual message
+* @param data_len    : the length of the message in number of bytes
+* @return            the new handle, NULL if the message is invalid or a problem is encountered
+*/
+codes_handle* codes_handle_new_from_message(codes_context* c, const void* data, size_t data_len);
+
 /**
 *  Write a coded message to a file.
 *
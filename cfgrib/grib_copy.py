@@ -0,0 +1,230 @@
+#
+# Copyright 2017-2019 European Centre for Medium-Range Weather Forecasts (ECMWF).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Authors:
+#   Alessandro Amici - B-Open - https://bopen.eu
+#
+"""
+Copy the GRIB messages matching some keys into new files, like ``grib_copy -w``, without
+decoding them.
+
+Messages are selected from the index and their raw bytes are copied by offset and length,
+adjacent messages in one go. Local files are copied by the kernel with ``copy_file_range``
+or ``sendfile`` when available, other sources in large sequential reads.
+The fields of multi-field messages are written as standalone messages.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+from builtins import str
+
+import collections
+import errno
+import io
+import os
+import string
+import typing as T  # noqa
+
+from . import cfmessage
+from . import messages
+from . import sources
+
+# bytes copied by one system call or one read from the source
+COPY_CHUNK_SIZE = 2 ** 24
+
+# NOTE: errors meaning that the kernel copy is not supported for the given files
+KERNEL_COPY_ERRNOS = {
+    getattr(errno, name, None) for name in ['EXDEV', 'ENOSYS', 'EINVAL', 'EBADF', 'ENOTSUP']
+}
+
+
+def parse_filter_by_keys(text):
+    # type: (str) -> T.Dict[str, T.Any]
+    """
+    Return the ``filter_by_keys`` of a ``key=value,...`` string, as given to ``grib_copy -w``.
+    Values are converted to ``int`` or ``float`` when possible, as they are in the index.
+    """
+    filter_by_keys = collections.OrderedDict()  # type: T.Dict[str, T.Any]
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        key, sep, value = item.partition('=')
+        if not sep or not key.strip():
+            raise ValueError("filter must be in the form key=value, got %r" % item)
+        value = value.strip()
+        for value_type in [int, float]:
+            try:
+                value = value_type(value)
+                break
+            except ValueError:
+                pass
+        filter_by_keys[key.strip()] = value
+    return filter_by_keys
+
+
+def outpath_keys(outpath):
+    # type: (str) -> T.List[str]
+    """Return the names of the ``{key}`` placeholders in ``outpath``."""
+    keys = []  # type: T.List[str]
+    for _, key, _, _ in string.Formatter().parse(outpath):
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def message_ranges(index, offsets):
+    # type: (messages.FileIndex, T.Iterable[int]) -> T.List[T.Tuple[int, int]]
+    """
+    Return the ``(offset, length)`` byte ranges of the messages at ``offsets``, in file order
+    and with adjacent messages merged in a single range. The fields of multi-field messages
+    are returned as ``((offset, field_number), None)``.
+    """
+    lengths = getattr(index, 'lengths', None) or {}
+    source = index.filestream.byte_source
+    ranges = []  # type: T.List[T.Tuple[T.Any, T.Any]]
+    for offset in sorted(offsets, key=index.offset_key):
+        if isinstance(offset, tuple):
+            ranges.append((offset, None))
+            continue
+        length = lengths.get(offset)
+        if not length:
+            # NOTE: indexes written by older versions of cfgrib lack the message lengths
+            length = sources.read_message_length(source, offset)
+        if ranges and ranges[-1][1] is not None and sum(ranges[-1]) == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+    return ranges
+
+
+def copy_file_range(in_fd, out_fd, offset, count):
+    # type: (int, int, int, int) -> int
+    return os.copy_file_range(in_fd, out_fd, count, offset)  # type: ignore
+
+
+def sendfile(in_fd, out_fd, offset, count):
+    # type: (int, int, int, int) -> int
+    return os.sendfile(out_fd, in_fd, offset, count)  # type: ignore
+
+
+KERNEL_COPY_FUNCTIONS = [
+    function for function in [copy_file_range, sendfile] if hasattr(os, function.__name__)
+]
+
+
+def kernel_copy(in_fd, out_fd, offset, length, chunk_size=COPY_CHUNK_SIZE):
+    # type: (int, int, int, int, int) -> int
+    """
+    Copy ``length`` bytes at ``offset`` of ``in_fd`` to the current position of ``out_fd``
+    inside the kernel. Return the number of bytes copied, less if not supported.
+    """
+    copied = 0
+    for copy_function in KERNEL_COPY_FUNCTIONS:
+        try:
+            while copied < length:
+                count = copy_function(
+                    in_fd, out_fd, offset + copied, min(length - copied, chunk_size),
+                )
+                if count == 0:
+                    return copied
+                copied += count
+            return copied
+        except OSError as ex:
+            if ex.errno not in KERNEL_COPY_ERRNOS:
+                raise
+    return copied
+
+
+def copy_ranges(source, ranges, outfile, chunk_size=COPY_CHUNK_SIZE):
+    # type: (sources.ByteSource, T.List[T.Tuple[T.Any, T.Any]], T.IO[bytes], int) -> None
+    """Write the bytes of the ``ranges`` of ``source`` to the binary file object ``outfile``."""
+    # NOTE: the kernel copy needs a plain local file on both sides, compressed files are not
+    in_file = None
+    try:
+        out_fd = outfile.fileno()
+    except (AttributeError, IOError, OSError):
+        out_fd = None
+    if out_fd is not None and KERNEL_COPY_FUNCTIONS and \
+            isinstance(source, sources.FileSource) and source.raw is source:
+        in_file = io.open(source.path, 'rb')
+    try:
+        for offset, length in ranges:
+            if isinstance(offset, tuple):
+                outfile.write(sources.read_field(source, *offset))
+                continue
+            copied = 0
+            if in_file is not None:
+                outfile.flush()
+                copied = kernel_copy(in_file.fileno(), out_fd, offset, length, chunk_size)
+                if copied < length:
+                    # NOTE: fall back to plain reads for the rest of the file
+                    in_file.close()
+                    in_file = None
+            while copied < length:
+                chunk = source.read(offset + copied, min(length - copied, chunk_size))
+                if not chunk:
+                    raise EOFError("truncated GRIB message at offset %d" % (offset + copied))
+                outfile.write(chunk)
+                copied += len(chunk)
+    finally:
+        if in_file is not None:
+            in_file.close()
+
+
+def copy_messages(index, outfile, filter_by_keys={}, chunk_size=COPY_CHUNK_SIZE, **query):
+    # type: (messages.FileIndex, T.IO[bytes], T.Dict[str, T.Any], int, T.Any) -> int
+    """
+    Write the raw bytes of the messages of ``index`` matching ``filter_by_keys`` and ``query``
+    to the binary file object ``outfile`` in file order. Return the number of messages.
+    """
+    if filter_by_keys or query:
+        index = index.subindex(filter_by_keys, **query)
+    offsets = [offset for _, offsets_values in index.offsets for offset in offsets_values]
+    ranges = message_ranges(index, offsets)
+    copy_ranges(index.filestream.byte_source, ranges, outfile, chunk_size=chunk_size)
+    return len(offsets)
+
+
+def copy_file(path, outpath, filter_by_keys={}, indexpath=messages.DEFAULT_INDEXPATH,
+              source=None, chunk_size=COPY_CHUNK_SIZE):
+    # type: (str, str, T.Dict[str, T.Any], str, T.Any, int) -> T.Dict[str, int]
+    """
+    Copy the messages of the GRIB file ``path`` matching ``filter_by_keys`` to ``outpath``.
+
+    ``outpath`` may contain ``{key}`` placeholders, e.g. ``'{shortName}_{level}.grib'``,
+    then the messages are split in one file per value of the keys, like with
+    ``grib_copy in.grib 'out_[shortName].grib'``. Only the index is decoded, not the messages.
+    Return the number of messages written to every output file.
+    """
+    split_keys = outpath_keys(outpath)
+    index_keys = sorted(set(filter_by_keys) | set(split_keys))
+    # NOTE: the index of the files already opened with open_dataset is reused
+    filestream = messages.FileStream(path, message_class=cfmessage.CfMessage, source=source)
+    index = filestream.index(index_keys, indexpath=indexpath).subindex(filter_by_keys)
+
+    outpaths_offsets = collections.OrderedDict()  # type: T.Dict[str, T.List[int]]
+    for offset, header_values in index.iter_messages():
+        values = dict(zip(index.index_keys, header_values))
+        outpaths_offsets.setdefault(outpath.format(**values), []).append(offset)
+
+    counts = collections.OrderedDict()  # type: T.Dict[str, int]
+    for file_outpath, offsets in outpaths_offsets.items():
+        if filestream.is_local and os.path.exists(file_outpath) and \
+                os.path.samefile(file_outpath, path):
+            raise ValueError("output file %r is the input file" % file_outpath)
+        ranges = message_ranges(index, offsets)
+        with io.open(file_outpath, 'wb') as outfile:
+            copy_ranges(filestream.byte_source, ranges, outfile, chunk_size=chunk_size)
+        counts[str(file_outpath)] = len(offsets)
+    return counts
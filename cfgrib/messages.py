@@ -20,33 +20,63 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 from builtins import bytes, isinstance, str, type
 
-# Python 2 compatibility bit not in python-future
-try:
-    FileExistsError
-except NameError:
-    FileExistsError = OSError
-
 import collections
 import contextlib
+import copy
+import functools
 import hashlib
 import io
 import logging
 import os
 import pickle
+import time
 import typing as T
+import uuid
 
 import attr
 
 from . import bindings
+from . import sources
 
+# advisory file locks are not available on Windows
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+# Python 2 compatibility bit not in python-future
+compat_replace = getattr(os, 'replace', os.rename)
 
 LOG = logging.getLogger(__name__)
 _MARKER = object()
 
+# size of the end of the scanned part of a GRIB file that is checked to detect appends
+TAIL_CHECKSUM_SIZE = 65536
+FINGERPRINT_SIZE = 65536
+
+DEFAULT_INDEXPATH = '{path}.{short_hash}.idx'
+
+# seconds to wait for another process building the same index, 0 disables the lock
+INDEX_LOCK_TIMEOUT = 120.
+
+# environment variables configuring the central index cache, size is in bytes
+INDEX_CACHE_DIR_ENV = 'CFGRIB_INDEX_CACHE_DIR'
+INDEX_CACHE_MAX_SIZE_ENV = 'CFGRIB_INDEX_CACHE_MAX_SIZE'
+DEFAULT_INDEX_CACHE_MAX_SIZE = 2 ** 30
+
+# statistics of the values of every field computed by ecCodes, optionally kept in the index
+STATISTICS_KEYS = ['min', 'max', 'average', 'bitmapPresent', 'numberOfMissing']
+
+# policies for the messages with the same header values, see FileIndex.deduplicate,
+#   the fingerprint is the MD5 of the raw data section computed by ecCodes without decoding it
+DUPLICATES_POLICIES = ['keep', 'warn', 'first', 'last']
+DATA_FINGERPRINT_KEY = 'md5DataSection'
+
 #
-# No explicit support for MULTI-FIELD at Message level.
+# No explicit support for MULTI-FIELD at Message level, ecCodes decodes the first field only.
+# GRIB 2 multi-field messages are split in standalone messages, one per field, while scanning
+# and the fields are indexed by ``(offset, field_number)``, see ``sources.split_fields``.
 #
-# bindings.codes_grib_multi_support_on()
 
 
 @attr.attrs()
@@ -58,6 +88,11 @@ class Message(collections.MutableMapping):
         default='warn',
         validator=attr.validators.in_(['ignore', 'warn', 'raise']),
     )
+    # NOTE: the position of the message in its source, needed when the handle is created from
+    #   the bytes of the message as the ecCodes 'offset' key is then always 0
+    offset = attr.attrib(default=None, repr=False, type=T.Optional[int])
+    # NOTE: the bytes of the message must outlive a handle created without copying them
+    buffer = attr.attrib(default=None, repr=False, cmp=False)
 
     @classmethod
     def from_file(cls, file, offset=None, product_kind=bindings.CODES_PRODUCT_GRIB, **kwargs):
@@ -67,6 +102,25 @@ class Message(collections.MutableMapping):
         codes_id = bindings.codes_handle_new_from_file(file, product_kind)
         return cls(codes_id=codes_id, **kwargs)
 
+    @classmethod
+    def from_bytes(cls, data, offset=None, copy=False, **kwargs):
+        # type: (T.Any, int, bool, T.Any) -> Message
+        """
+        Return the Message in the ``data`` buffer. Unless ``copy`` is true the handle points
+        into ``data`` that is then kept alive by the Message and must not be modified.
+        """
+        if copy:
+            codes_id = bindings.codes_handle_new_from_message_copy(data)
+            return cls(codes_id=codes_id, offset=offset, **kwargs)
+        codes_id = bindings.codes_handle_new_from_message(data)
+        return cls(codes_id=codes_id, offset=offset, buffer=data, **kwargs)
+
+    def message_offset(self):
+        # type: () -> int
+        if self.offset is not None:
+            return self.offset
+        return self.message_get('offset', bindings.CODES_TYPE_LONG)
+
     @classmethod
     def from_sample_name(cls, sample_name, product_kind=bindings.CODES_PRODUCT_GRIB, **kwargs):
         codes_id = bindings.codes_new_from_samples(sample_name.encode('ASCII'), product_kind)
@@ -100,6 +154,39 @@ class Message(collections.MutableMapping):
             return values[0]
         return values
 
+    def message_get_many(self, items, schema=None, default=None):
+        # type: (T.Sequence[str], T.Sequence[T.Tuple[int, ...]], T.Any) -> T.List[T.Any]
+        """Get the values of many keys with a single bindings call, ``default`` if missing."""
+        keys = [item.encode(self.encoding) for item in items]
+        values = bindings.codes_get_many(self.codes_id, keys, schema, default=_MARKER)
+        for i, value in enumerate(values):
+            if value is _MARKER:
+                values[i] = default
+            elif isinstance(value, bytes):
+                values[i] = value.decode(self.encoding)
+            elif isinstance(value, list) and value and isinstance(value[0], bytes):
+                values[i] = [v.decode(self.encoding) for v in value]
+        return values
+
+    def is_multi_field(self):
+        # type: () -> bool
+        """True if the message is a GRIB 2 message with more fields after the first one."""
+        # NOTE: messages decoded from a buffer are checked on the raw bytes without ecCodes calls
+        if self.buffer is not None:
+            return sources.is_multi_field(self.buffer)
+        keys = ['edition', 'totalLength', 'offsetSection7', 'section7Length']
+        edition, total_length, section7_offset, section7_length = self.message_get_many(keys)
+        if edition != 2 or None in (total_length, section7_offset, section7_length):
+            return False
+        return section7_offset + section7_length + len(sources.END_MARKER) < total_length
+
+    def message_bytes(self):
+        # type: () -> T.Any
+        """Return the coded message, as the buffer it was decoded from when available."""
+        if self.buffer is not None:
+            return self.buffer
+        return bindings.codes_get_message(self.codes_id)
+
     def message_set(self, item, value):
         # type: (str, T.Any) -> None
         key = item.encode(self.encoding)
@@ -182,6 +269,23 @@ class ComputedKeysMessage(Message):
             if key not in seen:
                 yield key
 
+    def message_get_many(self, items, schema=None, default=None):
+        # type: (T.Sequence[str], T.Sequence[T.Tuple[int, ...]], T.Any) -> T.List[T.Any]
+        if schema is None:
+            schema = [()] * len(items)
+        coded = [(i, s) for i, s in zip(items, schema) if i not in self.computed_keys]
+        coded_values = super(ComputedKeysMessage, self).message_get_many(
+            [i for i, _ in coded], [s for _, s in coded], default=default,
+        )
+        values = dict(zip([i for i, _ in coded], coded_values))
+        for item in items:
+            if item in self.computed_keys:
+                try:
+                    values[item] = self[item]
+                except:
+                    values[item] = default
+        return [values[item] for item in items]
+
     def __setitem__(self, item, value):
         if item in self.computed_keys:
             _, setter = self.computed_keys[item]
@@ -210,23 +314,77 @@ def make_message_schema(message, schema_keys, log=LOG):
     return schema
 
 
+def field_from_source(message_class, source, offset, **kwargs):
+    # type: (T.Type[Message], sources.ByteSource, T.Tuple[int, int], T.Any) -> Message
+    """Return the field at ``offset``, the ``(offset, field_number)`` in a multi-field message."""
+    message_offset, field_number = offset
+    data = sources.read_field(source, message_offset, field_number)
+    return message_class.from_bytes(data, offset=offset, **kwargs)
+
+
 @attr.attrs()
 class FileStream(collections.Iterable):
-    """Iterator-like access to a filestream of Messages."""
+    """
+    Iterator-like access to a filestream of Messages.
+
+    The bytes are read from the local file ``path`` unless a ``sources.ByteSource`` is given,
+    in that case ``path`` is only a label, e.g. the URL, used in the index and in the dataset.
+    Compressed files are detected and read via a ``sources.CompressedSource``.
+    """
     path = attr.attrib(type=str)
     message_class = attr.attrib(default=Message, type=Message, repr=False)
     errors = attr.attrib(
         default='warn',
         validator=attr.validators.in_(['ignore', 'warn', 'raise']),
     )
+    source = attr.attrib(default=None, cmp=False, repr=False, type=T.Optional[sources.ByteSource])
+
+    def __attrs_post_init__(self):
+        if self.source is None:
+            self.source = sources.open_source(self.path)
+
+    def index_copy(self):
+        # type: () -> FileStream
+        """Return a copy to be saved in the index file."""
+        # NOTE: the source is not saved in the index file, it may be a large buffer or
+        #   a connection, but compressed sources are saved with their seek points
+        if isinstance(self.source, sources.CompressedSource):
+            return self
+        # NOTE: copy instead of evolve, so that the source isn't opened again from the path
+        filestream = copy.copy(self)
+        filestream.source = None
+        return filestream
+
+    @property
+    def byte_source(self):
+        # type: () -> sources.ByteSource
+        if self.source is None:
+            return sources.FileSource(self.path)
+        return self.source
+
+    @property
+    def is_local(self):
+        # type: () -> bool
+        """True if ``path`` is the local file the bytes are read from."""
+        source = self.byte_source
+        return isinstance(source, sources.FileSource) and source.path == self.path
 
     def __iter__(self):
         # type: () -> T.Generator[Message, None, None]
-        with open(self.path, 'rb') as file:
+        return self.iter_from_offset()
+
+    def __aiter__(self):
+        """Support ``async for``, messages are read on the default ``cfgrib.aio`` executor."""
+        from . import aio
+        return aio.iter_messages_async(self)
+
+    def iter_from_offset(self, offset=0):
+        # type: (int) -> T.Generator[Message, None, None]
+        with self.message_scanner(offset) as next_message:
             valid_grib_message_found = False
             while True:
                 try:
-                    yield self.message_from_file(file, errors=self.errors)
+                    fields = self.message_fields(next_message(errors=self.errors))
                     valid_grib_message_found = True
                 except EOFError:
                     if not valid_grib_message_found:
@@ -239,17 +397,360 @@ class FileStream(collections.Iterable):
                         raise
                     else:
                         LOG.exception("skipping corrupted Message")
+                    continue
+                for field in fields:
+                    yield field
+
+    def message_fields(self, message):
+        # type: (Message) -> T.List[Message]
+        """
+        Return the fields of ``message`` as Messages, more than one only for GRIB 2 multi-field
+        messages, whose fields have ``(offset, field_number)`` offsets.
+        """
+        if not message.is_multi_field():
+            return [message]
+        offset = message.message_offset()
+        fields = sources.split_fields(message.message_bytes())
+        return [
+            self.message_class.from_bytes(data, offset=(offset, i), errors=self.errors)
+            for i, data in enumerate(fields)
+        ]
 
     def message_from_file(self, file, offset=None, **kwargs):
+        if isinstance(offset, tuple):
+            source = sources.FileObjectSource(file)
+            return field_from_source(self.message_class, source, offset, **kwargs)
         return self.message_class.from_file(file=file, offset=offset, **kwargs)
 
+    def message_from_buffer(self, buffer, offset=0, **kwargs):
+        # type: (T.Any, int, T.Any) -> Message
+        """Return the Message at ``offset`` in ``buffer``, e.g. a ``mmap``, without copies."""
+        data = sources.message_view(buffer, offset)
+        return self.message_class.from_bytes(data, offset=offset, **kwargs)
+
+    def message_from_source(self, source, offset, **kwargs):
+        # type: (sources.ByteSource, T.Any, T.Any) -> Message
+        if isinstance(offset, tuple):
+            return field_from_source(self.message_class, source, offset, **kwargs)
+        if source.buffer is not None:
+            return self.message_from_buffer(source.buffer, offset, **kwargs)
+        data = sources.read_message(source, offset)
+        return self.message_class.from_bytes(data, offset=offset, **kwargs)
+
+    @contextlib.contextmanager
+    def message_scanner(self, offset=0):
+        # type: (int) -> T.Generator[T.Callable[..., Message], None, None]
+        """Context manager returning a function that reads the next Message from ``offset``."""
+        if self.source is None:
+            with open(self.path, 'rb') as file:
+                file.seek(offset)
+                yield functools.partial(self.message_from_file, file)
+            return
+
+        source = sources.read_ahead(self.source)
+        position = [offset]
+
+        def next_message(**kwargs):
+            message_offset = sources.find_message(source, position[0])
+            # NOTE: on errors the scan goes on after the start of the broken message
+            position[0] = message_offset + 1
+            message = self.message_from_source(source, message_offset, **kwargs)
+            position[0] = message_offset + len(message.buffer)
+            return message
+
+        yield next_message
+
+    @contextlib.contextmanager
+    def message_reader(self):
+        # type: () -> T.Generator[T.Callable[[T.Any], Message], None, None]
+        """Context manager returning a function that reads the Message at the given offset."""
+        if self.source is None:
+            with open(self.path, 'rb') as file:
+                yield functools.partial(self.message_from_file, file)
+        else:
+            yield functools.partial(self.message_from_source, sources.read_ahead(self.source))
+
+    @contextlib.contextmanager
+    def data_reader(self):
+        # type: () -> T.Generator[T.Callable[[T.Any], bytes], None, None]
+        """
+        Context manager returning a function that reads the bytes of the message at the given
+        offset, without decoding them with ecCodes.
+        """
+        source = sources.read_ahead(self.byte_source)
+
+        def data_from_offset(offset):
+            if isinstance(offset, tuple):
+                return sources.read_field(source, *offset)
+            return sources.read_message(source, offset)
+
+        yield data_from_offset
+
+    def first(self):
+        # type: () -> Message
+        return next(iter(self))
+
+    def index(
+            self, index_keys, indexpath='{path}.{short_hash}.idx', statistics=False,
+            duplicates='keep',
+    ):
+        # type: (T.List[str], str, bool, str) -> FileIndex
+        return FileIndex.from_indexpath_or_filestream(
+            self, index_keys, indexpath, statistics=statistics, duplicates=duplicates,
+        )
+
+
+@attr.attrs()
+class StreamReader(collections.Iterable):
+    """
+    Iterator-like access to the Messages of a non-seekable binary stream, e.g. a pipe or
+    a socket, read incrementally with only the current message in memory.
+    """
+    fileobj = attr.attrib()
+    message_class = attr.attrib(default=Message, type=Message, repr=False)
+    errors = attr.attrib(
+        default='warn',
+        validator=attr.validators.in_(['ignore', 'warn', 'raise']),
+    )
+
+    def __iter__(self):
+        # type: () -> T.Generator[Message, None, None]
+        framer = sources.MessageFramer(self.fileobj)
+        while True:
+            try:
+                offset, data = framer.next_message()
+                yield self.message_class.from_bytes(data, offset=offset, errors=self.errors)
+            except EOFError as ex:
+                if framer.buffer.startswith(sources.GRIB_MARKER):
+                    LOG.warning("discarding incomplete message at the end of the stream: %s", ex)
+                break
+            except Exception:
+                if self.errors == 'ignore':
+                    pass
+                elif self.errors == 'raise':
+                    raise
+                else:
+                    LOG.exception("skipping corrupted Message")
+
+
+@attr.attrs()
+class MultiFileStream(collections.Iterable):
+    """Iterator-like access to the Messages of a sequence of GRIB files."""
+    paths = attr.attrib(type=T.Tuple[str, ...], converter=tuple)
+    message_class = attr.attrib(default=Message, type=Message, repr=False)
+    errors = attr.attrib(
+        default='warn',
+        validator=attr.validators.in_(['ignore', 'warn', 'raise']),
+    )
+
+    @property
+    def path(self):
+        # type: () -> str
+        """A short label for the files, the common prefix followed by ``*`` for many files."""
+        if len(self.paths) == 1:
+            return self.paths[0]
+        return os.path.commonprefix(self.paths) + '*'
+
+    @property
+    def filestreams(self):
+        # type: () -> T.List[FileStream]
+        kwargs = {'message_class': self.message_class, 'errors': self.errors}
+        return [FileStream(path, **kwargs) for path in self.paths]
+
+    def __iter__(self):
+        # type: () -> T.Generator[Message, None, None]
+        for filestream in self.filestreams:
+            for message in filestream:
+                yield message
+
+    @contextlib.contextmanager
+    def message_reader(self):
+        # type: () -> T.Generator[T.Callable[[T.Any], Message], None, None]
+        """
+        Context manager returning a function that reads the Message at the given
+        ``(file_number, offset)``. Only one file at a time is kept open.
+        """
+        opened = {}  # type: T.Dict[int, T.IO[bytes]]
+
+        def message_from_offset(offset):
+            file_number, file_offset = offset
+            if file_number not in opened:
+                for file in opened.values():
+                    file.close()
+                opened.clear()
+                opened[file_number] = open(self.paths[file_number], 'rb')
+            if isinstance(file_offset, tuple):
+                source = sources.FileObjectSource(opened[file_number])
+                return field_from_source(self.message_class, source, file_offset)
+            return self.message_class.from_file(file=opened[file_number], offset=file_offset)
+
+        try:
+            yield message_from_offset
+        finally:
+            for file in opened.values():
+                file.close()
+
+    @contextlib.contextmanager
+    def data_reader(self):
+        # type: () -> T.Generator[T.Callable[[T.Any], bytes], None, None]
+        """
+        Context manager returning a function that reads the bytes of the message at the given
+        ``(file_number, offset)``. Only one file at a time is kept open.
+        """
+        opened = {}  # type: T.Dict[int, sources.ByteSource]
+
+        def data_from_offset(offset):
+            file_number, file_offset = offset
+            if file_number not in opened:
+                opened.clear()
+                source = sources.FileSource(self.paths[file_number])
+                opened[file_number] = sources.read_ahead(source)
+            if isinstance(file_offset, tuple):
+                return sources.read_field(opened[file_number], *file_offset)
+            return sources.read_message(opened[file_number], file_offset)
+
+        yield data_from_offset
+
     def first(self):
         # type: () -> Message
         return next(iter(self))
 
-    def index(self, index_keys, indexpath='{path}.{short_hash}.idx'):
-        # type: (T.List[str], str) -> FileIndex
-        return FileIndex.from_indexpath_or_filestream(self, index_keys, indexpath)
+    def index(
+            self, index_keys, indexpath='{path}.{short_hash}.idx', catalogpath='',
+            statistics=False, duplicates='keep',
+    ):
+        # type: (T.List[str], str, str, bool, str) -> CatalogIndex
+        return CatalogIndex.from_catalogpath_or_filestream(
+            self, index_keys, indexpath=indexpath, catalogpath=catalogpath,
+            statistics=statistics, duplicates=duplicates,
+        )
+
+
+def filestream_kind(filestream):
+    # type: (FileStream) -> str
+    """Return the settings of ``filestream`` that change the content of its index."""
+    message_class = filestream.message_class
+    return repr((message_class.__module__ + '.' + message_class.__name__, filestream.errors))
+
+
+@attr.attrs()
+class IndexCache(object):
+    """
+    Directory storing the index files of GRIB files found anywhere, e.g. on read-only mounts.
+
+    Index files are named after the absolute path, size and mtime of the GRIB file and
+    the message class. When a new index file makes the cache bigger than ``max_size`` bytes
+    the least recently used index files are removed.
+    """
+    root = attr.attrib(type=str)
+    max_size = attr.attrib(default=DEFAULT_INDEX_CACHE_MAX_SIZE, type=int, converter=int)
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        # type: (T.Mapping[str, str]) -> T.Optional[IndexCache]
+        root = environ.get(INDEX_CACHE_DIR_ENV)
+        if not root:
+            return None
+        return cls(root, environ.get(INDEX_CACHE_MAX_SIZE_ENV, DEFAULT_INDEX_CACHE_MAX_SIZE))
+
+    def indexpath(self, filestream):
+        # type: (FileStream) -> str
+        source = filestream.byte_source.raw
+        location = os.path.abspath(filestream.path) if filestream.is_local else filestream.path
+        key = repr((location, source.size(), source.mtime(), filestream_kind(filestream)))
+        if not os.path.isdir(self.root):
+            try:
+                os.makedirs(self.root)
+            except OSError:
+                pass  # another process may have created it in the meantime
+        return os.path.join(self.root, hashlib.md5(key.encode('utf-8')).hexdigest() + '.idx')
+
+    def entries(self):
+        # type: () -> T.List[T.Tuple[float, int, str]]
+        """Return the ``(mtime, size, path)`` of the index files, least recently used first."""
+        entries = []
+        for name in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            if not name.endswith('.idx'):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # removed by another process
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def remove_leftovers(self, max_age=INDEX_LOCK_TIMEOUT, log=LOG):
+        # type: (float, logging.Logger) -> None
+        """
+        Remove the lock files not in use and the temporary files older than ``max_age`` seconds,
+        left behind by interrupted processes.
+        """
+        names = os.listdir(self.root) if os.path.isdir(self.root) else []
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                if name.endswith('.lock') and fcntl is not None:
+                    # NOTE: lock files are removed while locked, as in index_lock
+                    file = try_lock_file(path)
+                    if file is not None:
+                        with file:
+                            os.unlink(path)
+                elif name.endswith(('.lock', '.tmp')) and \
+                        os.path.getmtime(path) <= time.time() - max_age:
+                    os.unlink(path)
+            except (IOError, OSError):
+                log.info("Can't remove file %r", path)
+
+    def evict(self, max_size=None, keep=(), log=LOG):
+        # type: (int, T.Container[str], logging.Logger) -> int
+        """Remove the least recently used index files to fit ``max_size``, return the size."""
+        if max_size is None:
+            max_size = self.max_size
+        self.remove_leftovers(log=log)
+        entries = self.entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= max_size:
+                break
+            if path in keep:
+                continue
+            try:
+                os.unlink(path)
+                total_size -= size
+            except OSError:
+                log.info("Can't remove index file %r", path)
+        return total_size
+
+    def clean(self, log=LOG):
+        # type: (logging.Logger) -> int
+        self.remove_leftovers(max_age=0, log=log)
+        return self.evict(max_size=0, log=log)
+
+    def index(
+            self,
+            filestream,  # type: FileStream
+            index_keys,  # type: T.List[str]
+            index_class,  # type: T.Type[FileIndex]
+            log=LOG,  # type: logging.Logger
+            statistics=False,  # type: bool
+            duplicates='keep',  # type: str
+    ):
+        # type: (...) -> FileIndex
+        indexpath = self.indexpath(filestream)
+        is_new = not os.path.exists(indexpath)
+        file_index = index_class.from_indexpath_or_filestream(
+            filestream, index_keys, indexpath, log, statistics=statistics, duplicates=duplicates,
+        )
+        try:
+            if is_new:
+                self.evict(keep=[indexpath], log=log)
+            else:
+                # NOTE: the mtime of the index file records its last use
+                os.utime(indexpath, None)
+        except OSError:
+            log.info("Can't update index cache for %r", indexpath)
+        return file_index
 
 
 @contextlib.contextmanager
@@ -264,80 +765,509 @@ def compat_create_exclusive(path, *args, **kwargs):
             raise
 
 
+def compute_tail_checksum(source, size, tail_size=TAIL_CHECKSUM_SIZE):
+    # type: (sources.ByteSource, int, int) -> str
+    """Return the checksum of the ``tail_size`` bytes before ``size`` in ``source``."""
+    start = max(0, size - tail_size)
+    return hashlib.md5(source.read(start, size - start)).hexdigest()
+
+
+def compute_fingerprint(source, size, fingerprint_size=FINGERPRINT_SIZE):
+    # type: (sources.ByteSource, int, int) -> str
+    """
+    Return the checksum of the first and of the last ``fingerprint_size`` bytes of the first
+    ``size`` bytes in ``source``, cheap to compute even for very large files.
+    """
+    checksum = hashlib.md5(('%d:' % size).encode('ascii'))
+    checksum.update(source.read(0, min(size, fingerprint_size)))
+    start = max(fingerprint_size, size - fingerprint_size)
+    if start < size:
+        checksum.update(source.read(start, size - start))
+    return checksum.hexdigest()
+
+
+def read_header_values(message, schema):
+    # type: (Message, T.Dict[str, T.Any]) -> T.Tuple[T.Any, ...]
+    values = message.message_get_many(list(schema), list(schema.values()), default='undef')
+    return tuple(tuple(v) if isinstance(v, list) else v for v in values)
+
+
+@attr.attrs()
+class HeaderReader(object):
+    """
+    Read the header values of the ``keys`` from messages, using a schema of the keys computed
+    on the first message of each GRIB edition.
+    """
+    keys = attr.attrib(type=T.List[str])
+    schemas = attr.attrib(default=attr.Factory(dict), init=False, repr=False)
+
+    def schema(self, message):
+        # type: (Message) -> T.Dict[str, T.Any]
+        edition = message.message_get('edition', bindings.CODES_TYPE_LONG, default=None)
+        if edition not in self.schemas:
+            self.schemas[edition] = make_message_schema(message, self.keys)
+        return self.schemas[edition]
+
+    def __call__(self, message):
+        # type: (Message) -> T.Tuple[T.Any, ...]
+        return read_header_values(message, self.schema(message))
+
+
+def try_lock_file(lockpath):
+    # type: (str) -> T.Optional[T.IO[bytes]]
+    """Return the file ``lockpath`` open and exclusively locked, None if it is already locked."""
+    file = io.open(lockpath, 'ab')
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # NOTE: the previous holder removes the lock file before unlocking it, in that case
+        #   the lock must be taken on the new file at the same path
+        if os.path.samestat(os.fstat(file.fileno()), os.stat(lockpath)):
+            return file
+    except (IOError, OSError):
+        pass
+    file.close()
+    return None
+
+
+@contextlib.contextmanager
+def index_lock(lockpath, timeout=INDEX_LOCK_TIMEOUT, log=LOG):
+    # type: (str, float, logging.Logger) -> T.Generator[bool, None, None]
+    """
+    Advisory lock serialising the processes building the same index, yields True if locked.
+    If the lock can't be used or it is not obtained within ``timeout`` seconds, go on unlocked.
+    """
+    try:
+        if fcntl is None or timeout <= 0:
+            raise OSError("index lock disabled")
+        deadline = time.time() + timeout
+        file = try_lock_file(lockpath)
+        while file is None and time.time() <= deadline:
+            time.sleep(0.1)
+            file = try_lock_file(lockpath)
+    except (IOError, OSError):
+        yield False
+        return
+    if file is None:
+        log.warning("Timeout waiting for lock %r, going on without it", lockpath)
+        yield False
+        return
+    with file:
+        try:
+            yield True
+        finally:
+            # NOTE: the lock file is removed while still locked, the processes waiting on it
+            #   see that it was removed and lock a new one, see try_lock_file
+            try:
+                os.unlink(lockpath)
+            except OSError:
+                pass
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
 @attr.attrs()
 class FileIndex(collections.Mapping):
     filestream = attr.attrib(type=FileStream)
     index_keys = attr.attrib(type=T.List[str])
     offsets = attr.attrib(repr=False, type=T.List[T.Tuple[T.Tuple[T.Any, ...], T.List[int]]])
+    # NOTE: scanned_size is the end of the last indexed message, not necessarily the file size
+    scanned_size = attr.attrib(default=None, repr=False, type=T.Optional[int])
+    tail_checksum = attr.attrib(default=None, repr=False, type=T.Optional[str])
+    # NOTE: file_size is the size of the file when last scanned, fingerprint is computed on it
+    file_size = attr.attrib(default=None, repr=False, type=T.Optional[int])
+    fingerprint = attr.attrib(default=None, repr=False, type=T.Optional[str])
+    # NOTE: lengths maps the offset of every message to its length in bytes
+    lengths = attr.attrib(default=None, repr=False, type=T.Optional[T.Dict[T.Any, int]])
+    # NOTE: statistics maps the offset of every message to the values of STATISTICS_KEYS,
+    #   it is None unless requested as computing them decodes all the fields
+    statistics = attr.attrib(
+        default=None, repr=False, type=T.Optional[T.Dict[T.Any, T.Tuple[T.Any, ...]]],
+    )
+    # NOTE: data_fingerprints maps the offset of the messages with duplicate header values to
+    #   the DATA_FINGERPRINT_KEY, it is None unless requested by a ``duplicates`` policy
+    data_fingerprints = attr.attrib(
+        default=None, repr=False, type=T.Optional[T.Dict[T.Any, str]],
+    )
 
     @classmethod
-    def from_filestream(cls, filestream, index_keys):
-        # FIXME: using `Message.message_get` with an explicit message schema was a significant
-        #   optimization at some point, due to less calls to the slow CFFI ABI interface.
-        #   This doesn't appear to be reproducible at the moment so the optimisation is
-        #   disabled and we may choose to remove `make_message_schema` altogether.
-        schema = make_message_schema(filestream.first(), index_keys)
-        offsets = collections.OrderedDict()
-        for message in filestream:
-            header_values = []
-            for key, args in schema.items():
-                try:
-                    # if args and not key == 'time':
-                    #     value = message.message_get(key, *args)
-                    # else:
-                    value = message[key]
-                except:
-                    value = 'undef'
-                if isinstance(value, list):
-                    value = tuple(value)
-                header_values.append(value)
-            offset = message.message_get('offset', bindings.CODES_TYPE_LONG)
-            offsets.setdefault(tuple(header_values), []).append(offset)
-        return cls(filestream=filestream, index_keys=index_keys, offsets=list(offsets.items()))
+    def from_filestream(cls, filestream, index_keys, statistics=False, duplicates='keep'):
+        self = cls(
+            filestream=filestream, index_keys=index_keys, offsets=[], scanned_size=0, lengths={},
+            statistics={} if statistics else None,
+        )
+        self.scan_messages(filestream)
+        if duplicates != 'keep':
+            self = self.extend_data_fingerprints()
+        return self
+
+    def scan_messages(self, messages):
+        # type: (T.Iterable[Message]) -> None
+        """Add the ``messages`` to the index and move ``scanned_size`` past the last one."""
+        # NOTE: the size is taken before scanning, so that data appended while scanning is not
+        #   covered by the fingerprint and is picked up by ``extend_appended`` later
+        source = self.filestream.byte_source
+        file_size = source.raw.size()
+        offsets = collections.OrderedDict(self.offsets)
+        lengths = dict(getattr(self, 'lengths', None) or {})
+        statistics = getattr(self, 'statistics', None)
+        if statistics is not None:
+            statistics = dict(statistics)
+            statistics_reader = HeaderReader(STATISTICS_KEYS)
+        header_reader = HeaderReader(self.index_keys)
+        message_offset, length = None, 0
+        for message in messages:
+            header_values = header_reader(message)
+            offset = message.message_offset()
+            offsets.setdefault(header_values, []).append(offset)
+            if statistics is not None:
+                statistics[offset] = statistics_reader(message)
+            if not isinstance(offset, tuple):
+                message_offset = offset
+                length = message.message_get('totalLength', bindings.CODES_TYPE_LONG, default=0)
+            elif offset[0] != message_offset:
+                # NOTE: the length of a field is the one of the multi-field message to read
+                message_offset = offset[0]
+                length = sources.read_message_length(source, message_offset)
+            lengths[offset] = length
+            self.scanned_size = max(self.scanned_size, message_offset + length)
+        self.offsets = list(offsets.items())
+        self.lengths = lengths
+        self.statistics = statistics
+        # NOTE: data appended to compressed files are always re-scanned
+        self.tail_checksum = None
+        if source.raw is source:
+            self.tail_checksum = compute_tail_checksum(source, self.scanned_size)
+        self.file_size = file_size
+        self.fingerprint = compute_fingerprint(source.raw, file_size)
+        if hasattr(self, '_header_values'):
+            del self._header_values
+
+    def extend_appended(self, log=LOG):
+        # type: (logging.Logger) -> bool
+        """
+        Index the messages appended to the file since the last scan. Return False if the
+        file has changed in any other way and the index cannot be extended.
+        """
+        # NOTE: indexes written by older versions of cfgrib lack the attributes
+        if getattr(self, 'scanned_size', None) is None or \
+                getattr(self, 'tail_checksum', None) is None:
+            return False
+        source = self.filestream.byte_source
+        if source.size() < self.scanned_size:
+            return False
+        if compute_tail_checksum(source, self.scanned_size) != self.tail_checksum:
+            return False
+        try:
+            self.scan_messages(self.filestream.iter_from_offset(self.scanned_size))
+        except EOFError:
+            log.info("no new complete message in %r", self.filestream.path)
+        return True
+
+    def extend_index_keys(self, index_keys):
+        # type: (T.List[str]) -> FileIndex
+        """
+        Return an index with the ``index_keys`` added as new columns, reading them from the
+        headers of the messages at the indexed offsets instead of scanning the whole file.
+        """
+        new_keys = [k for k in index_keys if k not in self.index_keys]
+        if not new_keys:
+            return self
+        header_reader = HeaderReader(new_keys)
+        offsets = collections.OrderedDict()  # type: T.Dict[T.Tuple[T.Any, ...], T.List[T.Any]]
+        with self.filestream.message_reader() as message_from_offset:
+            for offset, header_values in self.iter_messages():
+                new_values = header_reader(message_from_offset(offset))
+                offsets.setdefault(header_values + new_values, []).append(offset)
+        return attr.evolve(
+            self, index_keys=list(self.index_keys) + new_keys, offsets=list(offsets.items()),
+        )
+
+    def extend_statistics(self):
+        # type: () -> FileIndex
+        """
+        Return an index with the ``STATISTICS_KEYS`` of every message, decoding only the
+        messages at the indexed offsets that lack them.
+        """
+        statistics = getattr(self, 'statistics', None)
+        missing = [o for o, _ in self.iter_messages() if statistics is None or o not in statistics]
+        if statistics is not None and not missing:
+            return self
+        statistics = dict(statistics or {})
+        statistics_reader = HeaderReader(STATISTICS_KEYS)
+        with self.filestream.message_reader() as message_from_offset:
+            for offset in missing:
+                statistics[offset] = statistics_reader(message_from_offset(offset))
+        return attr.evolve(self, statistics=statistics)
+
+    def extend_data_fingerprints(self):
+        # type: () -> FileIndex
+        """
+        Return an index with the data fingerprints of the messages with duplicate header
+        values, reading only the messages that lack them.
+        """
+        data_fingerprints = getattr(self, 'data_fingerprints', None)
+        missing = [
+            o for _, offsets_values in self.offsets if len(offsets_values) > 1
+            for o in offsets_values if data_fingerprints is None or o not in data_fingerprints
+        ]
+        if data_fingerprints is not None and not missing:
+            return self
+        data_fingerprints = dict(data_fingerprints or {})
+        with self.filestream.message_reader() as message_from_offset:
+            for offset in missing:
+                data_fingerprints[offset] = message_from_offset(offset).message_get(
+                    DATA_FINGERPRINT_KEY, default='undef',
+                )
+        return attr.evolve(self, data_fingerprints=data_fingerprints)
+
+    def duplicates(self):
+        # type: () -> T.Dict[T.Tuple[T.Any, ...], T.List[T.Tuple[T.Any, str]]]
+        """
+        Return the ``(offset, fingerprint)`` of the messages with the same header values, by
+        header values. Messages with different fingerprints have different data.
+        Only the messages with duplicate header values and no cached fingerprint are read.
+        """
+        data_fingerprints = self.extend_data_fingerprints().data_fingerprints
+        duplicates = collections.OrderedDict()  # type: T.Dict[T.Any, T.List[T.Any]]
+        for header_values, offsets_values in self.offsets:
+            if len(offsets_values) > 1:
+                duplicates[header_values] = [(o, data_fingerprints[o]) for o in offsets_values]
+        return duplicates
+
+    def deduplicate(self, policy='first', log=LOG):
+        # type: (str, logging.Logger) -> FileIndex
+        """
+        Return an index with the messages with the same header values handled according to
+        ``policy``: ``'keep'`` all of them without checks, ``'warn'`` keep all of them and log
+        a warning, ``'first'`` or ``'last'`` keep only the first or the last in file order.
+        Messages with the same header values and different data are logged as warnings.
+        """
+        if policy not in DUPLICATES_POLICIES:
+            raise ValueError("policy must be one of %r, not %r" % (DUPLICATES_POLICIES, policy))
+        if policy == 'keep':
+            return self
+        duplicates = self.duplicates()
+        if not duplicates:
+            return self
+        for header_values, items in duplicates.items():
+            if len(set(fingerprint for _, fingerprint in items)) > 1:
+                log.warning(
+                    "%d messages with the same header values and different data at offsets %r: %r",
+                    len(items), [o for o, _ in items], dict(zip(self.index_keys, header_values)),
+                )
+        count = sum(len(items) - 1 for items in duplicates.values())
+        if policy == 'warn':
+            log.warning("%d duplicate messages in %r", count, self.filestream.path)
+            return self
+        log.info("ignoring %d duplicate messages in %r", count, self.filestream.path)
+        position = 0 if policy == 'first' else -1
+        offsets = [
+            (hv, [offsets_values[position]] if hv in duplicates else offsets_values)
+            for hv, offsets_values in self.offsets
+        ]
+        return attr.evolve(self, offsets=offsets)
+
+    def select_index_keys(self, index_keys):
+        # type: (T.List[str]) -> FileIndex
+        """Return an index on the ``index_keys`` only, they must be already indexed."""
+        if list(index_keys) == list(self.index_keys):
+            return self
+        columns = [self.index_keys.index(k) for k in index_keys]
+        offsets = collections.OrderedDict()  # type: T.Dict[T.Tuple[T.Any, ...], T.List[T.Any]]
+        for header_values, offsets_values in self.offsets:
+            selected_values = tuple(header_values[c] for c in columns)
+            offsets.setdefault(selected_values, []).extend(offsets_values)
+        # NOTE: the offsets of merged groups are sorted back in file order, as in a full scan
+        offsets_items = [
+            (hv, sorted(offsets_values, key=self.offset_key))
+            for hv, offsets_values in offsets.items()
+        ]
+        return attr.evolve(self, index_keys=list(index_keys), offsets=offsets_items)
+
+    def matches_file(self):
+        # type: () -> bool
+        """
+        Return True if the file has the same size and fingerprint it had when it was indexed,
+        regardless of its path and modification time.
+        """
+        # NOTE: indexes written by older versions of cfgrib lack the attributes
+        file_size = getattr(self, 'file_size', None)
+        if file_size is None or getattr(self, 'fingerprint', None) is None:
+            return False
+        source = self.filestream.byte_source.raw
+        if source.size() != file_size:
+            return False
+        return compute_fingerprint(source, file_size) == self.fingerprint
 
     @classmethod
     def from_indexpath(cls, indexpath):
         with io.open(indexpath, 'rb') as file:
             return pickle.load(file)
 
+    def to_indexpath(self, indexpath):
+        # type: (str) -> None
+        # NOTE: the index is written to a temporary file and renamed atomically, so readers
+        #   never see a partially written index file
+        tmppath = '%s.%s.tmp' % (indexpath, uuid.uuid4().hex[:8])
+        index = self
+        if isinstance(self.filestream, FileStream):
+            index = copy.copy(self)
+            index.filestream = self.filestream.index_copy()
+        with compat_create_exclusive(tmppath) as file:
+            pickle.dump(index, file)
+        try:
+            compat_replace(tmppath, indexpath)
+        except Exception:
+            os.unlink(tmppath)
+            raise
+
     @classmethod
     def from_indexpath_or_filestream(
-            cls, filestream, index_keys, indexpath='{path}.{short_hash}.idx', log=LOG,
+            cls,
+            filestream,  # type: FileStream
+            index_keys,  # type: T.List[str]
+            indexpath=DEFAULT_INDEXPATH,  # type: T.Union[str, IndexCache]
+            log=LOG,  # type: logging.Logger
+            statistics=False,  # type: bool
+            duplicates='keep',  # type: str
     ):
-        # type: (FileStream, T.List[str], str, logging.Logger) -> FileIndex
+        # type: (...) -> FileIndex
+
+        # The index files can be kept in a central cache instead of next to the GRIB files,
+        # that is the only place for the index of non-local GRIB files.
+        if indexpath == DEFAULT_INDEXPATH:
+            indexpath = IndexCache.from_env() or (indexpath if filestream.is_local else '')
 
         # Reading and writing the index can be explicitly suppressed by passing indexpath==''.
         if not indexpath:
-            return cls.from_filestream(filestream, index_keys)
+            return cls.from_filestream(
+                filestream, index_keys, statistics=statistics, duplicates=duplicates,
+            )
+        if isinstance(indexpath, IndexCache):
+            return indexpath.index(
+                filestream, index_keys, cls, log=log, statistics=statistics, duplicates=duplicates,
+            )
 
-        hash = hashlib.md5(repr(index_keys).encode('utf-8')).hexdigest()
+        # NOTE: the index file doesn't depend on the index keys, missing keys are added to it
+        hash = hashlib.md5(filestream_kind(filestream).encode('utf-8')).hexdigest()
         indexpath = indexpath.format(path=filestream.path, hash=hash, short_hash=hash[:5])
-        try:
-            with compat_create_exclusive(indexpath) as new_index_file:
-                self = cls.from_filestream(filestream, index_keys)
-                pickle.dump(self, new_index_file)
-                return self
-        except FileExistsError:
-            pass
-        except Exception:
-            log.exception("Can't create file %r", indexpath)
+        index_mtime = os.path.getmtime(indexpath) if os.path.exists(indexpath) else None
+        self = cls.from_valid_indexpath(filestream, indexpath, log=log)
+        if self is not None:
+            return self.update_index(index_keys, indexpath, statistics, duplicates, log=log)
+
+        with index_lock(indexpath + '.lock', log=log) as locked:
+            # NOTE: the index may have been published by another process while waiting
+            if locked and os.path.exists(indexpath) and \
+                    os.path.getmtime(indexpath) != index_mtime:
+                self = cls.from_valid_indexpath(filestream, indexpath, log=log)
+                if self is not None:
+                    return self.update_index(
+                        index_keys, indexpath, statistics, duplicates, log=log,
+                    )
+            self = cls.from_filestream(
+                filestream, index_keys, statistics=statistics, duplicates=duplicates,
+            )
+            try:
+                self.to_indexpath(indexpath)
+            except Exception:
+                log.exception("Can't create file %r", indexpath)
+        return self
 
+    def update_index(self, index_keys, indexpath, statistics=False, duplicates='keep', log=LOG):
+        # type: (T.List[str], str, bool, str, logging.Logger) -> FileIndex
+        """
+        Return the index on ``index_keys`` with the statistics and the data fingerprints needed
+        by the ``duplicates`` policy, adding what is missing to the index file.
+        """
+        if statistics:
+            self = self.update_statistics(indexpath, log=log)
+        if duplicates != 'keep':
+            self = self.update_data_fingerprints(indexpath, log=log)
+        return self.update_index_keys(index_keys, indexpath, log=log)
+
+    def update_index_keys(self, index_keys, indexpath, log=LOG):
+        # type: (T.List[str], str, logging.Logger) -> FileIndex
+        """
+        Return the index on ``index_keys``, adding the missing keys to the index file so that
+        the union of all the keys ever requested is kept in one index file.
+        """
+        if any(k not in self.index_keys for k in index_keys):
+            self = self.extend_index_keys(index_keys)
+            try:
+                self.to_indexpath(indexpath)
+            except Exception:
+                log.exception("Can't update index file %r", indexpath)
+        return self.select_index_keys(index_keys)
+
+    def update_statistics(self, indexpath, log=LOG):
+        # type: (str, logging.Logger) -> FileIndex
+        """Return the index with the statistics of all messages, adding them to the index file."""
+        index = self.extend_statistics()
+        if index is not self:
+            try:
+                index.to_indexpath(indexpath)
+            except Exception:
+                log.exception("Can't update index file %r", indexpath)
+        return index
+
+    def update_data_fingerprints(self, indexpath, log=LOG):
+        # type: (str, logging.Logger) -> FileIndex
+        """
+        Return the index with the data fingerprints of the messages with duplicate header
+        values, adding them to the index file so that later opens don't read the messages.
+        """
+        index = self.extend_data_fingerprints()
+        if index is not self:
+            try:
+                index.to_indexpath(indexpath)
+            except Exception:
+                log.exception("Can't update index file %r", indexpath)
+        return index
+
+    @classmethod
+    def from_valid_indexpath(cls, filestream, indexpath, log=LOG):
+        # type: (FileStream, str, logging.Logger) -> T.Optional[FileIndex]
+        """
+        Return the index read from ``indexpath`` if it is valid for ``filestream``,
+        on the index keys it was built with.
+        """
+        if not os.path.exists(indexpath):
+            return None
         try:
             index_mtime = os.path.getmtime(indexpath)
-            filestream_mtime = os.path.getmtime(filestream.path)
-            if index_mtime >= filestream_mtime:
-                self = cls.from_indexpath(indexpath)
-                if getattr(self, 'index_keys', None) == index_keys and \
-                        getattr(self, 'filestream', None) == filestream:
-                    return self
-                else:
-                    log.warning("Ignoring index file %r incompatible with GRIB file", indexpath)
+            filestream_mtime = filestream.byte_source.mtime()
+            self = cls.from_indexpath(indexpath)
+            indexed_filestream = getattr(self, 'filestream', None)
+            if not isinstance(getattr(self, 'index_keys', None), list) or \
+                    not isinstance(indexed_filestream, FileStream) or \
+                    attr.evolve(indexed_filestream, path=filestream.path) != filestream:
+                log.warning("Ignoring index file %r incompatible with GRIB file", indexpath)
+                return None
+            # NOTE: the index is checked against the file content, so it is still valid when
+            #   the file and the index are copied or moved together to another location
+            self.filestream = filestream
+            if self.matches_file():
+                if isinstance(indexed_filestream.source, sources.CompressedSource) and \
+                        isinstance(filestream.source, sources.CompressedSource):
+                    filestream.source.seek_points = indexed_filestream.source.seek_points
+                return self
+            elif getattr(self, 'fingerprint', None) is None and filestream_mtime is not None \
+                    and index_mtime >= filestream_mtime \
+                    and indexed_filestream.path == filestream.path:
+                # NOTE: indexes written by older versions of cfgrib can only be checked by mtime
+                return self
+            elif self.extend_appended():
+                # NOTE: the GRIB file has only grown, so the index is updated in place
+                try:
+                    self.to_indexpath(indexpath)
+                except Exception:
+                    log.exception("Can't update index file %r", indexpath)
+                return self
             else:
-                log.warning("Ignoring index file %r older than GRIB file", indexpath)
+                log.warning("Ignoring index file %r not matching the GRIB file", indexpath)
         except Exception:
             log.exception("Can't read index file %r", indexpath)
-
-        return cls.from_filestream(filestream, index_keys)
+        return None
 
     def __iter__(self):
         return iter(self.index_keys)
@@ -345,6 +1275,14 @@ class FileIndex(collections.Mapping):
     def __len__(self):
         return len(self.index_keys)
 
+    @staticmethod
+    def offset_key(offset):
+        # type: (T.Any) -> T.Tuple[int, int]
+        """Sort key of an offset, the fields of multi-field messages have tuple offsets."""
+        if isinstance(offset, tuple):
+            return offset
+        return (offset, 0)
+
     @property
     def header_values(self):
         if not hasattr(self, '_header_values'):
@@ -376,9 +1314,183 @@ class FileIndex(collections.Mapping):
                     break
             else:
                 offsets.append((header_values, offsets_values))
-        return type(self)(filestream=self.filestream, index_keys=self.index_keys, offsets=offsets)
+        return type(self)(
+            filestream=self.filestream, index_keys=self.index_keys, offsets=offsets,
+            lengths=getattr(self, 'lengths', None), statistics=getattr(self, 'statistics', None),
+            data_fingerprints=getattr(self, 'data_fingerprints', None),
+        )
+
+    def partition(self, key):
+        # type: (str) -> T.Dict[T.Any, FileIndex]
+        """Split the index in one sub-index per value of ``key`` with a single pass."""
+        idx = self.index_keys.index(key)
+        groups = collections.OrderedDict()  # type: T.Dict[T.Any, T.List[T.Any]]
+        for header_values, offsets_values in self.offsets:
+            groups.setdefault(header_values[idx], []).append((header_values, offsets_values))
+        subindexes = collections.OrderedDict()
+        for value, offsets in groups.items():
+            subindexes[value] = type(self)(
+                filestream=self.filestream, index_keys=self.index_keys, offsets=offsets,
+                lengths=getattr(self, 'lengths', None),
+                statistics=getattr(self, 'statistics', None),
+                data_fingerprints=getattr(self, 'data_fingerprints', None),
+            )
+        return subindexes
+
+    def iter_messages(self):
+        # type: () -> T.Iterator[T.Tuple[T.Any, T.Tuple[T.Any, ...]]]
+        """Iterate over the ``(offset, header_values)`` of the indexed messages in file order."""
+        messages = [(o, hv) for hv, offsets_values in self.offsets for o in offsets_values]
+        return iter(sorted(messages, key=lambda item: self.offset_key(item[0])))
+
+    def to_table(self, filter_by_keys={}, **query):
+        # type: (T.Dict[str, T.Any], T.Any) -> T.Dict[str, T.List[T.Any]]
+        """
+        Return the inventory of the indexed messages as a table of columns, one for every index
+        key plus ``offset`` and ``length``, with one row per message in file order.
+        The table is built from the index alone, the GRIB file is not read.
+        Optionally only the messages matching ``filter_by_keys`` and ``query`` are listed.
+        """
+        index = self.subindex(filter_by_keys, **query) if filter_by_keys or query else self
+        lengths = getattr(self, 'lengths', None) or {}
+        table = collections.OrderedDict()  # type: T.Dict[str, T.List[T.Any]]
+        for key in list(self.index_keys) + ['offset', 'length']:
+            table[key] = []
+        for offset, header_values in index.iter_messages():
+            for key, value in zip(self.index_keys, header_values):
+                table[key].append(value)
+            table['offset'].append(offset)
+            table['length'].append(lengths.get(offset))
+        return table
+
+    def to_dataframe(self, filter_by_keys={}, **query):
+        # type: (T.Dict[str, T.Any], T.Any) -> T.Any
+        """Return the inventory of ``to_table`` as a ``pandas.DataFrame``."""
+        import pandas as pd
+
+        return pd.DataFrame(self.to_table(filter_by_keys, **query))
 
     def first(self):
-        with open(self.filestream.path) as file:
-            first_offset = self.offsets[0][1][0]
-            return self.filestream.message_from_file(file, offset=first_offset)
+        with self.filestream.message_reader() as message_from_offset:
+            return message_from_offset(self.offsets[0][1][0])
+
+
+@attr.attrs()
+class CatalogIndex(FileIndex):
+    """
+    Index of the messages of a MultiFileStream, offsets are ``(file_number, offset)`` tuples.
+    """
+    # NOTE: file_sizes and fingerprints are the ones of every file when the catalog was built
+    file_sizes = attr.attrib(default=None, repr=False, type=T.Optional[T.List[int]])
+    fingerprints = attr.attrib(default=None, repr=False, type=T.Optional[T.List[str]])
+
+    @staticmethod
+    def offset_key(offset):
+        # type: (T.Any) -> T.Tuple[int, ...]
+        file_number, file_offset = offset
+        return (file_number,) + FileIndex.offset_key(file_offset)
+
+    @classmethod
+    def from_filestream(
+            cls, filestream, index_keys, indexpath='{path}.{short_hash}.idx', statistics=False,
+            duplicates='keep',
+    ):
+        # NOTE: the catalog is the merge of the per-file indexes, that are read or written as usual
+        offsets = collections.OrderedDict()
+        lengths = {}
+        all_statistics = {} if statistics else None
+        file_sizes = []
+        fingerprints = []
+        data_fingerprints = {}  # type: T.Dict[T.Any, str]
+        for file_number, file_filestream in enumerate(filestream.filestreams):
+            source = file_filestream.byte_source.raw
+            file_sizes.append(source.size())
+            fingerprints.append(compute_fingerprint(source, file_sizes[-1]))
+            file_index = FileIndex.from_indexpath_or_filestream(
+                file_filestream, index_keys, indexpath, statistics=statistics,
+                duplicates=duplicates,
+            )
+            for header_values, file_offsets in file_index.offsets:
+                values = offsets.setdefault(header_values, [])
+                values.extend((file_number, offset) for offset in file_offsets)
+            file_lengths = getattr(file_index, 'lengths', None) or {}
+            for offset, length in file_lengths.items():
+                lengths[(file_number, offset)] = length
+            if all_statistics is not None:
+                for offset, values in file_index.statistics.items():
+                    all_statistics[(file_number, offset)] = values
+            for offset, fingerprint in (file_index.data_fingerprints or {}).items():
+                data_fingerprints[(file_number, offset)] = fingerprint
+        self = cls(
+            filestream=filestream, index_keys=index_keys, offsets=list(offsets.items()),
+            lengths=lengths, statistics=all_statistics, file_sizes=file_sizes,
+            fingerprints=fingerprints, data_fingerprints=data_fingerprints,
+        )
+        # NOTE: messages with the same header values may be in different files
+        if duplicates != 'keep':
+            self = self.extend_data_fingerprints()
+        return self
+
+    def matches_file(self):
+        # type: () -> bool
+        """
+        Return True if every file has the same size and fingerprint it had when the catalog
+        was built, regardless of the modification times.
+        """
+        # NOTE: catalogs written by older versions of cfgrib lack the attributes
+        file_sizes = getattr(self, 'file_sizes', None)
+        fingerprints = getattr(self, 'fingerprints', None)
+        filestreams = self.filestream.filestreams
+        if file_sizes is None or fingerprints is None or len(file_sizes) != len(filestreams):
+            return False
+        for file_filestream, file_size, fingerprint in zip(filestreams, file_sizes, fingerprints):
+            source = file_filestream.byte_source.raw
+            if source.size() != file_size or compute_fingerprint(source, file_size) != fingerprint:
+                return False
+        return True
+
+    def to_table(self, filter_by_keys={}, **query):
+        # type: (T.Dict[str, T.Any], T.Any) -> T.Dict[str, T.List[T.Any]]
+        """Return the inventory of ``FileIndex.to_table`` with the ``path`` of every message."""
+        table = super(CatalogIndex, self).to_table(filter_by_keys, **query)
+        file_offsets = table.pop('offset')
+        length = table.pop('length')
+        table['path'] = [self.filestream.paths[file_number] for file_number, _ in file_offsets]
+        table['offset'] = [offset for _, offset in file_offsets]
+        table['length'] = length
+        return table
+
+    @classmethod
+    def from_catalogpath_or_filestream(
+            cls, filestream, index_keys, indexpath='{path}.{short_hash}.idx', catalogpath='',
+            log=LOG, statistics=False, duplicates='keep',
+    ):
+        # type: (MultiFileStream, T.List[str], str, str, logging.Logger, bool, str) -> CatalogIndex
+        kwargs = {'statistics': statistics, 'duplicates': duplicates}
+
+        # The catalog is only persisted when an explicit catalogpath is given.
+        if not catalogpath:
+            return cls.from_filestream(filestream, index_keys, indexpath, **kwargs)
+
+        try:
+            self = cls.from_indexpath(catalogpath)
+            if getattr(self, 'index_keys', None) != index_keys or \
+                    getattr(self, 'filestream', None) != filestream or \
+                    (statistics and getattr(self, 'statistics', None) is None) or \
+                    (duplicates != 'keep' and getattr(self, 'data_fingerprints', None) is None):
+                log.warning("Ignoring catalog %r incompatible with GRIB files", catalogpath)
+            elif self.matches_file():
+                return self
+            else:
+                log.warning("Ignoring catalog file %r not matching the GRIB files", catalogpath)
+        except (IOError, OSError):
+            pass
+        except Exception:
+            log.exception("Can't read catalog file %r", catalogpath)
+
+        self = cls.from_filestream(filestream, index_keys, indexpath, **kwargs)
+        try:
+            self.to_indexpath(catalogpath)
+        except Exception:
+            log.exception("Can't create file %r", catalogpath)
+        return self
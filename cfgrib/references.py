@@ -0,0 +1,258 @@
+#
+# Copyright 2017-2019 European Centre for Medium-Range Weather Forecasts (ECMWF).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Authors:
+#   Alessandro Amici - B-Open - https://bopen.eu
+#
+"""
+Byte-range reference manifests of a ``cfgrib.Dataset`` following the *kerchunk* / Zarr
+reference file system JSON convention (version 1).
+
+Coordinates are stored inline, every field of a data variable is a Zarr chunk that references
+the ``[path, offset, length]`` of its GRIB message, decoded by the ``grib`` filter.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+from builtins import int, str
+
+import base64
+import collections
+import io
+import json
+import typing as T  # noqa
+
+import numpy as np
+
+from . import bindings
+from . import cfmessage
+from . import dataset
+from . import messages
+
+REFERENCES_VERSION = 1
+ZARR_FORMAT = 2
+GRIB_FILTER_ID = 'grib'
+INLINE_PREFIX = 'base64:'
+
+
+def json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError("Object of type %r is not JSON serializable" % type(obj))
+
+
+def encode_json(obj):
+    # type: (T.Any) -> str
+    return json.dumps(obj, default=json_default)
+
+
+def decode_json(value):
+    # type: (T.Any) -> T.Dict[str, T.Any]
+    # NOTE: some tools store the Zarr metadata as JSON objects instead of JSON strings
+    if isinstance(value, collections.Mapping):
+        return value
+    return json.loads(value, object_pairs_hook=collections.OrderedDict)
+
+
+def decode_attributes(value):
+    # type: (T.Any) -> T.Dict[str, T.Any]
+    # NOTE: array attributes are tuples in ``cfgrib.Dataset``, as the header values in the index
+    attributes = collections.OrderedDict()
+    for key, item in decode_json(value).items():
+        attributes[key] = tuple(item) if isinstance(item, list) else item
+    return attributes
+
+
+def chunk_key(indexes):
+    # type: (T.Sequence[int]) -> str
+    # NOTE: the only chunk of a 0-dimensional Zarr array has key '0'
+    return '.'.join(str(i) for i in indexes) or '0'
+
+
+def iter_field_locations(data):
+    # type: (dataset.OnDiskArray) -> T.Iterator[T.Tuple[T.Tuple[int, ...], str, int, int]]
+    """Yield the ``header_indexes, path, offset, length`` of the GRIB messages of ``data``."""
+    stream = data.stream
+    lengths = data.lengths or {}
+    with stream.message_reader() as message_from_offset:
+        for header_indexes, offsets in data.offsets.items():
+            offset = offsets[0]
+            file_offset = offset[1] if isinstance(stream, messages.MultiFileStream) else offset
+            if isinstance(file_offset, tuple):
+                raise ValueError("fields of multi-field GRIB messages can't be referenced")
+            length = lengths.get(offset)
+            if length is None:
+                message = message_from_offset(offset)
+                length = message.message_get('totalLength', bindings.CODES_TYPE_LONG)
+            if isinstance(stream, messages.MultiFileStream):
+                yield header_indexes, stream.paths[offset[0]], file_offset, length
+            else:
+                yield header_indexes, stream.path, offset, length
+
+
+def build_field_references(name, data):
+    # type: (str, dataset.OnDiskArray) -> T.Dict[str, T.Any]
+    header_ndim = len(data.shape) - data.geo_ndim
+    zarray = {
+        'zarr_format': ZARR_FORMAT,
+        'shape': [int(s) for s in data.shape],
+        'chunks': [1] * header_ndim + [int(s) for s in data.shape[header_ndim:]],
+        'dtype': data.dtype.str,
+        'fill_value': 'NaN',
+        'order': 'C',
+        'compressor': None,
+        'filters': [{'id': GRIB_FILTER_ID, 'var': name, 'dtype': data.dtype.name}],
+    }
+    refs = collections.OrderedDict([(name + '/.zarray', encode_json(zarray))])
+    for header_indexes, path, offset, length in iter_field_locations(data):
+        key = chunk_key(tuple(header_indexes) + (0,) * data.geo_ndim)
+        refs[name + '/' + key] = [path, offset, length]
+    return refs
+
+
+def build_inline_references(name, data):
+    # type: (str, T.Any) -> T.Dict[str, T.Any]
+    array = np.asarray(data)
+    if array.dtype.hasobject:
+        raise ValueError("can't store variable %r of dtype %r inline" % (name, array.dtype))
+    zarray = {
+        'zarr_format': ZARR_FORMAT,
+        'shape': list(array.shape),
+        'chunks': list(array.shape),
+        'dtype': array.dtype.str,
+        'fill_value': None,
+        'order': 'C',
+        'compressor': None,
+        'filters': None,
+    }
+    inline_data = INLINE_PREFIX + base64.b64encode(array.tobytes()).decode('ascii')
+    return collections.OrderedDict([
+        (name + '/.zarray', encode_json(zarray)),
+        (name + '/' + chunk_key([0] * array.ndim), inline_data),
+    ])
+
+
+def build_references(ds):
+    # type: (dataset.Dataset) -> T.Dict[str, T.Any]
+    """Return the reference manifest of ``ds``, the GRIB files are read only for old indexes."""
+    refs = collections.OrderedDict()  # type: T.Dict[str, T.Any]
+    refs['.zgroup'] = encode_json({'zarr_format': ZARR_FORMAT})
+    refs['.zattrs'] = encode_json(ds.attributes)
+    for name, var in ds.variables.items():
+        attributes = dict(var.attributes)
+        attributes['_ARRAY_DIMENSIONS'] = list(var.dimensions)
+        refs[name + '/.zattrs'] = encode_json(attributes)
+        if isinstance(var.data, dataset.OnDiskArray):
+            refs.update(build_field_references(name, var.data))
+        else:
+            refs.update(build_inline_references(name, var.data))
+    return collections.OrderedDict([('version', REFERENCES_VERSION), ('refs', refs)])
+
+
+def write_references(ds, path):
+    # type: (dataset.Dataset, str) -> None
+    with io.open(path, 'w', encoding='utf-8') as file:
+        file.write(str(json.dumps(build_references(ds))))
+
+
+def open_field_references(name, zarray, chunks, attributes, grib_errors='warn'):
+    # type: (str, T.Dict[str, T.Any], T.Dict[str, T.Any], T.Dict[str, T.Any], str) -> T.Any
+    filters = zarray.get('filters') or []
+    if [f.get('id') for f in filters] != [GRIB_FILTER_ID] or zarray.get('compressor'):
+        raise ValueError("unsupported filters for variable %r: %r" % (name, filters))
+    shape = tuple(zarray['shape'])
+    geo_ndim = 0
+    for size, chunk_size in reversed(list(zip(shape, zarray['chunks']))):
+        if size != chunk_size:
+            break
+        geo_ndim += 1
+    header_ndim = len(shape) - geo_ndim
+
+    paths = []  # type: T.List[str]
+    locations = []
+    for key, ref in chunks.items():
+        if not isinstance(ref, list) or len(ref) != 3:
+            raise ValueError("unsupported reference for chunk %r of %r: %r" % (key, name, ref))
+        path, offset, _ = ref
+        if path not in paths:
+            paths.append(path)
+        header_indexes = tuple(int(i) for i in key.split('.')[:header_ndim])
+        locations.append((header_indexes, paths.index(path), offset))
+
+    if len(paths) > 1:
+        stream = messages.MultiFileStream(
+            paths, message_class=cfmessage.CfMessage, errors=grib_errors,
+        )
+        offsets = {hi: [(n, o)] for hi, n, o in locations}
+    else:
+        stream = messages.FileStream(
+            paths[0] if paths else '', message_class=cfmessage.CfMessage, errors=grib_errors,
+        )
+        offsets = {hi: [o] for hi, _, o in locations}
+    return dataset.OnDiskArray(
+        stream=stream, shape=shape, offsets=collections.OrderedDict(sorted(offsets.items())),
+        missing_value=attributes.get('GRIB_missingValue', 9999), geo_ndim=geo_ndim,
+    )
+
+
+def open_inline_references(name, zarray, chunks):
+    # type: (str, T.Dict[str, T.Any], T.Dict[str, T.Any]) -> np.ndarray
+    shape = tuple(zarray['shape'])
+    if zarray.get('filters') or zarray.get('compressor') or list(shape) != zarray['chunks']:
+        raise ValueError("only uncompressed single chunk coordinates are supported: %r" % name)
+    inline_data = chunks.get(chunk_key([0] * len(shape)))
+    if not isinstance(inline_data, str) or not inline_data.startswith(INLINE_PREFIX):
+        raise ValueError("missing inline data for variable %r" % name)
+    buffer = base64.b64decode(inline_data[len(INLINE_PREFIX):])
+    return np.frombuffer(buffer, dtype=np.dtype(zarray['dtype'])).reshape(shape).copy()
+
+
+def open_references(references, grib_errors='warn'):
+    # type: (T.Union[str, T.Dict[str, T.Any]], str) -> dataset.Dataset
+    """
+    Open a reference manifest, given as a dict or the path to a JSON file, as a
+    ``cfgrib.Dataset``. Data are read from the referenced GRIB messages, without any index.
+    """
+    source = ''
+    if not isinstance(references, collections.Mapping):
+        source = references
+        with io.open(references, encoding='utf-8') as file:
+            references = json.load(file, object_pairs_hook=collections.OrderedDict)
+    if references.get('version') != REFERENCES_VERSION:
+        raise ValueError("unsupported references version: %r" % references.get('version'))
+
+    arrays = collections.OrderedDict()  # type: T.Dict[str, T.Dict[str, T.Any]]
+    for key, value in references['refs'].items():
+        name, _, item = key.rpartition('/')
+        if name:
+            arrays.setdefault(name, collections.OrderedDict())[item] = value
+
+    dimensions = collections.OrderedDict()  # type: T.Dict[str, int]
+    variables = collections.OrderedDict()  # type: T.Dict[str, dataset.Variable]
+    for name, items in arrays.items():
+        zarray = decode_json(items.pop('.zarray'))
+        attributes = decode_attributes(items.pop('.zattrs', '{}'))
+        dims = tuple(attributes.pop('_ARRAY_DIMENSIONS', ()))
+        if zarray.get('filters'):
+            data = open_field_references(name, zarray, items, attributes, grib_errors)
+        else:
+            data = open_inline_references(name, zarray, items)
+        for dim, size in zip(dims, zarray['shape']):
+            dimensions.setdefault(dim, size)
+        variables[name] = dataset.Variable(dimensions=dims, data=data, attributes=attributes)
+    attributes = decode_attributes(references['refs'].get('.zattrs', '{}'))
+    encoding = {'source': source}
+    return dataset.Dataset(dimensions, variables, attributes, encoding)
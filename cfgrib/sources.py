@@ -0,0 +1,704 @@
+#
+# Copyright 2017-2019 European Centre for Medium-Range Weather Forecasts (ECMWF).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Authors:
+#   Alessandro Amici - B-Open - https://bopen.eu
+#
+"""
+Byte sources give random access to the bytes of a GRIB file that is not necessarily
+a local file, e.g. a memory buffer, an ``fsspec`` file object or an HTTP URL.
+
+GRIB messages are located by their section 0 and read with one range read each,
+sources that expose a ``buffer``, e.g. a ``mmap``, are decoded in place without copies.
+Compressed files are read decompressing from the nearest seek point.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+from builtins import bytes, int
+
+import bisect
+import bz2
+import io
+import mmap
+import os
+import struct
+import threading
+import typing as T  # noqa
+import zlib
+
+import attr
+
+GRIB_MARKER = b'GRIB'
+END_MARKER = b'7777'
+SECTION0_SIZE = 16
+FIND_CHUNK_SIZE = 65536
+
+# bytes read at once from non-local sources, large enough to hold a few typical messages
+READ_AHEAD_SIZE = 2 ** 20
+
+COMPRESSION_MAGICS = [
+    ('gzip', b'\x1f\x8b'),
+    ('bz2', b'BZh'),
+    ('xz', b'\xfd7zXZ\x00'),
+    ('zstd', b'\x28\xb5\x2f\xfd'),
+]
+# compressed bytes read at once and uncompressed bytes between in-memory gzip checkpoints
+COMPRESSED_CHUNK_SIZE = 65536
+CHECKPOINT_SIZE = 2 ** 22
+
+
+class ByteSource(object):
+    """Random access to the bytes of a GRIB file."""
+
+    def size(self):
+        # type: () -> int
+        raise NotImplementedError
+
+    def read(self, offset, length):
+        # type: (int, int) -> bytes
+        """Return at most ``length`` bytes from ``offset``, less only at the end of the data."""
+        raise NotImplementedError
+
+    def mtime(self):
+        # type: () -> T.Optional[float]
+        return None
+
+    @property
+    def buffer(self):
+        # type: () -> T.Any
+        """The whole data as an object supporting the buffer protocol, if available."""
+        return None
+
+    @property
+    def raw(self):
+        # type: () -> ByteSource
+        """The source of the stored bytes, e.g. the compressed file, used to detect changes."""
+        return self
+
+
+@attr.attrs()
+class FileSource(ByteSource):
+    """A local file."""
+    path = attr.attrib(type=str)
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def read(self, offset, length):
+        with io.open(self.path, 'rb') as file:
+            file.seek(offset)
+            return file.read(length)
+
+    def mtime(self):
+        return os.path.getmtime(self.path)
+
+
+@attr.attrs()
+class MemorySource(ByteSource):
+    """A buffer in memory, e.g. a ``bytes`` or a ``bytearray``."""
+    data = attr.attrib(repr=False)
+
+    def size(self):
+        return len(self.data)
+
+    def read(self, offset, length):
+        return bytes(self.data[offset:offset + length])
+
+    @property
+    def buffer(self):
+        return self.data
+
+
+@attr.attrs()
+class ChunksSource(ByteSource):
+    """
+    The first ``count`` of a list of buffers in memory, e.g. the messages received from
+    a stream, read as if concatenated. The lists are only appended to by their owner, so
+    a source with a fixed ``count`` is a snapshot of them without copies.
+    """
+    chunks = attr.attrib(repr=False, type=T.List[bytes])
+    # NOTE: starts[i] is the offset of chunks[i] in the concatenated data
+    starts = attr.attrib(repr=False, type=T.List[int])
+    count = attr.attrib(type=int)
+
+    def size(self):
+        if self.count == 0:
+            return 0
+        return self.starts[self.count - 1] + len(self.chunks[self.count - 1])
+
+    def read(self, offset, length):
+        end = min(offset + length, self.size())
+        index = bisect.bisect_right(self.starts, offset, 0, self.count) - 1
+        # NOTE: a whole chunk, e.g. a message, is returned as is
+        if index >= 0 and offset == self.starts[index] and end - offset == len(self.chunks[index]):
+            return self.chunks[index]
+        parts = []
+        while offset < end:
+            start = offset - self.starts[index]
+            part = self.chunks[index][start:start + end - offset]
+            parts.append(part)
+            offset += len(part)
+            index += 1
+        return b''.join(parts)
+
+
+@attr.attrs()
+class MmapSource(FileSource):
+    """
+    A local file mapped in memory. The file must not be truncated or rewritten while in use
+    as the messages point directly into the mapping.
+    """
+    _mmap = attr.attrib(default=None, init=False, repr=False, cmp=False)
+    _lock = attr.attrib(default=attr.Factory(threading.Lock), init=False, repr=False, cmp=False)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_mmap=None, _lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _lock=threading.Lock())
+
+    def read(self, offset, length):
+        return bytes(self.buffer[offset:offset + length])
+
+    @property
+    def buffer(self):
+        with self._lock:
+            if self._mmap is None:
+                with io.open(self.path, 'rb') as file:
+                    # NOTE: empty files can't be mapped
+                    if os.fstat(file.fileno()).st_size == 0:
+                        return b''
+                    self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+
+@attr.attrs()
+class FileObjectSource(ByteSource):
+    """A seekable binary file object, e.g. the ones returned by ``fsspec.open``."""
+    fileobj = attr.attrib()
+    # NOTE: seek and read on the shared file object must not be interleaved by other threads
+    _lock = attr.attrib(default=attr.Factory(threading.Lock), init=False, repr=False, cmp=False)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _lock=threading.Lock())
+
+    def size(self):
+        with self._lock:
+            self.fileobj.seek(0, io.SEEK_END)
+            return self.fileobj.tell()
+
+    def read(self, offset, length):
+        with self._lock:
+            self.fileobj.seek(offset)
+            return self.fileobj.read(length)
+
+
+@attr.attrs()
+class HTTPSource(ByteSource):
+    """A URL on a server supporting HTTP range requests."""
+    url = attr.attrib(type=str)
+    headers = attr.attrib(default={}, repr=False, type=T.Dict[str, str])
+    timeout = attr.attrib(default=60., repr=False, type=float)
+
+    def size(self):
+        from future.moves.urllib.request import Request, urlopen
+
+        request = Request(self.url, headers=self.headers)
+        request.get_method = lambda: 'HEAD'
+        response = urlopen(request, timeout=self.timeout)
+        try:
+            return int(response.headers['Content-Length'])
+        finally:
+            response.close()
+
+    def read(self, offset, length):
+        from future.moves.urllib.request import Request, urlopen
+
+        if length <= 0:
+            return b''
+        headers = dict(self.headers)
+        headers['Range'] = 'bytes=%d-%d' % (offset, offset + length - 1)
+        try:
+            response = urlopen(Request(self.url, headers=headers), timeout=self.timeout)
+        except IOError as ex:
+            # NOTE: servers answer 416 Range Not Satisfiable when reading past the end
+            if getattr(ex, 'code', None) == 416:
+                return b''
+            raise
+        try:
+            if response.getcode() != 206:
+                raise IOError("range requests not supported by %r" % self.url)
+            return response.read()
+        finally:
+            response.close()
+
+
+@attr.attrs()
+class ReadAheadSource(ByteSource):
+    """Wrap a source reading at least ``block_size`` bytes at once and keeping the last block."""
+    source = attr.attrib(type=ByteSource)
+    block_size = attr.attrib(default=READ_AHEAD_SIZE, type=int)
+    # NOTE: the (offset, data, is_last) of the last block are replaced at once, so that
+    #   concurrent reads always see a consistent block
+    last_block = attr.attrib(default=(0, b'', False), init=False, repr=False)
+
+    def size(self):
+        return self.source.size()
+
+    def read(self, offset, length):
+        block_offset, block, block_is_last = self.last_block
+        start = offset - block_offset
+        if start < 0 or (start + length > len(block) and not block_is_last):
+            block_size = max(length, self.block_size)
+            block = self.source.read(offset, block_size)
+            self.last_block = (offset, block, len(block) < block_size)
+            start = 0
+        return block[start:start + length]
+
+    def mtime(self):
+        return self.source.mtime()
+
+
+def detect_compression(path):
+    # type: (str) -> T.Optional[str]
+    """Return the compression of the file at ``path`` from its magic number, if any."""
+    try:
+        with io.open(path, 'rb') as file:
+            head = file.read(8)
+    except (IOError, OSError):
+        return None
+    for compression, magic in COMPRESSION_MAGICS:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def make_decompressor(compression):
+    # type: (str) -> T.Any
+    """Return a decompressor of one gzip member, bz2 or xz stream or zstd frame."""
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    elif compression == 'xz':
+        import lzma
+        return lzma.LZMADecompressor()
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("reading zstd compressed files needs the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError("unsupported compression %r" % compression)
+
+
+def decompressor_eof(decompressor):
+    # type: (T.Any) -> bool
+    # NOTE: Python 2 decompressors lack the ``eof`` attribute
+    return getattr(decompressor, 'eof', bool(getattr(decompressor, 'unused_data', b'')))
+
+
+@attr.attrs()
+class DecompressionCursor(object):
+    """The state of a decompression, ``pending`` are the uncompressed bytes at ``position``."""
+    position = attr.attrib(type=int)
+    compressed_offset = attr.attrib(type=int)
+    decompressor = attr.attrib()
+    pending = attr.attrib(default=b'', type=bytes)
+    # NOTE: fresh is true until the decompressor of the current member is fed any data
+    fresh = attr.attrib(default=True, type=bool)
+
+
+@attr.attrs()
+class CompressedSource(FileSource):
+    """
+    A local gzip, bz2, xz or zstd compressed file read as its uncompressed bytes.
+
+    Reads decompress from the nearest seek point, the start of a gzip member, bz2 or xz stream
+    or zstd frame, so block compressed files like *bgzip* or seekable *zstd* have true random
+    access. Seek points are found while reading and are saved with the index. Single member
+    gzip files also get checkpoints of the decompressor state, kept in memory only.
+    """
+    compression = attr.attrib(default=None, type=T.Optional[str])
+    # NOTE: seek points are the (uncompressed_offset, compressed_offset) of every member
+    seek_points = attr.attrib(default=attr.Factory(lambda: [(0, 0)]), repr=False)
+    _checkpoints = attr.attrib(default=attr.Factory(list), init=False, repr=False, cmp=False)
+    _cursor = attr.attrib(default=None, init=False, repr=False, cmp=False)
+    # NOTE: the decompression state is shared, concurrent reads are serialised
+    _lock = attr.attrib(default=attr.Factory(threading.Lock), init=False, repr=False, cmp=False)
+
+    def __attrs_post_init__(self):
+        if self.compression is None:
+            self.compression = detect_compression(self.path)
+
+    def __getstate__(self):
+        # NOTE: decompressors and locks can't be pickled
+        state = self.__dict__.copy()
+        state.update(_checkpoints=[], _cursor=None, _lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _lock=threading.Lock())
+
+    @property
+    def raw(self):
+        return FileSource(self.path)
+
+    def size(self):
+        position = self.seek_points[-1][0]
+        while True:
+            chunk = self.read(position, READ_AHEAD_SIZE)
+            position += len(chunk)
+            if len(chunk) < READ_AHEAD_SIZE:
+                return position
+
+    def start_point(self, offset):
+        # type: (int) -> T.Tuple[int, int, T.Any]
+        """Return the last seek point or checkpoint before ``offset``."""
+        index = bisect.bisect_right(self.seek_points, (offset, float('inf'))) - 1
+        point = tuple(self.seek_points[index]) + (None,)
+        for checkpoint in self._checkpoints:
+            if point[0] < checkpoint[0] <= offset:
+                point = checkpoint
+        return point
+
+    def decompress_next(self, file, cursor):
+        # type: (T.IO[bytes], DecompressionCursor) -> bool
+        """Decompress the next chunk into ``cursor.pending``, return False at the end."""
+        cursor.position += len(cursor.pending)
+        cursor.pending = b''
+        data = b''
+        if decompressor_eof(cursor.decompressor):
+            data = cursor.decompressor.unused_data
+            cursor.decompressor = make_decompressor(self.compression)
+            cursor.fresh = True
+            if cursor.position > self.seek_points[-1][0]:
+                member_offset = cursor.compressed_offset - len(data)
+                self.seek_points.append((cursor.position, member_offset))
+        if not data:
+            file.seek(cursor.compressed_offset)
+            data = file.read(COMPRESSED_CHUNK_SIZE)
+            cursor.compressed_offset += len(data)
+        if not data:
+            return False
+        try:
+            cursor.pending = cursor.decompressor.decompress(data)
+        except Exception:
+            # NOTE: garbage after the last member is ignored, as the gzip module does
+            if cursor.fresh:
+                return False
+            raise EOFError("corrupted %s data in %r" % (self.compression, self.path))
+        cursor.fresh = False
+        end = cursor.position + len(cursor.pending)
+        last = max([self.seek_points[-1][0]] + [c[0] for c in self._checkpoints[-1:]])
+        if self.compression == 'gzip' and end >= last + CHECKPOINT_SIZE and \
+                not decompressor_eof(cursor.decompressor):
+            self._checkpoints.append((end, cursor.compressed_offset, cursor.decompressor.copy()))
+        return True
+
+    def read(self, offset, length):
+        with self._lock:
+            return self.read_unlocked(offset, length)
+
+    def read_unlocked(self, offset, length):
+        # type: (int, int) -> bytes
+        cursor = self._cursor
+        position, compressed_offset, decompressor = self.start_point(offset)
+        if cursor is None or cursor.position > offset or cursor.position < position:
+            if decompressor is None:
+                decompressor = make_decompressor(self.compression)
+                cursor = DecompressionCursor(position, compressed_offset, decompressor)
+            else:
+                cursor = DecompressionCursor(
+                    position, compressed_offset, decompressor.copy(), fresh=False,
+                )
+            self._cursor = cursor
+        chunks = []
+        end = offset + length
+        with io.open(self.path, 'rb') as file:
+            while True:
+                if cursor.position + len(cursor.pending) > offset:
+                    start = max(0, offset - cursor.position)
+                    chunks.append(cursor.pending[start:end - cursor.position])
+                if cursor.position + len(cursor.pending) >= end:
+                    break
+                if not self.decompress_next(file, cursor):
+                    break
+        return b''.join(chunks)
+
+
+def open_source(path):
+    # type: (str) -> T.Optional[ByteSource]
+    """Return a ``CompressedSource`` if the file at ``path`` is compressed, else None."""
+    if detect_compression(path) is None:
+        return None
+    return CompressedSource(path)
+
+
+def read_ahead(source, block_size=READ_AHEAD_SIZE):
+    # type: (ByteSource, int) -> ByteSource
+    # NOTE: data already in memory is read without copies
+    if source.buffer is not None or isinstance(source, (ReadAheadSource, ChunksSource)):
+        return source
+    return ReadAheadSource(source, block_size=block_size)
+
+
+def unpack_uint24(data):
+    # type: (bytes) -> int
+    if len(data) < 3:
+        raise ValueError("truncated GRIB message header")
+    return struct.unpack('>I', b'\x00' + bytes(data[:3]))[0]
+
+
+def grib1_large_length(coded_length, read):
+    # type: (int, T.Callable[[int, int], bytes]) -> int
+    """
+    Return the length of a GRIB 1 message with the ``0x800000`` flag set in ``coded_length``.
+
+    Messages larger than 8MB code their length in units of 120 bytes, in that case the length
+    of section 4 is less than 120 and is the correction to apply, see ``read_GRIB`` in ecCodes.
+    ``read(start, size)`` returns ``size`` bytes of the message from byte ``start``.
+    """
+    section1 = read(SECTION0_SIZE - 8, 8)
+    if len(section1) < 8:
+        raise ValueError("truncated GRIB message header")
+    flags = bytearray(section1)[7]
+    position = SECTION0_SIZE - 8 + unpack_uint24(section1)
+    # NOTE: the optional grid description and bitmap sections come before section 4
+    for flag in [0x80, 0x40]:
+        if flags & flag:
+            position += unpack_uint24(read(position, 3))
+    section4_length = unpack_uint24(read(position, 3))
+    if section4_length >= 120:
+        return coded_length
+    return (coded_length & 0x7fffff) * 120 - section4_length + 4
+
+
+def message_length(section0, read=None):
+    # type: (bytes, T.Optional[T.Callable[[int, int], bytes]]) -> int
+    """
+    Return the total length of the GRIB message starting with the ``section0`` bytes.
+    The length of GRIB 1 messages larger than 8MB needs more of the header, that is read with
+    ``read(start, size)``, see ``grib1_large_length``.
+    """
+    if len(section0) < SECTION0_SIZE or section0[:4] != GRIB_MARKER:
+        raise ValueError("GRIB message not found")
+    edition = bytearray(section0)[7]
+    if edition == 1:
+        length = unpack_uint24(section0[4:7])
+        if length & 0x800000:
+            if read is None:
+                raise ValueError("the length of large GRIB edition 1 messages needs the header")
+            length = grib1_large_length(length, read)
+    elif edition == 2:
+        length = struct.unpack('>Q', section0[8:16])[0]
+    else:
+        raise ValueError("unsupported GRIB edition %r" % edition)
+    return length
+
+
+def view_reader(view, offset=0):
+    # type: (memoryview, int) -> T.Callable[[int, int], bytes]
+    """Return a ``read(start, size)`` function on the message at ``offset`` in ``view``."""
+    return lambda start, size: view[offset + start:offset + start + size].tobytes()
+
+
+def read_message_length(source, offset):
+    # type: (ByteSource, int) -> int
+    """Return the length of the GRIB message at ``offset``, raise EOFError if truncated."""
+    section0 = source.read(offset, SECTION0_SIZE)
+    if len(section0) < SECTION0_SIZE:
+        raise EOFError("truncated GRIB message at offset %d" % offset)
+    return message_length(section0, lambda start, size: source.read(offset + start, size))
+
+
+def find_message(source, offset):
+    # type: (ByteSource, int) -> int
+    """Return the offset of the first GRIB message at or after ``offset``."""
+    while True:
+        chunk = source.read(offset, FIND_CHUNK_SIZE)
+        position = chunk.find(GRIB_MARKER)
+        if position >= 0:
+            return offset + position
+        if len(chunk) < FIND_CHUNK_SIZE:
+            raise EOFError("no GRIB message after offset %d" % offset)
+        # NOTE: the marker may span two chunks
+        offset += len(chunk) - len(GRIB_MARKER) + 1
+
+
+def read_message(source, offset):
+    # type: (ByteSource, int) -> bytes
+    """Return the bytes of the GRIB message at ``offset``, raise EOFError if truncated."""
+    length = read_message_length(source, offset)
+    return check_message(source.read(offset, length), length, offset)
+
+
+def message_view(buffer, offset):
+    # type: (T.Any, int) -> memoryview
+    """Return a ``memoryview`` on the GRIB message at ``offset`` in ``buffer``, no copies."""
+    view = memoryview(buffer)
+    section0 = view[offset:offset + SECTION0_SIZE].tobytes()
+    if len(section0) < SECTION0_SIZE:
+        raise EOFError("truncated GRIB message at offset %d" % offset)
+    length = message_length(section0, view_reader(view, offset))
+    return check_message(view[offset:offset + length], length, offset)
+
+
+def is_multi_field(data):
+    # type: (T.Any) -> bool
+    """
+    True if ``data`` is a GRIB 2 message with more than one field. Only the section headers
+    are read, so the check is cheap enough to run on every message of a scan.
+    """
+    view = memoryview(data)
+    if len(view) < SECTION0_SIZE or bytearray(view[7:8])[0] != 2:
+        return False
+    length = min(len(view), message_length(view[:SECTION0_SIZE].tobytes()))
+    position = SECTION0_SIZE
+    while position + 5 <= length:
+        section_length, number = struct.unpack_from('>IB', view, position)
+        if section_length < 5:
+            return False
+        position += section_length
+        if number == 7:
+            return position + len(END_MARKER) < length
+    return False
+
+
+def split_fields(data):
+    # type: (T.Any) -> T.List[bytes]
+    """
+    Return the fields of the GRIB 2 multi-field message in ``data`` as standalone messages.
+
+    After the first field a message may repeat sections 2 to 7, 3 to 7 or 4 to 7, every field
+    is made of the last sections seen up to its section 7. A bitmap section with indicator 254
+    is replaced by the last bitmap section that defines a bitmap.
+    """
+    view = memoryview(data)
+    length = message_length(view[:SECTION0_SIZE].tobytes(), view_reader(view))
+    if bytearray(view[7:8])[0] != 2:
+        return [bytes(view[:length])]
+    sections = {}  # type: T.Dict[int, bytes]
+    bitmap_section = None
+    fields = []
+    position = SECTION0_SIZE
+    while position + len(END_MARKER) <= length:
+        if view[position:position + len(END_MARKER)].tobytes() == END_MARKER:
+            break
+        section_length, number = struct.unpack_from('>IB', view, position)
+        if section_length < 5 or not 1 <= number <= 7:
+            raise ValueError("corrupted GRIB message section at byte %d" % position)
+        section = view[position:position + section_length].tobytes()
+        position += section_length
+        if number == 6:
+            indicator = bytearray(section[5:6])[0]
+            if indicator == 0:
+                bitmap_section = section
+            elif indicator == 254 and bitmap_section is not None:
+                section = bitmap_section
+        sections[number] = section
+        if number == 7:
+            body = b''.join(sections[n] for n in sorted(sections)) + END_MARKER
+            section0 = view[:8].tobytes() + struct.pack('>Q', SECTION0_SIZE + len(body))
+            fields.append(section0 + body)
+    if not fields:
+        raise ValueError("GRIB message without data sections")
+    return fields
+
+
+def read_field(source, offset, field_number):
+    # type: (ByteSource, int, int) -> bytes
+    """Return the field ``field_number`` of the GRIB message at ``offset`` as a message."""
+    return split_fields(read_message(source, offset))[field_number]
+
+
+def check_message(data, length, offset):
+    # type: (T.Any, int, int) -> T.Any
+    if len(data) < length:
+        raise EOFError("truncated GRIB message at offset %d" % offset)
+    if bytes(data[-4:]) != END_MARKER:
+        raise ValueError("corrupted GRIB message at offset %d" % offset)
+    return data
+
+
+@attr.attrs()
+class MessageFramer(object):
+    """
+    Frame the GRIB messages of a non-seekable binary stream, e.g. a pipe or a socket, by their
+    length in section 0. The stream is read sequentially keeping at most one message in memory.
+    """
+    fileobj = attr.attrib()
+    chunk_size = attr.attrib(default=FIND_CHUNK_SIZE, type=int)
+    # NOTE: position is the offset in the stream of the first buffered byte
+    position = attr.attrib(default=0, init=False, type=int)
+    buffer = attr.attrib(default=b'', init=False, repr=False, type=bytes)
+
+    def fill(self, size):
+        # type: (int) -> bool
+        """Read from the stream until ``size`` bytes are buffered, return False at the end."""
+        chunks = [self.buffer]
+        buffered = len(self.buffer)
+        while buffered < size:
+            chunk = self.fileobj.read(max(size - buffered, self.chunk_size))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            buffered += len(chunk)
+        self.buffer = b''.join(chunks)
+        return buffered >= size
+
+    def consume(self, size):
+        # type: (int) -> None
+        self.buffer = self.buffer[size:]
+        self.position += size
+
+    def read_header(self, start, size):
+        # type: (int, int) -> bytes
+        """Return ``size`` bytes from ``start`` of the message at the start of the buffer."""
+        self.fill(start + size)
+        return self.buffer[start:start + size]
+
+    def next_message(self):
+        # type: () -> T.Tuple[int, bytes]
+        """Return the ``offset, data`` of the next GRIB message, raise EOFError at the end."""
+        start = self.buffer.find(GRIB_MARKER)
+        while start < 0:
+            # NOTE: the marker may span two chunks
+            self.consume(max(0, len(self.buffer) - len(GRIB_MARKER) + 1))
+            if not self.fill(len(self.buffer) + 1):
+                raise EOFError("no GRIB message after offset %d" % self.position)
+            start = self.buffer.find(GRIB_MARKER)
+        self.consume(start)
+        offset = self.position
+        try:
+            if not self.fill(SECTION0_SIZE):
+                raise EOFError("truncated GRIB message at offset %d" % offset)
+            length = message_length(self.buffer[:SECTION0_SIZE], self.read_header)
+            if not self.fill(length):
+                raise EOFError("truncated GRIB message at offset %d" % offset)
+            data = check_message(self.buffer[:length], length, offset)
+        except ValueError:
+            # NOTE: on errors the scan goes on after the start of the broken message
+            self.consume(1)
+            raise
+        self.consume(length)
+        return offset, data
@@ -19,17 +19,40 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import functools
 import logging
 import typing as T  # noqa
 import warnings
 
 import xarray as xr
 
-from . import DatasetBuildError
+from . import bindings
+from . import dataset
+from . import references
 
 LOGGER = logging.getLogger(__name__)
 
 
+def default_lock():
+    # type: () -> T.Any
+    """Return the lock around reads, none if ecCodes is thread-safe, see ``bindings``."""
+    if bindings.codes_is_thread_safe():
+        return False
+    return xr.backends.cfgrib_.ECCODES_LOCK
+
+
+class DatasetStore(xr.backends.CfGribDataStore):
+    """
+    Implements the ``xr.AbstractDataStore`` read-only API for an already open ``cfgrib.Dataset``.
+    """
+    def __init__(self, ds, lock=None):
+        # type: (dataset.Dataset, T.Any) -> None
+        if lock is None:
+            lock = default_lock()
+        self.lock = xr.backends.locks.ensure_lock(lock)
+        self.ds = ds
+
+
 def open_dataset(path, **kwargs):
     # type: (str, T.Any) -> xr.Dataset
     """
@@ -38,9 +61,25 @@ def open_dataset(path, **kwargs):
     if 'engine' in kwargs and kwargs['engine'] != 'cfgrib':
         raise ValueError("only engine=='cfgrib' is supported")
     kwargs['engine'] = 'cfgrib'
+    if kwargs.get('lock') is None:
+        kwargs['lock'] = default_lock()
     return xr.backends.api.open_dataset(path, **kwargs)
 
 
+def _open_store(dataset_factory, backend_kwargs, **kwargs):
+    # type: (T.Callable[..., dataset.Dataset], T.Dict[str, T.Any], T.Any) -> xr.Dataset
+    """
+    Return a ``xr.Dataset`` on the ``cfgrib.Dataset`` returned by
+    ``dataset_factory(**backend_kwargs)``, for the cfgrib datasets not opened from a path.
+    """
+    if 'engine' in kwargs and kwargs['engine'] != 'cfgrib':
+        raise ValueError("only engine=='cfgrib' is supported")
+    kwargs.pop('engine', None)
+    lock = kwargs.pop('lock', None)
+    ds = dataset_factory(**backend_kwargs)
+    return xr.open_dataset(DatasetStore(ds, lock=lock), **kwargs)
+
+
 def open_datasets(path, backend_kwargs={}, no_warn=False, **kwargs):
     # type: (str, T.Dict[str, T.Any], bool, T.Any) -> T.List[xr.Dataset]
     """
@@ -49,16 +88,48 @@ def open_datasets(path, backend_kwargs={}, no_warn=False, **kwargs):
     if not no_warn:
         warnings.warn("open_datasets is an experimental API, DO NOT RELY ON IT!", FutureWarning)
 
-    fbks = []
-    datasets = []
-    try:
-        datasets.append(open_dataset(path, backend_kwargs=backend_kwargs, **kwargs))
-    except DatasetBuildError as ex:
-        fbks.extend(ex.args[2])
-    # NOTE: the recursive call needs to stay out of the exception handler to avoid showing
-    #   to the user a confusing error message due to exception chaining
-    for fbk in fbks:
-        bks = backend_kwargs.copy()
-        bks['filter_by_keys'] = fbk
-        datasets.extend(open_datasets(path, backend_kwargs=bks, no_warn=True, **kwargs))
-    return datasets
+    # NOTE: all hypercubes are built from the same index, so the file is scanned at most once
+    hypercubes = dataset.open_file_hypercubes(path, **backend_kwargs)
+    return [_open_store(lambda: ds, {}, **kwargs) for ds in hypercubes]
+
+
+def open_files(paths, backend_kwargs={}, **kwargs):
+    # type: (T.Union[str, T.List[str]], T.Dict[str, T.Any], T.Any) -> xr.Dataset
+    """
+    Return a ``xr.Dataset`` spanning many GRIB files, given as a list of paths or a glob pattern.
+
+    All files are mapped to one dataset via a catalog index, see ``cfgrib.dataset.open_files``.
+    """
+    return _open_store(functools.partial(dataset.open_files, paths), backend_kwargs, **kwargs)
+
+
+def open_stream(fileobj, backend_kwargs={}, **kwargs):
+    # type: (T.IO[bytes], T.Dict[str, T.Any], T.Any) -> xr.Dataset
+    """
+    Return a ``xr.Dataset`` with the GRIB messages read from a non-seekable binary stream,
+    e.g. a pipe, the messages are kept in memory instead of a temporary file.
+    """
+    return _open_store(functools.partial(dataset.open_stream, fileobj), backend_kwargs, **kwargs)
+
+
+def open_references(references_or_path, backend_kwargs={}, **kwargs):
+    # type: (T.Union[str, T.Dict[str, T.Any]], T.Dict[str, T.Any], T.Any) -> xr.Dataset
+    """
+    Return a ``xr.Dataset`` from a reference manifest written by ``cfgrib.references``,
+    reading the GRIB messages by offset without scanning nor indexing the GRIB files.
+    """
+    dataset_factory = functools.partial(references.open_references, references_or_path)
+    return _open_store(dataset_factory, backend_kwargs, **kwargs)
+
+
+def open_field_statistics(path, key, backend_kwargs={}, **kwargs):
+    # type: (str, str, T.Dict[str, T.Any], T.Any) -> xr.Dataset
+    """
+    Return a ``xr.Dataset`` with the ``key`` statistic, e.g. ``'max'``, of every field of
+    a GRIB file on the header dimensions, see ``cfgrib.Dataset.field_statistics``.
+    The statistics are kept in the index file, so only the first call decodes the fields.
+    """
+    def dataset_factory(**backend_kwargs):
+        return dataset.open_file(path, **backend_kwargs).field_statistics(key)
+
+    return _open_store(dataset_factory, dict(backend_kwargs, statistics=True), **kwargs)
@@ -0,0 +1,7 @@
+import sys
+
+# NOTE: the asyncio API needs Python 3.5+, its module is valid syntax but can't be imported and
+#   its names, e.g. StopAsyncIteration, are unknown to the checks run on older versions
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore += ['cfgrib/aio.py', 'tests/test_30_aio.py']
@@ -36,6 +36,13 @@ def parse_version_from(path):
     return version_match.group(1)
 
 
+# the pre-parsed ecCodes declarations are pure Python, while the optional compiled bindings
+#   need a compiler and the ecCodes headers, see cfgrib/bindings_build.py
+cffi_modules = ['cfgrib/bindings_build.py:abi_ffibuilder']
+if os.environ.get('CFGRIB_BUILD_EXTENSION'):
+    cffi_modules.append('cfgrib/bindings_build.py:ffibuilder')
+
+
 setuptools.setup(
     name='cfgrib',
     version=parse_version_from('cfgrib/__init__.py'),
@@ -49,6 +56,7 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     include_package_data=True,
     setup_requires=[
+        'cffi>=1.0.0',
         'pytest-runner',
     ],
     install_requires=[
@@ -61,6 +69,7 @@ setuptools.setup(
     ],
     extras_require={
         'xarray': ['xarray>=0.11.0'],
+        'zstd': ['zstandard'],
     },
     tests_require=[
         'dask[array]',
@@ -92,4 +101,5 @@ setuptools.setup(
             'cfgrib=cfgrib.__main__:cfgrib_cli',
         ],
     },
+    cffi_modules=cffi_modules,
 )
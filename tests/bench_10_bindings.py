@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Benchmark of the ecCodes calls on the indexing hot path, ABI mode against the compiled
+API-mode extension, see ``cfgrib/bindings_build.py``. Run from the top folder with::
+
+    $ PYTHONPATH=. python tests/bench_10_bindings.py [GRIB_FILE]
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+SAMPLE_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'sample-data')
+TEST_DATA = os.path.join(SAMPLE_DATA_FOLDER, 'era5-levels-members.grib')
+REPEAT = 5
+NUMBER = 2000
+
+
+def best_time(stmt, number=NUMBER):
+    # seconds per call, best of REPEAT runs
+    return min(timeit.repeat(stmt, number=number, repeat=REPEAT)) / number
+
+
+def codes_get_each(bindings, handle, keys):
+    values = []
+    for key in keys:
+        try:
+            values.append(bindings.codes_get_array(handle, key))
+        except bindings.EcCodesError:
+            values.append(None)
+    return values
+
+
+def measure(path):
+    from cfgrib import bindings
+    from cfgrib import cfmessage
+    from cfgrib import dataset
+    from cfgrib import messages
+
+    with open(path, 'rb') as file:
+        message = cfmessage.CfMessage.from_file(file)
+    handle = message.codes_id
+    keys = [k for k in dataset.ALL_KEYS if k not in message.computed_keys]
+    bkeys = [k.encode('ascii') for k in keys]
+    schema = list(messages.make_message_schema(message, keys).values())
+    # NOTE: the first read of the concept keys loads the ecCodes definitions
+    bindings.codes_get_many(handle, bkeys, schema)
+    long_p = bindings.ffi.new('long *')
+    type_p = bindings.ffi.new('int *')
+
+    results = {'mode': bindings.BINDINGS_MODE}
+    results['codes_get_long'] = best_time(
+        lambda: bindings.lib.codes_get_long(handle, b'level', long_p))
+    results['codes_get_native_type'] = best_time(
+        lambda: bindings.lib.codes_get_native_type(handle, b'level', type_p))
+    results['codes_get (level)'] = best_time(lambda: bindings.codes_get(handle, b'level'))
+    results['codes_get_many (%d keys)' % len(bkeys)] = best_time(
+        lambda: bindings.codes_get_many(handle, bkeys, schema), number=NUMBER // 20)
+    # NOTE: the baselines of codes_get_many, one call per key as the index used to read them
+    results['codes_get per key (%d keys)' % len(bkeys)] = best_time(
+        lambda: codes_get_each(bindings, handle, bkeys), number=NUMBER // 20)
+    message_get = message.message_get
+    results['message_get per key (%d keys)' % len(keys)] = best_time(
+        lambda: [message_get(key, default=None) for key in keys], number=NUMBER // 20)
+    # NOTE: the floor of codes_get_many, the time spent in the ecCodes getters of scalar keys
+    buffers = bindings._ValueBuffers()
+    getters = {
+        bindings.CODES_TYPE_LONG: buffers.get_long,
+        bindings.CODES_TYPE_DOUBLE: buffers.get_double,
+        bindings.CODES_TYPE_STRING: buffers.get_string,
+    }
+    calls = [(getters[ks[0]], key) for key, ks in zip(bkeys, schema) if ks and ks[0] in getters]
+    results['ecCodes getters only (%d keys)' % len(calls)] = best_time(
+        lambda: [getter(handle, key) for getter, key in calls], number=NUMBER // 20)
+    del message
+    return results
+
+
+def main(argv=sys.argv[1:]):
+    if argv[:1] == ['--measure']:
+        print(json.dumps(measure(argv[1])))
+        return
+    path = argv[0] if argv else TEST_DATA
+    runs = {}
+    for use_extension in ['0', '1']:
+        env = dict(os.environ, CFGRIB_USE_EXTENSION=use_extension)
+        output = subprocess.check_output([sys.executable, __file__, '--measure', path], env=env)
+        results = json.loads(output.decode('utf-8'))
+        runs[results.pop('mode')] = results
+    if 'api' not in runs:
+        print("compiled extension not available, build it with: python cfgrib/bindings_build.py")
+    print('%-32s %12s %12s %8s' % ('call', 'abi (us)', 'api (us)', 'speedup'))
+    for name, abi_time in sorted(runs['abi'].items()):
+        api_time = runs.get('api', {}).get(name, float('nan'))
+        print('%-32s %12.2f %12.2f %7.1fx' % (
+            name, abi_time * 1e6, api_time * 1e6, abi_time / api_time))
+    many = [name for name in runs['abi'] if name.startswith('codes_get_many')][0]
+    print('\n%-32s %12s %12s' % ('codes_get_many speedup over', 'abi', 'api'))
+    for name in sorted(runs['abi']):
+        if ' per key ' in name:
+            speedups = [
+                runs.get(m, {}).get(name, float('nan')) / runs.get(m, {}).get(many, float('nan'))
+                for m in ['abi', 'api']
+            ]
+            print('%-32s %11.1fx %11.1fx' % tuple([name.split(' (')[0]] + speedups))
+
+if __name__ == '__main__':
+    main()
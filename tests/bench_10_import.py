@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Benchmark of ``import cfgrib``, with the ecCodes bindings and the xarray helpers loaded lazily,
+against loading them eagerly at import as older versions did. Run from the top folder with::
+
+    $ PYTHONPATH=. python tests/bench_10_import.py
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import subprocess
+import sys
+import time
+
+REPEAT = 10
+STATEMENTS = [
+    ('python', 'pass'),
+    ('import cfgrib (lazy)', 'import cfgrib'),
+    ('+ load bindings', 'import cfgrib; cfgrib.bindings.load_bindings()'),
+    ('+ xarray helpers (eager)',
+     'import cfgrib; cfgrib.bindings.load_bindings(); import cfgrib.xarray_store'),
+]
+
+
+def best_time(statement, repeat=REPEAT):
+    # seconds to start a new interpreter running statement, best of repeat runs
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', statement], env=os.environ)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def import_time(module='cfgrib'):
+    # cumulative microseconds of the import of module reported by ``-X importtime``
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stderr=subprocess.STDOUT,
+    )
+    for line in output.decode('utf-8').splitlines():
+        fields = [f.strip() for f in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    return None
+
+
+def main():
+    totals = [best_time(statement) for _, statement in STATEMENTS]
+    print('%-28s %12s %12s' % ('statement', 'total (ms)', 'cfgrib (ms)'))
+    for (name, _), total in zip(STATEMENTS, totals):
+        print('%-28s %12.1f %12.1f' % (name, total * 1e3, (total - totals[0]) * 1e3))
+    if sys.version_info >= (3, 7):
+        print("import cfgrib with -X importtime: %.1f ms" % (import_time() / 1e3))
+
+
+if __name__ == '__main__':
+    main()
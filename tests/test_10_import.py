@@ -0,0 +1,48 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os.path
+import subprocess
+import sys
+
+import pytest
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_STATS = '''
+import json, sys
+import %s
+from cfgrib import bindings
+print(json.dumps({
+    'bindings_mode': bindings.BINDINGS_MODE,
+    'modules': sorted(sys.modules),
+}))
+'''
+
+
+def import_stats(module_name):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT_FOLDER] + sys.path)
+    command = [sys.executable, '-c', IMPORT_STATS % module_name]
+    output = subprocess.check_output(command, cwd=ROOT_FOLDER, env=env)
+    return json.loads(output.decode('utf-8'))
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="xarray is imported lazily on py3.7+")
+def test_import_cfgrib():
+    res = import_stats('cfgrib')
+
+    # NOTE: the ecCodes library and xarray are the slowest parts of importing cfgrib
+    assert res['bindings_mode'] is None
+    assert 'cfgrib._bindings' not in res['modules']
+    assert 'cfgrib._bindings_abi' not in res['modules']
+    assert 'xarray' not in res['modules']
+
+
+def test_import_cfgrib_xarray_helpers():
+    pytest.importorskip('xarray')
+    import cfgrib
+
+    assert hasattr(cfgrib, 'open_dataset')
+    assert hasattr(cfgrib, 'to_grib')
+    assert cfgrib.xarray_store.open_dataset is cfgrib.open_dataset
+    assert not hasattr(cfgrib, 'not_a_helper')
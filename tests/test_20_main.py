@@ -1,9 +1,16 @@
 
+import json
+import os.path
+
 import click.testing
 
 from cfgrib import __main__
 
 
+SAMPLE_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'sample-data')
+TEST_DATA = os.path.join(SAMPLE_DATA_FOLDER, 'era5-levels-members.grib')
+
+
 def test_cfgrib_cli_selfcheck():
     runner = click.testing.CliRunner()
 
@@ -14,3 +21,46 @@ def test_cfgrib_cli_selfcheck():
 
     res = runner.invoke(__main__.cfgrib_cli, ['non-existent-command'])
     assert res.exit_code == 2
+
+
+def test_cfgrib_cli_clean_index_cache(tmpdir):
+    runner = click.testing.CliRunner()
+    tmpdir.join('cache').ensure(dir=True).join('index.idx').write('index')
+
+    cache_dir = str(tmpdir.join('cache'))
+    res = runner.invoke(__main__.cfgrib_cli, ['clean_index_cache', '-d', cache_dir])
+
+    assert res.exit_code == 0
+    assert not tmpdir.join('cache').join('index.idx').check()
+
+    env = {'CFGRIB_INDEX_CACHE_DIR': ''}
+    res = runner.invoke(__main__.cfgrib_cli, ['clean_index_cache'], env=env)
+    assert res.exit_code == 2
+
+
+def test_cfgrib_cli_to_references(tmpdir):
+    runner = click.testing.CliRunner()
+    outpath = str(tmpdir.join('era5-levels-members.json'))
+
+    res = runner.invoke(__main__.cfgrib_cli, ['to_references', TEST_DATA, '-o', outpath])
+
+    assert res.exit_code == 0
+    with open(outpath) as file:
+        assert json.load(file)['version'] == 1
+
+
+def test_cfgrib_cli_copy(tmpdir):
+    runner = click.testing.CliRunner()
+    outpath = str(tmpdir.join('{shortName}.grib'))
+
+    res = runner.invoke(__main__.cfgrib_cli, ['copy', TEST_DATA, outpath, '-w', 'level=500'])
+
+    assert res.exit_code == 0
+    assert "Copied 40 messages" in res.output
+    assert tmpdir.join('t.grib').check()
+    assert tmpdir.join('z.grib').check()
+
+    res = runner.invoke(__main__.cfgrib_cli, ['copy', TEST_DATA, outpath, '-w', 'level=1'])
+
+    assert res.exit_code == 0
+    assert "No message matching" in res.output
@@ -2,15 +2,20 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import os.path
+import threading
+import time
 
 import pytest
 
 from cfgrib import bindings
 from cfgrib import messages
+from cfgrib import sources
 
 
 SAMPLE_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'sample-data')
 TEST_DATA = os.path.join(SAMPLE_DATA_FOLDER, 'era5-levels-members.grib')
+TEST_DATA_G2 = os.path.join(SAMPLE_DATA_FOLDER, 'regular_gg_ml_g2.grib')
+TEST_DATA_MULTI_FIELD = os.path.join(SAMPLE_DATA_FOLDER, 'regular_gg_ml_g2_multi_field.grib')
 
 
 def test_Message_read():
@@ -29,6 +34,9 @@ def test_Message_read():
 
     assert res1.message_get('non-existent-key', default=1) == 1
 
+    res = res1.message_get_many(['paramId', 'gridType', 'non-existent-key'], default='undef')
+    assert res == [129, 'regular_ll', 'undef']
+
     res2 = messages.Message.from_message(res1)
     assert res2.items() == res1.items()
 
@@ -95,6 +103,9 @@ def test_ComputedKeysMessage_read():
     with pytest.raises(ZeroDivisionError):
         res['error_key']
 
+    res = res.message_get_many(['paramId', 'ref_time', 'error_key', 'centre'], default='undef')
+    assert res == [129, '201701010', 'undef', -1]
+
 
 def test_ComputedKeysMessage_write():
     computed_keys = {
@@ -124,6 +135,18 @@ def test_make_message_schema():
     assert res['non-existent'] == ()
 
 
+def test_HeaderReader():
+    stream = messages.FileStream(TEST_DATA)
+    header_reader = messages.HeaderReader(['paramId', 'shortName', 'dataDate', 'pl'])
+
+    res = [header_reader(message) for message in stream]
+
+    assert res[0] == (129, 'z', 20170101, 'undef')
+    assert len(res) == 160
+    assert list(header_reader.schemas) == [1]
+    assert header_reader.schemas[1]['paramId'] == (bindings.CODES_TYPE_LONG, 1)
+
+
 def test_compat_create_exclusive(tmpdir):
     test_file = tmpdir.join('file.grib.idx')
 
@@ -161,6 +184,16 @@ def test_FileIndex():
     assert len(subres) == 1
 
 
+def test_FileIndex_partition():
+    res = messages.FileIndex.from_filestream(messages.FileStream(TEST_DATA), ['paramId', 'number'])
+    subindexes = res.partition('paramId')
+
+    assert list(subindexes) == [129, 130]
+    assert subindexes[130].getone('paramId') == 130
+    assert subindexes[130].offsets == res.subindex(paramId=130).offsets
+    assert len(subindexes[129]['number']) == 10
+
+
 def test_FileIndex_from_indexpath_or_filestream(tmpdir):
     grib_file = tmpdir.join('file.grib')
 
@@ -209,6 +242,388 @@ def test_FileIndex_from_indexpath_or_filestream(tmpdir):
     assert isinstance(res, messages.FileIndex)
 
 
+def test_IndexCache(tmpdir, monkeypatch):
+    cache = messages.IndexCache(str(tmpdir.join('cache')))
+    stream = messages.FileStream(TEST_DATA)
+
+    res = messages.FileIndex.from_indexpath_or_filestream(stream, ['paramId'], indexpath=cache)
+    assert res['paramId'] == [129, 130]
+    assert len(cache.entries()) == 1
+    assert cache.entries()[0][2] == cache.indexpath(stream)
+
+    # read the cached index
+    res = messages.FileIndex.from_indexpath_or_filestream(stream, ['paramId'], indexpath=cache)
+    assert res['paramId'] == [129, 130]
+    assert len(cache.entries()) == 1
+
+    # the least recently used index file is evicted, the new one is kept
+    cache.max_size = 1
+    other_stream = messages.FileStream(TEST_DATA, errors='ignore')
+    res = other_stream.index(['number'], indexpath=cache)
+    assert len(res['number']) == 10
+    assert [e[2] for e in cache.entries()] == [cache.indexpath(other_stream)]
+
+    # the cache can be configured via environment variables
+    monkeypatch.setenv(messages.INDEX_CACHE_DIR_ENV, str(tmpdir.join('env-cache')))
+    monkeypatch.setenv(messages.INDEX_CACHE_MAX_SIZE_ENV, '1000000')
+    assert messages.IndexCache.from_env().max_size == 1000000
+    res = stream.index(['paramId'])
+    assert tmpdir.join('env-cache').check(dir=True)
+    assert len(messages.IndexCache.from_env().entries()) == 1
+
+    assert cache.clean() == 0
+    assert cache.entries() == []
+
+    # the lock and temporary files left by interrupted processes are removed as well
+    stream.index(['paramId'], indexpath=cache)
+    indexpath = cache.indexpath(stream)
+    open(indexpath + '.lock', 'wb').close()
+    open(indexpath + '.0123abcd.tmp', 'wb').close()
+    cache.evict()
+    assert os.path.exists(indexpath + '.0123abcd.tmp')
+    assert not os.path.exists(indexpath + '.lock')
+    assert cache.clean() == 0
+    assert tmpdir.join('cache').listdir() == []
+
+    monkeypatch.delenv(messages.INDEX_CACHE_DIR_ENV)
+    assert messages.IndexCache.from_env() is None
+
+
+def test_index_lock(tmpdir, monkeypatch):
+    lockpath = str(tmpdir.join('file.idx.lock'))
+
+    with messages.index_lock(lockpath) as locked:
+        assert locked
+        with messages.index_lock(lockpath, timeout=0.2) as other_locked:
+            assert not other_locked
+    assert not tmpdir.join('file.idx.lock').check()
+
+    # a lock file removed by its holder before getting the lock is not locked
+    flock = messages.fcntl.flock
+
+    def replacing_flock(file, operation):
+        os.unlink(lockpath)
+        open(lockpath, 'ab').close()
+        return flock(file, operation)
+
+    monkeypatch.setattr(messages.fcntl, 'flock', replacing_flock)
+    assert messages.try_lock_file(lockpath) is None
+    monkeypatch.setattr(messages.fcntl, 'flock', flock)
+    file = messages.try_lock_file(lockpath)
+    assert file is not None
+    file.close()
+
+    with messages.index_lock(lockpath, timeout=0) as locked:
+        assert not locked
+
+    with messages.index_lock(str(tmpdir.join('non-existent-folder', 'file.lock'))) as locked:
+        assert not locked
+
+
+def test_FileIndex_from_indexpath_or_filestream_concurrent(tmpdir, monkeypatch):
+    grib_file = tmpdir.join('file.grib')
+    with open(TEST_DATA, 'rb') as file:
+        grib_file.write_binary(file.read())
+    stream = messages.FileStream(str(grib_file))
+    expected = messages.FileIndex.from_filestream(stream, ['paramId'])
+    scans = []
+
+    def slow_from_filestream(cls, filestream, index_keys, statistics=False, duplicates='keep'):
+        scans.append(filestream)
+        time.sleep(0.5)
+        return expected
+
+    monkeypatch.setattr(messages.FileIndex, 'from_filestream', classmethod(slow_from_filestream))
+    results = []
+
+    def target():
+        results.append(messages.FileIndex.from_indexpath_or_filestream(stream, ['paramId']))
+
+    threads = [threading.Thread(target=target) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(scans) == 1
+    assert all(r.offsets == expected.offsets for r in results)
+    assert sorted(p.basename for p in tmpdir.listdir()) == ['file.grib', 'file.grib.608cf.idx']
+
+
+def test_FileIndex_extend_appended(tmpdir):
+    grib_file = tmpdir.join('file.grib')
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    expected = messages.FileIndex.from_filestream(messages.FileStream(TEST_DATA), ['paramId'])
+    offsets = sorted(o for _, offs in expected.offsets for o in offs)
+    grib_file.write_binary(data[:offsets[40]])
+    stream = messages.FileStream(str(grib_file))
+
+    res = messages.FileIndex.from_indexpath_or_filestream(stream, ['paramId'])
+    assert sum(len(offs) for _, offs in res.offsets) == 40
+    assert offsets[40] - 8 <= res.scanned_size <= offsets[40]
+
+    # append one and a half message, only the complete one is indexed
+    grib_file.write(data[offsets[40]:offsets[42] - 100], mode='ab')
+    grib_file.setmtime(grib_file.mtime() + 10)
+    res = messages.FileIndex.from_indexpath_or_filestream(stream, ['paramId'])
+    assert sum(len(offs) for _, offs in res.offsets) == 41
+    assert res.scanned_size <= offsets[41]
+
+    grib_file.write(data[offsets[42] - 100:], mode='ab')
+    grib_file.setmtime(grib_file.mtime() + 10)
+    res = messages.FileIndex.from_indexpath_or_filestream(stream, ['paramId'])
+    assert res.offsets == expected.offsets
+    assert res['paramId'] == [129, 130]
+
+    # the file is read back from the updated index file
+    res = messages.FileIndex.from_indexpath_or_filestream(stream, ['paramId'])
+    assert res.offsets == expected.offsets
+
+    # a file that changed before the scanned size can't be extended
+    grib_file.write_binary(data[:offsets[40]])
+    assert not res.extend_appended()
+
+
+def test_FileIndex_matches_file(tmpdir, monkeypatch):
+    grib_file = tmpdir.join('file.grib')
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    grib_file.write_binary(data)
+    index_keys = ['paramId']
+    res = messages.FileIndex.from_indexpath_or_filestream(
+        messages.FileStream(str(grib_file)), index_keys,
+    )
+    assert res.file_size == len(data)
+    assert res.matches_file()
+
+    scans = []
+    from_filestream = messages.FileIndex.from_filestream.__func__
+
+    def counting_from_filestream(cls, *args, **kwargs):
+        scans.append(args)
+        return from_filestream(cls, *args, **kwargs)
+
+    monkeypatch.setattr(
+        messages.FileIndex, 'from_filestream', classmethod(counting_from_filestream),
+    )
+
+    # the GRIB file and the index are moved together and the GRIB file looks newer
+    moved = tmpdir.mkdir('moved')
+    for path in tmpdir.listdir(lambda p: p.isfile()):
+        path.move(moved.join(path.basename))
+    moved_file = moved.join('file.grib')
+    moved_file.setmtime(moved_file.mtime() + 10)
+    res = messages.FileIndex.from_indexpath_or_filestream(
+        messages.FileStream(str(moved_file)), index_keys,
+    )
+    assert res.filestream.path == str(moved_file)
+    assert res.offsets and not scans
+
+    # a same size change in the GRIB file is detected even if the index looks newer
+    moved_file.write_binary(data[:-16] + b'\0' * 12 + data[-4:])
+    moved_file.setmtime(moved_file.mtime() - 10)
+    assert not res.matches_file()
+    messages.FileIndex.from_indexpath_or_filestream(
+        messages.FileStream(str(moved_file)), index_keys,
+    )
+    assert len(scans) == 1
+
+
+def test_FileIndex_update_index_keys(tmpdir, monkeypatch):
+    grib_file = tmpdir.join('file.grib')
+    with open(TEST_DATA, 'rb') as file:
+        grib_file.write_binary(file.read())
+    stream = messages.FileStream(str(grib_file))
+    expected = messages.FileIndex.from_filestream(stream, ['paramId', 'number', 'shortName'])
+
+    res = messages.FileIndex.from_filestream(stream, ['paramId'])
+    res = res.extend_index_keys(['number', 'paramId', 'shortName'])
+    assert res.index_keys == ['paramId', 'number', 'shortName']
+    assert res.offsets == expected.offsets
+    assert res.select_index_keys(['shortName', 'paramId'])['shortName'] == ['z', 't']
+    assert res.select_index_keys(['paramId']).offsets == \
+        messages.FileIndex.from_filestream(stream, ['paramId']).offsets
+
+    def fail_from_filestream(*args, **kwargs):
+        raise AssertionError("the GRIB file is scanned again")
+
+    stream.index(['paramId'])
+    monkeypatch.setattr(messages.FileIndex, 'from_filestream', fail_from_filestream)
+
+    # new keys are added to the same index file, known keys are read from it
+    res = stream.index(['paramId', 'number', 'shortName'])
+    assert res.offsets == expected.offsets
+    res = stream.index(['number'])
+    assert len(res['number']) == 10
+    index_files = [p.basename for p in tmpdir.listdir() if p.ext == '.idx']
+    assert len(index_files) == 1
+    stored = messages.FileIndex.from_indexpath(str(tmpdir.join(index_files[0])))
+    assert stored.index_keys == ['paramId', 'number', 'shortName']
+
+
+def test_FileIndex_statistics(tmpdir, monkeypatch):
+    grib_file = tmpdir.join('file.grib')
+    with open(TEST_DATA, 'rb') as file:
+        grib_file.write_binary(file.read())
+    stream = messages.FileStream(str(grib_file))
+    first = stream.first()
+
+    res = messages.FileIndex.from_filestream(stream, ['paramId'])
+    assert res.statistics is None
+
+    res = messages.FileIndex.from_filestream(stream, ['paramId'], statistics=True)
+    assert len(res.statistics) == 160
+    assert res.statistics[0] == (first['min'], first['max'], first['average'], 0, 0)
+    assert res.subindex(paramId=130).statistics is res.statistics
+    assert messages.FileIndex.from_filestream(stream, ['paramId']).extend_statistics() == res
+    assert res.extend_statistics() is res
+
+    def fail_from_filestream(*args, **kwargs):
+        raise AssertionError("the GRIB file is scanned again")
+
+    stream.index(['paramId'])
+    monkeypatch.setattr(messages.FileIndex, 'from_filestream', fail_from_filestream)
+
+    # statistics are added to the index file and read from it afterwards
+    res = stream.index(['paramId', 'number'], statistics=True)
+    assert res.statistics[0][:3] == (first['min'], first['max'], first['average'])
+    monkeypatch.setattr(messages.FileStream, 'message_reader', fail_from_filestream)
+    res = stream.index(['number'], statistics=True)
+    assert len(res.statistics) == 160
+
+
+def test_FileIndex_deduplicate(tmpdir, caplog, monkeypatch):
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    first = messages.FileStream(TEST_DATA).first()
+    altered = bytearray(data[:first['totalLength']])
+    altered[first['offsetSection4'] + 100] ^= 0xff
+    grib_file = tmpdir.join('file.grib')
+    grib_file.write_binary(data + data[:first['totalLength']] + bytes(altered))
+    index_keys = ['paramId', 'number', 'dataDate', 'dataTime', 'level']
+    index = messages.FileStream(str(grib_file)).index(index_keys)
+
+    res = index.duplicates()
+
+    assert list(res) == [index.offsets[0][0]]
+    offsets = [0, len(data), len(data) + first['totalLength']]
+    assert [o for o, _ in res[index.offsets[0][0]]] == offsets
+    fingerprints = [f for _, f in res[index.offsets[0][0]]]
+    assert fingerprints[0] == fingerprints[1] != fingerprints[2]
+
+    assert index.deduplicate('keep') is index
+    assert index.deduplicate('warn') is index
+    assert 'different data' in caplog.text
+    res = index.deduplicate('first')
+    assert res.offsets[0][1] == [0]
+    assert res.offsets[1:] == index.offsets[1:]
+    res = index.deduplicate('last')
+    assert res.offsets[0][1] == [offsets[-1]]
+    assert res.deduplicate('first') is res
+    with pytest.raises(ValueError):
+        index.deduplicate('drop')
+
+    assert index.data_fingerprints is None
+    res = messages.FileStream(str(grib_file)).index(index_keys, duplicates='first')
+    assert sorted(res.data_fingerprints) == offsets
+    assert res.subindex(paramId=130).data_fingerprints is res.data_fingerprints
+
+    def fail_message_reader(*args, **kwargs):
+        raise AssertionError("the GRIB messages are read again")
+
+    # the data fingerprints are added to the index file and read from it afterwards
+    monkeypatch.setattr(messages.FileStream, 'message_reader', fail_message_reader)
+    res = messages.FileStream(str(grib_file)).index(index_keys, duplicates='first')
+    assert res.deduplicate('first').offsets[0][1] == [0]
+
+
+def test_FileIndex_to_table():
+    stream = messages.FileStream(TEST_DATA)
+    res = messages.FileIndex.from_filestream(stream, ['paramId', 'number'])
+
+    table = res.to_table()
+    assert list(table) == ['paramId', 'number', 'offset', 'length']
+    assert len(table['offset']) == 160
+    assert table['offset'] == sorted(table['offset'])
+    first = stream.first()
+    assert table['paramId'][0] == first['paramId']
+    assert table['length'][0] == first['totalLength']
+    assert all(o + n <= next_o for o, n, next_o in zip(
+        table['offset'], table['length'], table['offset'][1:],
+    ))
+
+    table = res.to_table({'paramId': 130}, number=1)
+    assert table['paramId'] == [130] * 8
+    assert table['number'] == [1] * 8
+    assert res.subindex(paramId=130).to_table(number=1) == table
+
+    pd = pytest.importorskip('pandas')
+    df = res.to_dataframe(paramId=129)
+    assert isinstance(df, pd.DataFrame)
+    assert list(df.columns) == ['paramId', 'number', 'offset', 'length']
+    assert len(df) == 80
+
+
+def test_MultiFileStream(tmpdir):
+    grib_file = tmpdir.join('file.grib')
+    with open(TEST_DATA, 'rb') as file:
+        grib_file.write_binary(file.read())
+
+    res = messages.MultiFileStream([TEST_DATA, str(grib_file)])
+    leader = res.first()
+    assert res.path == res.paths[0][:len(res.path) - 1] + '*'
+    assert sum(1 for _ in res) == 2 * leader['count']
+
+    with res.message_reader() as message_from_offset:
+        assert message_from_offset((1, 0))['paramId'] == leader['paramId']
+        assert message_from_offset((0, 0))['paramId'] == leader['paramId']
+
+
+def test_CatalogIndex(tmpdir):
+    grib_file = tmpdir.join('file.grib')
+    with open(TEST_DATA, 'rb') as file:
+        grib_file.write_binary(file.read())
+    catalogpath = str(tmpdir.join('catalog.idx'))
+    stream = messages.MultiFileStream([TEST_DATA, str(grib_file)])
+
+    res = messages.CatalogIndex.from_catalogpath_or_filestream(
+        stream, ['paramId'], catalogpath=catalogpath,
+    )
+    assert tmpdir.join('catalog.idx').check()
+    assert res['paramId'] == [129, 130]
+    file_offsets = messages.FileStream(TEST_DATA).index(['paramId']).offsets[0][1]
+    assert res.offsets[0][1] == [(0, o) for o in file_offsets] + [(1, o) for o in file_offsets]
+    assert res.subindex(paramId=130).first()['paramId'] == 130
+
+    # read catalog file, also when it is older than the GRIB files
+    os.utime(catalogpath, (0, 0))
+    res = stream.index(['paramId'], catalogpath=catalogpath)
+    assert isinstance(res, messages.CatalogIndex)
+    assert os.path.getmtime(catalogpath) == 0
+
+    # ignore the catalog built with different keys
+    res = stream.index(['paramId', 'number'], catalogpath=catalogpath)
+    assert len(res) == 2
+
+    table = res.to_table(paramId=130)
+    assert list(table) == ['paramId', 'number', 'path', 'offset', 'length']
+    assert table['path'] == [TEST_DATA] * 80 + [str(grib_file)] * 80
+    assert table['offset'][:80] == table['offset'][80:]
+
+    # ignore the catalog without statistics
+    res = stream.index(['paramId', 'number'], catalogpath=catalogpath, statistics=True)
+    assert res.statistics[(1, 0)] == res.statistics[(0, 0)]
+    assert len(res.statistics) == 320
+
+    # ignore the catalog when a file is replaced by an older one
+    with open(os.path.join(SAMPLE_DATA_FOLDER, 'regular_ll_sfc.grib'), 'rb') as file:
+        grib_file.write_binary(file.read())
+    os.utime(str(grib_file), (0, 0))
+    res = stream.index(['paramId', 'number'], catalogpath=catalogpath, statistics=True)
+    assert res['paramId'] == [129, 130, 235]
+
+
 def test_FileIndex_errors():
     class MyMessage(messages.ComputedKeysMessage):
         computed_keys = {
@@ -241,3 +656,39 @@ def test_FileStream():
     res = messages.FileStream(str(__file__), errors='raise')
     with pytest.raises(bindings.EcCodesError):
         res.first()
+
+
+@pytest.mark.parametrize('source', [None, sources.MmapSource(TEST_DATA_MULTI_FIELD)])
+def test_FileStream_multi_field(source):
+    with open(TEST_DATA_MULTI_FIELD, 'rb') as file:
+        assert messages.Message.from_file(file).is_multi_field()
+    assert not messages.FileStream(TEST_DATA_G2).first().is_multi_field()
+    with open(TEST_DATA_MULTI_FIELD, 'rb') as file:
+        assert messages.Message.from_bytes(file.read()).is_multi_field()
+    expected = [m['values'] for m in messages.FileStream(TEST_DATA_G2)]
+    stream = messages.FileStream(TEST_DATA_MULTI_FIELD, source=source)
+
+    res = list(stream)
+
+    assert [m.message_offset() for m in res] == [(0, 0), (0, 1), (0, 2)]
+    assert [m['level'] for m in res] == [1, 51, 101]
+    assert [m['values'] for m in res] == expected
+
+    index = stream.index(['level'], indexpath='')
+    assert index.offsets == [((1,), [(0, 0)]), ((51,), [(0, 1)]), ((101,), [(0, 2)])]
+    assert index.lengths == {(0, i): os.path.getsize(TEST_DATA_MULTI_FIELD) for i in range(3)}
+    assert index.scanned_size == os.path.getsize(TEST_DATA_MULTI_FIELD)
+    assert [o for o, _ in index.iter_messages()] == [(0, 0), (0, 1), (0, 2)]
+    with stream.message_reader() as message_from_offset:
+        assert message_from_offset((0, 2))['level'] == 101
+
+
+def test_CatalogIndex_multi_field():
+    stream = messages.MultiFileStream([TEST_DATA_G2, TEST_DATA_MULTI_FIELD])
+
+    res = stream.index(['level'], indexpath='')
+
+    assert res.offsets[0] == ((1,), [(0, 0), (1, (0, 0))])
+    assert [o for o, _ in res.iter_messages()][2:4] == [(0, 207600), (1, (0, 0))]
+    with stream.message_reader() as message_from_offset:
+        assert message_from_offset((1, (0, 1)))['level'] == 51
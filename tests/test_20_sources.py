@@ -0,0 +1,439 @@
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import bz2
+import gzip
+import io
+import os.path
+import pickle
+import random
+import struct
+import threading
+
+import numpy as np
+import pytest
+from future.moves.http.server import BaseHTTPRequestHandler, HTTPServer
+
+from cfgrib import dataset
+from cfgrib import messages
+from cfgrib import sources
+
+
+SAMPLE_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'sample-data')
+TEST_DATA = os.path.join(SAMPLE_DATA_FOLDER, 'era5-levels-members.grib')
+TEST_DATA_G2 = os.path.join(SAMPLE_DATA_FOLDER, 'regular_gg_ml_g2.grib')
+TEST_DATA_MULTI_FIELD = os.path.join(SAMPLE_DATA_FOLDER, 'regular_gg_ml_g2_multi_field.grib')
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for an object store serving ``data`` with HTTP range requests."""
+    data = b''
+    ranges = []  # type: list
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.data)))
+        self.end_headers()
+
+    def do_GET(self):
+        start, _, stop = self.headers['Range'].partition('=')[2].partition('-')
+        start, stop = int(start), min(int(stop) + 1, len(self.data))
+        self.ranges.append((start, stop))
+        if start >= len(self.data):
+            self.send_response(416)
+            self.end_headers()
+            return
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, stop - 1, len(self.data)))
+        self.send_header('Content-Length', str(stop - start))
+        self.end_headers()
+        self.wfile.write(self.data[start:stop])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def http_server():
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    handler = type(str('Handler'), (RangeRequestHandler,), {'data': data, 'ranges': []})
+    server = HTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:%d/era5-levels-members.grib' % server.server_port, handler
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_message_length():
+    for path in [TEST_DATA, TEST_DATA_G2]:
+        first = messages.FileStream(path).first()
+        with open(path, 'rb') as file:
+            section0 = file.read(sources.SECTION0_SIZE)
+        assert sources.message_length(section0) == first['totalLength']
+
+    with pytest.raises(ValueError):
+        sources.message_length(b'BUFR' + b'\x00' * 12)
+
+
+def test_message_length_grib1_large():
+    def section(length, payload=b''):
+        return struct.pack('>I', length)[1:] + payload + b'\x00' * (length - 3 - len(payload))
+
+    # NOTE: 100000 units of 120 bytes minus the section 4 length plus 4, as in ecCodes
+    section0 = b'GRIB' + struct.pack('>I', 0x800000 | 100000)[1:] + b'\x01'
+    header = section0 + section(28, b'\x00' * 4 + b'\x80') + section(32) + section(11)
+    read = sources.view_reader(memoryview(header))
+
+    assert sources.message_length(header[:16], read) == 100000 * 120 - 11 + 4
+    assert sources.read_message_length(sources.MemorySource(header), 0) == 100000 * 120 - 7
+
+    # NOTE: with a section 4 of 120 bytes or more the length is not scaled
+    header = section0 + section(28) + section(120)
+    assert sources.message_length(header[:16], sources.view_reader(memoryview(header))) == \
+        0x800000 | 100000
+
+    with pytest.raises(ValueError):
+        sources.message_length(header[:16])
+
+
+def test_split_fields():
+    # NOTE: the multi-field sample has the fields of the G2 sample in one message
+    expected = [sources.read_message(sources.FileSource(TEST_DATA_G2), o) for o, _ in
+                messages.FileStream(TEST_DATA_G2).index([], indexpath='').iter_messages()]
+    with open(TEST_DATA_MULTI_FIELD, 'rb') as file:
+        data = file.read()
+
+    res = sources.split_fields(data)
+
+    assert res == expected
+    assert sources.split_fields(memoryview(expected[1])) == expected[1:2]
+    assert sources.read_field(sources.MemorySource(data), 0, 2) == expected[2]
+
+    with open(TEST_DATA, 'rb') as file:
+        message = sources.read_message(sources.FileObjectSource(file), 0)
+    assert sources.split_fields(message) == [message]
+
+    assert sources.is_multi_field(data)
+    assert not any(sources.is_multi_field(field) for field in expected)
+    assert not sources.is_multi_field(message)
+
+
+def test_split_fields_bitmap():
+    def section(number, payload):
+        return struct.pack('>IB', 5 + len(payload), number) + payload
+
+    bitmap = section(6, b'\x00\xf0')
+    sections = [section(1, b'1'), section(3, b'3'), section(4, b'a'), section(5, b'a'), bitmap,
+                section(7, b'a'), section(4, b'b'), section(5, b'b'), section(6, b'\xfe'),
+                section(7, b'b')]
+    body = b''.join(sections) + b'7777'
+    data = b'GRIB\x00\x00\x00\x02' + struct.pack('>Q', 16 + len(body)) + body
+
+    res = sources.split_fields(data)
+
+    assert sources.is_multi_field(data)
+    assert len(res) == 2
+    assert res[0][16:] == b''.join(sections[:6]) + b'7777'
+    assert res[1][16:] == b''.join(sections[:2] + sections[6:8] + [bitmap, sections[9]]) + b'7777'
+    for field in res:
+        assert sources.message_length(field[:16]) == len(field)
+
+    corrupted = data[:16] + section(9, b'') + data[16:]
+    with pytest.raises(ValueError):
+        sources.split_fields(corrupted[:8] + struct.pack('>Q', len(corrupted)) + corrupted[16:])
+
+
+def test_MemorySource():
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    # NOTE: bytes before the first message are skipped as ecCodes does
+    source = sources.MemorySource(b'junk' + data)
+    assert source.size() == len(data) + 4
+
+    offset = sources.find_message(source, 0)
+    assert offset == 4
+    message = sources.read_message(source, offset)
+    assert message[:4] == b'GRIB' and message[-4:] == b'7777'
+
+    with pytest.raises(EOFError):
+        sources.find_message(source, len(data) - 100)
+    with pytest.raises(EOFError):
+        sources.read_message(sources.MemorySource(data[:100]), 0)
+
+
+def test_ChunksSource():
+    chunks = [b'GRIB', b'', b'0123456789', b'7777']
+    starts = [0, 4, 4, 14]
+    source = sources.ChunksSource(chunks, starts, 3)
+
+    assert source.size() == 14
+    assert source.read(4, 10) is chunks[2]
+    assert source.read(2, 6) == b'IB0123'
+    assert source.read(12, 10) == b'89'
+    assert source.read(14, 10) == b''
+    assert sources.read_ahead(source) is source
+    assert sources.ChunksSource(chunks, starts, 4).read(0, 100) == b''.join(chunks)
+    assert sources.ChunksSource([], [], 0).read(0, 10) == b''
+
+
+def test_ReadAheadSource():
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    reads = []
+
+    class CountingSource(sources.MemorySource):
+        def read(self, offset, length):
+            reads.append((offset, length))
+            return super(CountingSource, self).read(offset, length)
+
+    res = sources.ReadAheadSource(CountingSource(data), block_size=1000)
+    assert res.read(10, 20) == data[10:30]
+    assert res.read(500, 100) == data[500:600]
+    assert res.read(900, 200) == data[900:1100]
+    assert res.read(len(data) - 10, 100) == data[-10:]
+    assert reads == [(10, 1000), (900, 1000), (len(data) - 10, 1000)]
+
+
+@pytest.mark.parametrize('make_source', [
+    lambda data: sources.MemorySource(data),
+    lambda data: sources.FileObjectSource(io.BytesIO(data)),
+    lambda data: sources.FileSource(TEST_DATA),
+    lambda data: sources.MmapSource(TEST_DATA),
+])
+def test_FileStream_source(make_source):
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    expected = messages.FileIndex.from_filestream(messages.FileStream(TEST_DATA), ['paramId'])
+    stream = messages.FileStream('memory.grib', source=make_source(data))
+
+    res = stream.index(['paramId'])
+    assert res.offsets == expected.offsets
+    assert res.lengths == expected.lengths
+    assert res.fingerprint == expected.fingerprint
+    assert res.first()['paramId'] == 129
+
+    # NOTE: index files are not written next to non-local sources
+    assert not os.path.exists('memory.grib.608cf.idx')
+
+
+def test_MmapSource(tmpdir):
+    source = sources.MmapSource(TEST_DATA)
+    with open(TEST_DATA, 'rb') as file:
+        assert source.read(10, 20) == file.read(30)[10:]
+    assert source.size() == len(source.buffer)
+    assert sources.read_ahead(source) is source
+
+    empty = tmpdir.join('empty.grib')
+    empty.ensure()
+    assert sources.MmapSource(str(empty)).buffer == b''
+
+
+def test_FileStream_message_from_buffer():
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    stream = messages.FileStream(TEST_DATA)
+    offsets = stream.index(['paramId'], indexpath='').offsets[0][1]
+
+    for offset in offsets[:3]:
+        res = stream.message_from_buffer(data, offset)
+        assert res.message_offset() == offset
+        assert res['offset'] == 0
+        # NOTE: the handle points into ``data``
+        assert res.buffer.obj is data
+        assert len(res.buffer) == res['totalLength']
+
+    copied = messages.Message.from_bytes(bytearray(res.buffer), copy=True)
+    assert copied.buffer is None
+    assert copied['paramId'] == res['paramId']
+
+    with pytest.raises(EOFError):
+        stream.message_from_buffer(data[:offset + 100], offset)
+    with pytest.raises(ValueError):
+        stream.message_from_buffer(b'junk' * 4, 0)
+
+
+def test_FileStream_source_errors():
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    first_length = messages.FileStream(TEST_DATA).first()['totalLength']
+    corrupted = data[:first_length - 4] + b'XXXX' + data[first_length:]
+
+    stream = messages.FileStream('memory.grib', source=sources.MemorySource(corrupted))
+    assert len(list(stream)) == 159
+
+    stream = messages.FileStream(
+        'memory.grib', errors='raise', source=sources.MemorySource(corrupted),
+    )
+    with pytest.raises(ValueError):
+        list(stream)
+
+
+def write_compressed(path, compression, data, block_size=None):
+    block_size = block_size or len(data)
+    blocks = [data[i:i + block_size] for i in range(0, len(data), block_size)]
+    if compression == 'gzip':
+        for block in blocks:
+            with gzip.open(path, 'ab') as file:
+                file.write(block)
+    elif compression == 'bz2':
+        with bz2.BZ2File(path, 'wb') as file:
+            file.write(data)
+    elif compression == 'xz':
+        lzma = pytest.importorskip('lzma')
+        with lzma.open(path, 'wb') as file:
+            file.write(data)
+    elif compression == 'zstd':
+        zstandard = pytest.importorskip('zstandard')
+        with open(path, 'wb') as file:
+            for block in blocks:
+                file.write(zstandard.ZstdCompressor().compress(block))
+
+
+@pytest.mark.parametrize('compression, block_size, seek_points', [
+    ('gzip', None, 2),
+    ('gzip', 65280, 38),
+    ('bz2', None, 2),
+    ('xz', None, 2),
+    ('zstd', 100000, 25),
+])
+def test_CompressedSource(tmpdir, compression, block_size, seek_points):
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    path = str(tmpdir.join('data.grib.compressed'))
+    write_compressed(path, compression, data, block_size)
+    assert sources.detect_compression(path) == compression
+    assert sources.detect_compression(TEST_DATA) is None
+    assert sources.open_source(TEST_DATA) is None
+
+    res = sources.open_source(path)
+    assert res.compression == compression
+    assert res.raw == sources.FileSource(path)
+    assert res.size() == len(data)
+    assert len(res.seek_points) == seek_points
+    assert res.read(len(data), 10) == b''
+
+    rnd = random.Random(0)
+    for _ in range(20):
+        offset, length = rnd.randrange(len(data)), rnd.randrange(100000)
+        assert res.read(offset, length) == data[offset:offset + length]
+
+    res = pickle.loads(pickle.dumps(res))
+    assert len(res.seek_points) == seek_points
+    assert res.read(2000000, 1000) == data[2000000:2001000]
+
+
+def test_CompressedSource_checkpoints(tmpdir, monkeypatch):
+    monkeypatch.setattr(sources, 'CHECKPOINT_SIZE', 200000)
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    path = str(tmpdir.join('data.grib.gz'))
+    with gzip.open(path, 'wb') as file:
+        file.write(data)
+    with open(path, 'ab') as file:
+        file.write(b'\x00' * 100)
+
+    res = sources.CompressedSource(path)
+    assert res.size() == len(data)
+    assert len(res._checkpoints) == 11
+    assert res.read(len(data) - 10, 20) == data[-10:]
+    assert res.read(10, 20) == data[10:30]
+    assert res._cursor.position == 0
+    assert res.read(2000010, 20) == data[2000010:2000030]
+    assert res._cursor.position > 1500000
+
+
+def test_FileStream_compressed(tmpdir):
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    path = str(tmpdir.join('era5-levels-members.grib.gz'))
+    write_compressed(path, 'gzip', data, 65280)
+    expected = dataset.open_file(TEST_DATA)
+
+    res = dataset.open_file(path)
+    assert isinstance(res.variables['t'].data.stream.source, sources.CompressedSource)
+    assert np.array_equal(
+        res.variables['t'].data[1, 2, :, :, :], expected.variables['t'].data[1, 2, :, :, :],
+    )
+    assert len(tmpdir.listdir(lambda p: p.ext == '.idx')) == 1
+
+    # NOTE: the seek points are read from the index file
+    stream = messages.FileStream(path)
+    assert stream.source.seek_points == [(0, 0)]
+    index = stream.index(['paramId'])
+    assert len(stream.source.seek_points) == 38
+    assert index.tail_checksum is None
+    assert index.file_size == os.path.getsize(path)
+
+
+class PipeReader(object):
+    """Non-seekable binary stream returning short reads, as a pipe or a socket."""
+
+    def __init__(self, data, max_read=1000):
+        self.file = io.BytesIO(data)
+        self.max_read = max_read
+
+    def read(self, size):
+        return self.file.read(min(size, self.max_read))
+
+
+def test_MessageFramer():
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    expected = messages.FileIndex.from_filestream(messages.FileStream(TEST_DATA), ['paramId'])
+
+    framer = sources.MessageFramer(PipeReader(b'junk' + data + b'GRI'), chunk_size=5000)
+    res = []
+    while True:
+        try:
+            offset, message = framer.next_message()
+        except EOFError:
+            break
+        assert message[:4] == b'GRIB' and message[-4:] == b'7777'
+        assert len(framer.buffer) < 5000 + len(message)
+        res.append((offset - 4, len(message)))
+    assert res == sorted(expected.lengths.items())
+
+    framer = sources.MessageFramer(PipeReader(b'GRIB' + b'\x00' * 12 + data))
+    with pytest.raises(ValueError):
+        framer.next_message()
+    assert framer.next_message()[0] == 16
+
+
+def test_StreamReader(caplog):
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    first_length = messages.FileStream(TEST_DATA).first()['totalLength']
+    corrupted = data[:first_length - 4] + b'XXXX' + data[first_length:-100]
+
+    res = list(messages.StreamReader(PipeReader(corrupted)))
+    assert len(res) == 158
+    assert res[0].message_offset() == data.index(b'GRIB', 4)
+    assert 'incomplete message' in caplog.text
+
+    with pytest.raises(ValueError):
+        list(messages.StreamReader(PipeReader(corrupted), errors='raise'))
+
+
+def test_HTTPSource(http_server):
+    url, handler = http_server
+    source = sources.HTTPSource(url)
+    assert source.size() == len(handler.data)
+    assert source.read(10, 20) == handler.data[10:30]
+    assert source.read(len(handler.data), 20) == b''
+
+    res = dataset.open_file(url, source=source, indexpath='')
+    expected = dataset.open_file(TEST_DATA)
+    assert res.encoding['source'] == url
+    assert list(res.variables) == list(expected.variables)
+    # NOTE: the whole file is scanned with a few large range requests thanks to read-ahead
+    assert len(handler.ranges) < 20
+
+    del handler.ranges[:]
+    values = res.variables['t'].data[1, 2, :, :, :]
+    assert np.array_equal(values, expected.variables['t'].data[1, 2, :, :, :])
+    assert len(handler.ranges) == 1
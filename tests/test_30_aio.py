@@ -0,0 +1,109 @@
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os.path
+import sys
+import time
+
+import numpy as np
+import pytest
+
+if sys.version_info < (3, 5):
+    pytest.skip("asyncio API needs Python 3.5", allow_module_level=True)
+
+import asyncio  # noqa: E402
+
+from cfgrib import aio  # noqa: E402
+from cfgrib import dataset  # noqa: E402
+from cfgrib import messages  # noqa: E402
+
+
+SAMPLE_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'sample-data')
+TEST_DATA = os.path.join(SAMPLE_DATA_FOLDER, 'era5-levels-members.grib')
+
+
+@pytest.fixture()
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def test_open_file_async(loop):
+    executor = aio.Executor(max_workers=2)
+    res = loop.run_until_complete(aio.open_file_async(TEST_DATA, executor=executor))
+    expected = dataset.open_file(TEST_DATA)
+
+    assert res.dimensions == expected.dimensions
+
+    data = res.variables['t'].data
+    item = (1, 2, slice(None), slice(None), slice(None))
+    field = loop.run_until_complete(aio.getitem_async(data, item, executor=executor))
+    assert np.array_equal(field, expected.variables['t'].data[item])
+    executor.shutdown()
+
+
+def test_AsyncMessageIterator(loop):
+    iterator = messages.FileStream(TEST_DATA).__aiter__()
+    assert iterator.__aiter__() is iterator
+
+    res = []
+    while True:
+        try:
+            message = loop.run_until_complete(iterator.__anext__())
+        except StopAsyncIteration:
+            break
+        res.append(message['paramId'])
+    assert len(res) == 160
+    assert res[:2] == [129, 129]
+
+
+def test_Executor_cancel(loop):
+    executor = aio.Executor(max_workers=1)
+    calls = []
+
+    def slow(value):
+        time.sleep(0.2)
+        calls.append(value)
+
+    first = executor.run(slow, 1)
+    second = executor.run(slow, 2)
+    second.cancel()
+    loop.run_until_complete(first)
+    loop.run_until_complete(asyncio.sleep(0.3))
+
+    assert second.cancelled()
+    assert calls == [1]
+    executor.shutdown()
+
+
+def test_Executor_errors(loop):
+    executor = aio.Executor(max_workers=1)
+
+    def fail():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        loop.run_until_complete(executor.run(fail))
+    # NOTE: the worker is released after a failure
+    assert loop.run_until_complete(executor.run(int, '1')) == 1
+    executor.shutdown()
+
+
+def test_Executor_backpressure(loop):
+    executor = aio.Executor(max_workers=2)
+    queued = []
+
+    def work():
+        queued.append(executor.executor._work_queue.qsize())
+        time.sleep(0.01)
+
+    loop.run_until_complete(asyncio.gather(*[executor.run(work) for _ in range(16)]))
+
+    # NOTE: a call may be briefly queued while it is handed to a free worker, without the
+    #   bound up to 14 calls would be waiting in the queue of the thread pool
+    assert len(queued) == 16
+    assert max(queued) <= 1
+    executor.shutdown()
@@ -1,7 +1,10 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import collections
 import os.path
+import pickle
+import threading
 
 import pytest
 import numpy as np
@@ -9,9 +12,13 @@ import numpy as np
 from cfgrib import cfmessage
 from cfgrib import messages
 from cfgrib import dataset
+from cfgrib import sources
 
 SAMPLE_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'sample-data')
 TEST_DATA = os.path.join(SAMPLE_DATA_FOLDER, 'era5-levels-members.grib')
+TEST_DATASETS = os.path.join(SAMPLE_DATA_FOLDER, 't_on_different_level_types.grib')
+TEST_DATA_G2 = os.path.join(SAMPLE_DATA_FOLDER, 'regular_gg_ml_g2.grib')
+TEST_DATA_MULTI_FIELD = os.path.join(SAMPLE_DATA_FOLDER, 'regular_gg_ml_g2_multi_field.grib')
 
 
 def test_enforce_unique_attributes():
@@ -99,6 +106,23 @@ def test_Dataset():
         dataset.open_file(TEST_DATA, mode='rw')
 
 
+def test_Dataset_reads_one_message_per_grid(tmpdir, monkeypatch):
+    indexpath = str(tmpdir.join('{short_hash}.idx'))
+    dataset.open_file(TEST_DATA, indexpath=indexpath)
+    calls = []
+    message_from_file = messages.FileStream.message_from_file
+
+    def counting_message_from_file(self, *args, **kwargs):
+        calls.append(args)
+        return message_from_file(self, *args, **kwargs)
+
+    monkeypatch.setattr(messages.FileStream, 'message_from_file', counting_message_from_file)
+    res = dataset.open_file(TEST_DATA, indexpath=indexpath)
+
+    assert set(res.variables) >= {'z', 't'}
+    assert len(calls) == 1
+
+
 def test_Dataset_no_encode():
     res = dataset.open_file(
         TEST_DATA, encode_cf=()
@@ -154,6 +178,108 @@ def test_Dataset_reguler_gg_surface():
     assert np.allclose(res.variables['latitude'].data[:2], [88.57216851, 86.72253095])
 
 
+def test_open_file_hypercubes():
+    res = dataset.open_file_hypercubes(TEST_DATASETS)
+
+    assert len(res) == 2
+    assert res[0].encoding['filter_by_keys'] == {'totalNumber': 0}
+    assert 'isobaricInhPa' in res[0].variables
+    assert 'hybrid' in res[1].variables
+    assert res[0].variables['latitude'] is res[1].variables['latitude']
+
+    res = dataset.open_file_hypercubes(TEST_DATA)
+    assert len(res) == 1
+
+    with pytest.raises(dataset.DatasetBuildError):
+        dataset.open_file(TEST_DATASETS)
+
+
+def test_open_files(tmpdir):
+    paths = {}
+    for message in messages.FileStream(TEST_DATA):
+        path = str(tmpdir.join('%(dataDate)s%(dataTime)04d.grib' % message))
+        with open(path, 'ab') as file:
+            message.write(file)
+        paths[path] = None
+    catalogpath = str(tmpdir.join('catalog.idx'))
+
+    res = dataset.open_files(str(tmpdir.join('*.grib')), catalogpath=catalogpath)
+    expected = dataset.open_file(TEST_DATA)
+
+    assert len(paths) == 4
+    assert res.dimensions == expected.dimensions
+    assert np.array_equal(
+        res.variables['t'].data[:, 1:3, :, :, :], expected.variables['t'].data[:, 1:3, :, :, :],
+    )
+    assert tmpdir.join('catalog.idx').check()
+
+    res = dataset.open_files(sorted(paths), filter_by_keys={'paramId': 130})
+    assert list(res.variables)[0] == 't'
+
+    with pytest.raises(ValueError):
+        dataset.open_files(str(tmpdir.join('*.grib2')))
+
+
+def test_DatasetBuilder():
+    builder = dataset.DatasetBuilder()
+    with pytest.raises(EOFError):
+        builder.build()
+
+    stream = messages.FileStream(TEST_DATA)
+    first = stream.first()
+    for message in stream:
+        if (message['dataDate'], message['dataTime']) == (first['dataDate'], first['dataTime']):
+            builder.add_message(message)
+    res = builder.build()
+    assert res.encoding['source'] == '<stream>'
+    assert res.dimensions['number'] == 10
+    assert 'time' not in res.dimensions
+
+    with open(TEST_DATA, 'rb') as file:
+        builder = dataset.DatasetBuilder()
+        for message in messages.StreamReader(file):
+            builder.add(message.buffer)
+            if len(builder.lengths) == 80:
+                partial = builder.build()
+    res = builder.build()
+    expected = dataset.open_file(TEST_DATA)
+
+    assert res.dimensions == expected.dimensions
+    assert np.array_equal(
+        res.variables['t'].data.build_array(), expected.variables['t'].data.build_array(),
+    )
+    # NOTE: datasets built before are not affected by later messages
+    assert partial.dimensions['time'] == 2
+
+    # NOTE: the index is a snapshot on the messages received, not a copy of them
+    index = builder.index()
+    assert index.filestream.source.chunks is builder.chunks
+    assert index.scanned_size == builder.size == sum(builder.lengths.values())
+
+
+def test_open_stream(monkeypatch):
+    from_bytes = cfmessage.CfMessage.from_bytes.__func__
+    decoded = []
+
+    def counting_from_bytes(cls, data, *args, **kwargs):
+        decoded.append(len(data))
+        return from_bytes(cls, data, *args, **kwargs)
+
+    monkeypatch.setattr(cfmessage.CfMessage, 'from_bytes', classmethod(counting_from_bytes))
+    with open(TEST_DATA, 'rb') as file:
+        res = dataset.open_stream(file, path='stdin')
+    # NOTE: every message is decoded once to frame and index it, then one for the geography
+    assert len(decoded) == 160 + 1
+    monkeypatch.undo()
+    expected = dataset.open_file(TEST_DATA)
+
+    assert res.encoding['source'] == 'stdin'
+    assert list(res.variables) == list(expected.variables)
+    assert np.array_equal(
+        res.variables['z'].data[1, 2, :, :, :], expected.variables['z'].data[1, 2, :, :, :],
+    )
+
+
 def test_OnDiskArray():
     res = dataset.open_file(TEST_DATA).variables['t']
 
@@ -162,3 +288,234 @@ def test_OnDiskArray():
         res.data[2:4:2, [0, 3], 0, 0, 0],
         res.data.build_array()[2:4:2, [0, 3], 0, 0, 0],
     )
+
+
+@pytest.mark.parametrize('item,expected_item', [
+    ((1, slice(None), 0, slice(10, 20), slice(None, None, 7)),
+     (1, slice(None), 0, slice(10, 20), slice(None, None, 7))),
+    ((slice(2, 8, 3), [0, 3], 1, 30, [1, 5]),
+     (slice(2, 8, 3), [[0], [3]], 1, 30, [1, 5])),
+    ((0, 0, 0, [0, 5, 60], [1, 2, 3]), (0, 0, 0, [0, 5, 60], [1, 2, 3])),
+])
+def test_OnDiskArray_geo_selection(item, expected_item):
+    data = dataset.open_file(TEST_DATA, indexpath='').variables['t'].data
+    expected = data.build_array()[expected_item]
+
+    res = data[item]
+
+    assert res.shape == expected.shape
+    assert np.array_equal(res, expected)
+
+
+def test_OnDiskArray_iter_blocks():
+    data = dataset.open_file(TEST_DATA, indexpath='').variables['t'].data
+    item = (slice(None), slice(None), 1, slice(None), slice(0, 10))
+    expected = data[item]
+    field_size = 61 * 10 * 4
+
+    res = list(data.iter_blocks(item))
+
+    assert len(res) == 1
+    assert np.array_equal(res[0][1], expected)
+
+    res = list(data.iter_blocks(item, memory_budget=3 * field_size))
+
+    assert [block_item[:3] for block_item, _ in res[:2]] == [([0], [0, 1, 2], 1), ([0], [3], 1)]
+    assert len(res) == 20
+    assert all(array.nbytes <= 3 * field_size for _, array in res)
+    assert np.array_equal(np.concatenate([a for _, a in res], axis=1).reshape(expected.shape),
+                          expected)
+
+    res = list(data.iter_blocks(item, memory_budget=1))
+
+    assert len(res) == 40
+    assert all(np.array_equal(array, data[block_item]) for block_item, array in res)
+
+    path = os.path.join(SAMPLE_DATA_FOLDER, 'regular_ll_sfc.grib')
+    data = dataset.open_file(path, indexpath='').variables['skt'].data
+    item = (slice(None), slice(0, 10))
+
+    res = list(data.iter_blocks(item, memory_budget=1))
+
+    assert len(res) == 1
+    assert res[0][0] == item
+    assert np.array_equal(res[0][1], data[item])
+
+
+@pytest.mark.parametrize('item', [
+    (slice(None), slice(None), slice(None), slice(None), slice(None)),
+    (slice(None), 1, slice(None), slice(None), slice(0, 10)),
+    ([9, 0, 3], slice(None), 0, 5, slice(None)),
+])
+def test_OnDiskArray_memory_budget(item):
+    expected = dataset.open_file(TEST_DATA, indexpath='').variables['t'].data[item]
+    data = dataset.open_file(TEST_DATA, indexpath='', memory_budget=1).variables['t'].data
+
+    assert len(list(data.block_items(item))) > 1
+    assert np.array_equal(data[item], expected)
+
+
+def test_OnDiskArray_memory_budget_peak():
+    tracemalloc = pytest.importorskip('tracemalloc')
+    item = (slice(None),) * 5
+
+    def extra_memory(memory_budget):
+        data = dataset.open_file(TEST_DATA, indexpath='', memory_budget=memory_budget)
+        tracemalloc.start()
+        try:
+            res = data.variables['t'].data[item]
+            return tracemalloc.get_traced_memory()[1] - res.nbytes, res.nbytes
+        finally:
+            tracemalloc.stop()
+
+    unbounded, nbytes = extra_memory(2 ** 40)
+    res, _ = extra_memory(61 * 120 * 4)
+
+    # NOTE: on top of the result, a block of one field and the decoding of one field at a time
+    #   instead of the missing values mask of the whole result
+    assert unbounded >= nbytes // 4
+    assert res < nbytes // 4
+
+
+@pytest.mark.parametrize('previous_item,item,expected', [
+    (None, ([0], [1]), None),
+    (([0], [1]), ([1], [1]), (0, 1)),
+    (([0, 1], [1]), ([0, 1], [3]), (1, 2)),
+    (([4], [1]), ([3], [1]), (0, -1)),
+    (([0], [1]), ([0], [1]), None),
+    (([0], [1]), ([1], [2]), None),
+    (([0, 1], [1]), ([2, 4], [1]), None),
+])
+def test_sequential_step(previous_item, item, expected):
+    assert dataset.sequential_step(previous_item, item) == expected
+
+
+@pytest.mark.parametrize('decode', [False, True])
+def test_OnDiskArray_prefetch(decode):
+    data = dataset.open_file(TEST_DATA, indexpath='', prefetch_depth=4).variables['t'].data
+    data.prefetcher.decode = decode
+    expected = data.build_array()
+
+    for i in range(4):
+        assert np.array_equal(data[i:i + 1, :, :1, :, :], expected[i:i + 1, :, :1])
+        if data.prefetcher.worker is not None:
+            data.prefetcher.worker.join()
+
+    assert data.prefetcher.step == (0, 1)
+    assert len(data.prefetcher.fields) == 4 * data.prefetch_depth
+    offsets = data.item_offsets(([4], [0, 1, 2, 3], [0]))
+    assert all(offset in data.prefetcher.fields for offset in offsets)
+    assert np.array_equal(data[4:5, :, :1, :, :], expected[4:5, :, :1])
+    assert not any(offset in data.prefetcher.fields for offset in offsets)
+
+    # NOTE: the prefetched fields are dropped as soon as the access pattern changes
+    assert np.array_equal(data[:1, 1:2, :, :, :], expected[:1, 1:2])
+    assert data.prefetcher.step is None
+    assert not data.prefetcher.fields and not data.prefetcher.queue
+
+    res = pickle.loads(pickle.dumps(data))
+    assert res == data
+    assert res._prefetcher is None
+
+
+def test_OnDiskArray_pickle_source(tmpdir):
+    with open(TEST_DATA, 'rb') as file:
+        source = sources.MemorySource(file.read())
+    data = dataset.open_file('mem://era5', source=source, indexpath='').variables['t'].data
+    expected = dataset.open_file(TEST_DATA).variables['t'].data
+
+    res = pickle.loads(pickle.dumps(data))
+
+    assert res.stream.source == source
+    assert np.array_equal(res[:1, :, :1, :, :], expected[:1, :, :1, :, :])
+
+    # NOTE: the source is saved with the data, but not in the index file
+    index = messages.FileIndex.from_filestream(data.stream, ['paramId'])
+    indexpath = str(tmpdir.join('era5.idx'))
+    index.to_indexpath(indexpath)
+    assert messages.FileIndex.from_indexpath(indexpath).filestream.source is None
+    assert index.filestream.source is source
+
+
+def test_OnDiskArray_prefetch_disabled():
+    data = dataset.open_file(TEST_DATA, indexpath='').variables['t'].data
+
+    for i in range(4):
+        data[i:i + 1, :, :1, :, :]
+
+    assert data.prefetcher is None
+
+
+def test_OnDiskArray_prefetch_many_threads():
+    data = dataset.open_file(TEST_DATA, indexpath='', prefetch_depth=4).variables['t'].data
+    data[:1, :, :1, :, :]
+
+    thread = threading.Thread(target=data.__getitem__, args=((1, 0, 0, 0, 0),))
+    thread.start()
+    thread.join()
+    for i in range(2, 5):
+        data[i:i + 1, :, :1, :, :]
+
+    assert data.prefetcher.depth == 0
+    assert data.prefetcher.worker is None
+    assert not data.prefetcher.fields and not data.prefetcher.queue
+
+
+def test_Dataset_field_statistics():
+    ds = dataset.open_file(TEST_DATA, indexpath='', statistics=True)
+    values = ds.variables['t'].data.build_array()
+
+    res = ds.field_statistics('max')
+
+    assert list(res.dimensions) == ['number', 'time', 'isobaricInhPa']
+    assert 'latitude' not in res.variables
+    assert res.variables['t'].dimensions == ('number', 'time', 'isobaricInhPa')
+    assert 'latitude' not in res.variables['t'].attributes['coordinates']
+    assert 'latitude' in ds.variables['t'].attributes['coordinates']
+    assert isinstance(res.variables['t'].data, dataset.StatisticsArray)
+    assert res.variables['t'].data.shape == (10, 4, 2)
+    assert np.allclose(res.variables['t'].data[:, :, :], values.max(axis=(-2, -1)))
+    assert np.allclose(res.variables['t'].data[1, [0, 3], :], values.max(axis=(-2, -1))[1, [0, 3]])
+
+    res = ds.field_statistics('numberOfMissing')
+    assert np.array_equal(res.variables['t'].data.build_array(), np.zeros((10, 4, 2)))
+
+    with pytest.raises(ValueError):
+        ds.field_statistics('median')
+    with pytest.raises(ValueError):
+        dataset.open_file(TEST_DATA, indexpath='').field_statistics('max')
+
+
+def test_open_file_duplicates(tmpdir):
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    grib_file = tmpdir.join('file.grib')
+    grib_file.write_binary(data + data)
+    expected = dataset.open_file(TEST_DATA, indexpath='')
+
+    res = dataset.open_file(str(grib_file), indexpath='')
+    assert len(res.variables['t'].data.offsets[0, 0, 0]) == 2
+
+    res = dataset.open_file(str(grib_file), indexpath='', duplicates='first')
+    assert res.variables['t'].data.offsets == expected.variables['t'].data.offsets
+
+    res = dataset.open_file(str(grib_file), indexpath='', duplicates='last')
+    expected_offset = expected.variables['t'].data.offsets[0, 0, 0][0]
+    assert res.variables['t'].data.offsets[0, 0, 0] == [expected_offset + len(data)]
+    assert np.array_equal(
+        res.variables['t'].data.build_array(), expected.variables['t'].data.build_array(),
+    )
+
+
+def test_open_file_multi_field():
+    expected = dataset.open_file(TEST_DATA_G2, indexpath='')
+
+    res = dataset.open_file(TEST_DATA_MULTI_FIELD, indexpath='')
+
+    assert res.dimensions == expected.dimensions
+    assert res.variables['t'].data.offsets == collections.OrderedDict(
+        [((0,), [(0, 0)]), ((1,), [(0, 1)]), ((2,), [(0, 2)])]
+    )
+    assert np.array_equal(
+        res.variables['t'].data[1:, :, :2], expected.variables['t'].data[1:, :, :2],
+    )
@@ -0,0 +1,142 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import errno
+import io
+import os.path
+import shutil
+
+import pytest
+
+from cfgrib import dataset
+from cfgrib import grib_copy
+from cfgrib import messages
+from cfgrib import sources
+
+SAMPLE_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'sample-data')
+TEST_DATA = os.path.join(SAMPLE_DATA_FOLDER, 'era5-levels-members.grib')
+TEST_DATA_G2 = os.path.join(SAMPLE_DATA_FOLDER, 'regular_gg_ml_g2.grib')
+TEST_DATA_MULTI_FIELD = os.path.join(SAMPLE_DATA_FOLDER, 'regular_gg_ml_g2_multi_field.grib')
+
+
+def read_messages(path, filter_by_keys={}):
+    with open(path, 'rb') as file:
+        data = file.read()
+    index = messages.FileStream(path).index(sorted(filter_by_keys), indexpath='')
+    offsets = [o for o, _ in index.subindex(filter_by_keys).iter_messages()]
+    return b''.join(data[o:o + index.lengths[o]] for o in offsets)
+
+
+def test_parse_filter_by_keys():
+    res = grib_copy.parse_filter_by_keys('shortName=t, level=500,step=1.5,')
+
+    assert res == {'shortName': 't', 'level': 500, 'step': 1.5}
+    assert isinstance(res['level'], int)
+    assert grib_copy.parse_filter_by_keys('') == {}
+
+    with pytest.raises(ValueError):
+        grib_copy.parse_filter_by_keys('shortName')
+
+
+def test_outpath_keys():
+    assert grib_copy.outpath_keys('out.grib') == []
+    assert grib_copy.outpath_keys('{shortName}/{level}_{shortName}.grib') == ['shortName', 'level']
+
+
+def test_message_ranges():
+    index = messages.FileStream(TEST_DATA).index(['shortName'], indexpath='')
+    offsets = sorted(index.lengths)
+
+    res = grib_copy.message_ranges(index, offsets[:3])
+
+    # NOTE: the messages of the sample file are followed by 8 bytes of padding
+    assert res == [(0, 14752), (14760, 14752), (29520, 14752)]
+
+    index.lengths = {offsets[0] + 14752: 8}
+    res = grib_copy.message_ranges(index, [offsets[0], offsets[0] + 14752])
+    assert res == [(0, 14760)]
+
+    index.lengths = None
+    assert grib_copy.message_ranges(index, offsets[2:0:-1]) == [(14760, 14752), (29520, 14752)]
+
+
+@pytest.mark.parametrize('kernel_copy', [True, False])
+def test_copy_messages(tmpdir, monkeypatch, kernel_copy):
+    if not kernel_copy:
+        monkeypatch.setattr(grib_copy, 'KERNEL_COPY_FUNCTIONS', [])
+    index = messages.FileStream(TEST_DATA).index(['shortName', 'level'], indexpath='')
+    outpath = str(tmpdir.join('out.grib'))
+
+    with io.open(outpath, 'wb') as outfile:
+        res = grib_copy.copy_messages(index, outfile, {'shortName': 't'}, chunk_size=1000)
+
+    assert res == 80
+    with open(outpath, 'rb') as file:
+        assert file.read() == read_messages(TEST_DATA, {'shortName': 't'})
+
+    outfile = io.BytesIO()
+    assert grib_copy.copy_messages(index, outfile, shortName='z', level=500) == 40
+    assert outfile.getvalue() == read_messages(TEST_DATA, {'shortName': 'z', 'level': 500})
+
+
+def test_copy_messages_kernel_copy_fallback(tmpdir, monkeypatch):
+    def unsupported(in_fd, out_fd, offset, count):
+        raise OSError(errno.EXDEV, 'unsupported')
+
+    monkeypatch.setattr(grib_copy, 'KERNEL_COPY_FUNCTIONS', [unsupported])
+    index = messages.FileStream(TEST_DATA).index([], indexpath='')
+    outpath = str(tmpdir.join('out.grib'))
+
+    with io.open(outpath, 'wb') as outfile:
+        assert grib_copy.copy_messages(index, outfile) == 160
+
+    with open(outpath, 'rb') as file:
+        assert file.read() == read_messages(TEST_DATA)
+
+
+def test_copy_file(tmpdir):
+    path = str(tmpdir.join('data.grib'))
+    shutil.copyfile(TEST_DATA, path)
+    dataset.open_file(path)
+    outpath = str(tmpdir.join('{shortName}_{level}.grib'))
+
+    res = grib_copy.copy_file(path, outpath, {'number': 0})
+
+    assert list(res.values()) == [4, 4, 4, 4]
+    # NOTE: the index written by open_file is reused
+    assert len(tmpdir.listdir(lambda p: p.ext == '.idx')) == 1
+    for short_name in ['t', 'z']:
+        for level in [500, 850]:
+            filter_by_keys = {'shortName': short_name, 'level': level, 'number': 0}
+            with open(str(tmpdir.join('%s_%d.grib' % (short_name, level))), 'rb') as file:
+                assert file.read() == read_messages(TEST_DATA, filter_by_keys)
+
+    outpath = str(tmpdir.join('all.grib'))
+    assert grib_copy.copy_file(path, outpath) == {outpath: 160}
+
+    with pytest.raises(ValueError):
+        grib_copy.copy_file(outpath, outpath)
+
+
+def test_copy_file_source(tmpdir):
+    with open(TEST_DATA, 'rb') as file:
+        source = sources.MemorySource(file.read())
+    outpath = str(tmpdir.join('out.grib'))
+
+    res = grib_copy.copy_file('memory', outpath, {'shortName': 't'}, source=source)
+
+    assert res == {outpath: 80}
+    with open(outpath, 'rb') as file:
+        assert file.read() == read_messages(TEST_DATA, {'shortName': 't'})
+
+
+def test_copy_file_multi_field(tmpdir):
+    outpath = str(tmpdir.join('out.grib'))
+
+    res = grib_copy.copy_file(TEST_DATA_MULTI_FIELD, outpath, {'level': 51}, indexpath='')
+
+    assert res == {outpath: 1}
+    with open(outpath, 'rb') as file:
+        assert file.read() == read_messages(TEST_DATA_G2, {'level': 51})
+
+    index = messages.FileStream(TEST_DATA_MULTI_FIELD).index([], indexpath='')
+    assert grib_copy.message_ranges(index, [(0, 1), (0, 0)]) == [((0, 0), None), ((0, 1), None)]
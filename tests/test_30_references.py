@@ -0,0 +1,109 @@
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os.path
+
+import numpy as np
+import pytest
+
+from cfgrib import dataset
+from cfgrib import messages
+from cfgrib import references
+
+SAMPLE_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'sample-data')
+TEST_DATA = os.path.join(SAMPLE_DATA_FOLDER, 'era5-levels-members.grib')
+TEST_DATA_GG = os.path.join(SAMPLE_DATA_FOLDER, 'reduced_gg.grib')
+
+
+def assert_datasets_equal(res, expected):
+    assert res.dimensions == expected.dimensions
+    assert res.attributes == expected.attributes
+    assert list(res.variables) == list(expected.variables)
+    for name, var in expected.variables.items():
+        assert res.variables[name].dimensions == var.dimensions
+        assert res.variables[name].attributes == var.attributes
+        if isinstance(var.data, dataset.OnDiskArray):
+            assert res.variables[name].data.shape == var.data.shape
+            assert np.array_equal(
+                res.variables[name].data.build_array(), var.data.build_array(), equal_nan=True,
+            )
+        else:
+            assert np.array_equal(res.variables[name].data, var.data)
+
+
+def test_build_references():
+    ds = dataset.open_file(TEST_DATA)
+    res = references.build_references(ds)
+
+    assert res['version'] == 1
+    refs = res['refs']
+    assert json.loads(refs['.zgroup']) == {'zarr_format': 2}
+    assert json.loads(refs['.zattrs'])['GRIB_edition'] == 1
+    zarray = json.loads(refs['t/.zarray'])
+    assert zarray['shape'] == [10, 4, 2, 61, 120]
+    assert zarray['chunks'] == [1, 1, 1, 61, 120]
+    assert zarray['filters'] == [{'id': 'grib', 'var': 't', 'dtype': 'float32'}]
+    assert json.loads(refs['t/.zattrs'])['_ARRAY_DIMENSIONS'] == list(ds.variables['t'].dimensions)
+    assert len([k for k in refs if k.startswith('t/') and not k.startswith('t/.')]) == 80
+
+    path, offset, length = refs['t/1.2.0.0.0']
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        message = messages.Message.from_file(file)
+    assert message['totalLength'] == length
+    assert message['shortName'] == 't'
+    assert message['number'] == ds.variables['number'].data[1]
+
+    # scalar coordinates are stored inline
+    assert refs['step/0'].startswith('base64:')
+
+    json.dumps(res)
+
+
+def test_open_references(tmpdir):
+    expected = dataset.open_file(TEST_DATA)
+    path = str(tmpdir.join('era5-levels-members.json'))
+    references.write_references(expected, path)
+
+    res = references.open_references(path)
+    assert res.encoding['source'] == path
+    assert_datasets_equal(res, expected)
+
+    res = references.open_references(references.build_references(expected))
+    assert res.variables['z'].data[1, 2:4, 0, :2, :] == pytest.approx(
+        expected.variables['z'].data[1, 2:4, 0, :2, :]
+    )
+
+    with pytest.raises(ValueError):
+        references.open_references({'version': 2, 'refs': {}})
+
+
+def test_build_references_multi_field():
+    path = os.path.join(SAMPLE_DATA_FOLDER, 'regular_gg_ml_g2_multi_field.grib')
+
+    with pytest.raises(ValueError):
+        references.build_references(dataset.open_file(path, indexpath=''))
+
+
+def test_open_references_reduced_gg():
+    expected = dataset.open_file(TEST_DATA_GG)
+    res = references.open_references(references.build_references(expected))
+
+    assert_datasets_equal(res, expected)
+    assert res.variables['u10'].data.geo_ndim == 1
+
+
+def test_open_references_many_files(tmpdir):
+    for message in messages.FileStream(TEST_DATA):
+        path = str(tmpdir.join('%(dataDate)s%(dataTime)04d.grib' % message))
+        with open(path, 'ab') as file:
+            message.write(file)
+    expected = dataset.open_files(str(tmpdir.join('*.grib')))
+    refs = references.build_references(expected)
+    chunks = [v for k, v in refs['refs'].items() if k.startswith('t/') and k[2] != '.']
+    assert len(set(path for path, _, _ in chunks)) == 4
+
+    res = references.open_references(refs)
+    assert isinstance(res.variables['t'].data.stream, messages.MultiFileStream)
+    assert_datasets_equal(res, expected)
@@ -0,0 +1,159 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import gzip
+import io
+import os.path
+import random
+import shutil
+import threading
+
+import numpy as np
+import pytest
+
+from cfgrib import bindings
+from cfgrib import dataset
+from cfgrib import messages
+from cfgrib import sources
+
+
+SAMPLE_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'sample-data')
+TEST_DATA = os.path.join(SAMPLE_DATA_FOLDER, 'era5-levels-members.grib')
+THREADS = 16
+
+
+@pytest.fixture()
+def thread_safe_eccodes():
+    # NOTE: checked when the tests run, not when they are collected, as it loads ecCodes
+    if not bindings.codes_is_thread_safe():
+        pytest.skip(
+            "ecCodes is not known to be thread-safe, set %s=1 if it is" % bindings.THREAD_SAFE_ENV,
+        )
+
+
+requires_thread_safe_eccodes = pytest.mark.usefixtures('thread_safe_eccodes')
+
+
+def run_threads(func, args_list):
+    """Call ``func(*args)`` for every ``args`` on its own thread and return the results."""
+    results = [None] * len(args_list)
+    errors = []
+    start = threading.Event()
+
+    def target(i, args):
+        start.wait()
+        try:
+            results[i] = func(*args)
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=target, args=a) for a in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def random_reads(source, data, count=50, seed=0):
+    randomizer = random.Random(seed)
+    for _ in range(count):
+        offset = randomizer.randrange(len(data))
+        length = randomizer.randrange(1, 300000)
+        assert source.read(offset, length) == data[offset:offset + length]
+    return True
+
+
+def test_codes_is_thread_safe(tmpdir):
+    config = tmpdir.join('include', 'eccodes_config.h')
+    config.ensure()
+
+    assert bindings.read_eccodes_threads(str(config)) == -1
+
+    config.write('#define GRIB_PTHREADS       1\n#define GRIB_OMP_THREADS    0\n')
+    assert bindings.read_eccodes_threads(str(config)) == 1
+
+    config.write('#define GRIB_PTHREADS       0\n#define GRIB_OMP_THREADS    0\n')
+    assert bindings.read_eccodes_threads(str(config)) == 0
+
+    assert bindings.codes_is_thread_safe(environ={bindings.THREAD_SAFE_ENV: '1'})
+    assert not bindings.codes_is_thread_safe(environ={bindings.THREAD_SAFE_ENV: '0'})
+    if bindings.BINDINGS_MODE == 'abi':
+        assert not bindings.codes_is_thread_safe(environ={bindings.ECCODES_DIR_ENV: str(tmpdir)})
+
+
+@pytest.mark.parametrize('make_source', [
+    lambda path: sources.FileObjectSource(io.open(path, 'rb')),
+    lambda path: sources.MmapSource(path),
+    lambda path: sources.ReadAheadSource(sources.FileSource(path), block_size=65536),
+])
+def test_sources_threads(make_source):
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    source = make_source(TEST_DATA)
+
+    res = run_threads(random_reads, [(source, data, 50, i) for i in range(THREADS)])
+
+    assert all(res)
+
+
+def test_CompressedSource_threads(tmpdir):
+    with open(TEST_DATA, 'rb') as file:
+        data = file.read()
+    path = str(tmpdir.join('data.grib.gz'))
+    with gzip.open(path, 'wb') as file:
+        file.write(data)
+    source = sources.CompressedSource(path)
+
+    res = run_threads(random_reads, [(source, data, 5, i) for i in range(THREADS)])
+
+    assert all(res)
+
+
+@requires_thread_safe_eccodes
+def test_OnDiskArray_threads():
+    data = dataset.open_file(TEST_DATA).variables['t'].data
+    items = [(i % 10, j % 4, slice(None), slice(None), slice(None)) for i in range(THREADS)
+             for j in range(2)]
+    expected = [data[item] for item in items]
+
+    res = run_threads(data.__getitem__, [(item,) for item in items])
+
+    for field, expected_field in zip(res, expected):
+        assert np.array_equal(field, expected_field)
+
+
+@requires_thread_safe_eccodes
+@pytest.mark.parametrize('make_source', [None, sources.MmapSource])
+def test_FileIndex_threads(tmpdir, make_source):
+    path = str(tmpdir.join('data.grib'))
+    shutil.copyfile(TEST_DATA, path)
+    source = make_source and make_source(path)
+    expected = messages.FileStream(TEST_DATA).index(['paramId', 'number'], indexpath='')
+
+    def build_index():
+        stream = messages.FileStream(path, source=source)
+        return stream.index(['paramId', 'number'], indexpath='')
+
+    res = run_threads(build_index, [()] * THREADS)
+
+    for index in res:
+        assert index.offsets == expected.offsets
+
+
+@requires_thread_safe_eccodes
+def test_open_file_threads(tmpdir):
+    path = str(tmpdir.join('data.grib'))
+    shutil.copyfile(TEST_DATA, path)
+    expected = dataset.open_file(TEST_DATA, indexpath='').variables['z'].data.build_array()
+
+    def open_and_read():
+        return dataset.open_file(path).variables['z'].data.build_array()
+
+    # NOTE: all threads try to build and write the same index file at the same time
+    res = run_threads(open_and_read, [()] * THREADS)
+
+    for array in res:
+        assert np.array_equal(array, expected)
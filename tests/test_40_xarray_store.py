@@ -1,12 +1,16 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import io
 import os.path
 
 import pytest
 xr = pytest.importorskip('xarray')  # noqa
 
 from cfgrib import bindings
+from cfgrib import dataset
+from cfgrib import messages
+from cfgrib import references
 from cfgrib import xarray_store
 
 
@@ -33,6 +37,9 @@ def test_open_dataset():
     with pytest.raises(ValueError):
         xarray_store.open_dataset(TEST_DATA, engine='netcdf4')
 
+    res = xarray_store.open_dataset(TEST_DATA, backend_kwargs={'memory_budget': 1})
+    assert var.equals(res['t'])
+
     res = xarray_store.open_dataset(TEST_IGNORE, backend_kwargs={'errors': 'warn'})
     assert 'isobaricInhPa' in res.dims
 
@@ -107,3 +114,55 @@ def test_open_datasets():
 
     assert len(res) > 1
     assert res[0].attrs['GRIB_edition'] == 1
+
+
+def test_open_files(tmpdir):
+    for message in messages.FileStream(TEST_DATA):
+        path = str(tmpdir.join('%(dataDate)s%(dataTime)04d.grib' % message))
+        with open(path, 'ab') as file:
+            message.write(file)
+
+    res = xarray_store.open_files(str(tmpdir.join('*.grib')))
+    expected = xarray_store.open_dataset(TEST_DATA)
+
+    assert res.equals(expected)
+
+    with pytest.raises(ValueError):
+        xarray_store.open_files(str(tmpdir.join('*.grib')), engine='netcdf4')
+
+
+def test_open_stream():
+    with open(TEST_DATA, 'rb') as file:
+        res = xarray_store.open_stream(file)
+    expected = xarray_store.open_dataset(TEST_DATA)
+
+    assert res.equals(expected)
+
+    with pytest.raises(ValueError):
+        xarray_store.open_stream(io.BytesIO(), engine='netcdf4')
+
+
+def test_open_references(tmpdir):
+    path = str(tmpdir.join('era5-levels-members.json'))
+    references.write_references(dataset.open_file(TEST_DATA), path)
+
+    res = xarray_store.open_references(path)
+    expected = xarray_store.open_dataset(TEST_DATA)
+
+    assert res.equals(expected)
+    assert res.attrs == expected.attrs
+
+    with pytest.raises(ValueError):
+        xarray_store.open_references(path, engine='netcdf4')
+
+
+def test_open_field_statistics():
+    backend_kwargs = {'indexpath': ''}
+    res = xarray_store.open_field_statistics(TEST_DATA, 'average', backend_kwargs=backend_kwargs)
+    expected = xarray_store.open_dataset(TEST_DATA).mean(['latitude', 'longitude'])
+
+    assert res.t.dims == ('number', 'time', 'isobaricInhPa')
+    assert abs(res.t - expected.t).max() < 1e-3
+
+    with pytest.raises(ValueError):
+        xarray_store.open_field_statistics(TEST_DATA, 'average', engine='netcdf4')
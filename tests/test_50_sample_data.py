@@ -20,6 +20,7 @@ SAMPLE_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'sample-data')
     'regular_gg_pl',
     'regular_gg_ml',
     'regular_gg_ml_g2',
+    'regular_gg_ml_g2_multi_field',
     'regular_ll_sfc',
     'regular_ll_msl',
     'scanning_mode_64',